@@ -0,0 +1,643 @@
+"""
+ASGI-Einstiegspunkt mit asynchronem Upstream-Pfad
+
+Die upstream-gebundenen /api-Routen (TheMealDB, Open Food Facts, OpenAI)
+laufen hier nativ async über geteilte httpx.AsyncClients; ein wartender
+Upstream-Call blockiert damit keinen Worker mehr. Unabhängige Upstream-Calls
+(Batch-Lookups, kombinierte Facetten) werden parallel abgesetzt.
+Alle übrigen Routen (Seiten, statische Dateien, Statistiken, Anlegen und
+Abfragen von KI-Plan-Jobs) gehen unverändert an die Flask-App aus main.py.
+
+Start (siehe gunicorn_asgi.conf.py und README):
+    gunicorn -c gunicorn_asgi.conf.py asgi:app
+    uvicorn asgi:app --workers 4 --loop uvloop --http httptools --limit-concurrency 4096
+"""
+import time
+# Importzeit inkl. main.py (startup.record_import)
+_import_started = time.perf_counter()
+
+import asyncio
+import inspect
+import io
+import os
+import re
+import sys
+from urllib.parse import parse_qsl
+
+import httpx
+import orjson
+
+from barcodes import BARCODE_BATCH_LIMIT, normalize_barcode, read_barcode_request
+from catalog import get_catalog
+from facets import FACET_NAMES, cascade_facets, facet_index, plan_filter
+from foodfacts import bulk_nutrition_result, search_params, search_query
+from jobs import JOBS_POLL_INTERVAL, job_events
+from main import app as flask_app, plan_jobs
+from metrics import (
+    finish_profile, observe_openai, observe_request, server_timing, start_profile, start_request, timing
+)
+from nutrition import estimate_recipe_nutrition
+from offstore import get_off_store
+from planner import (
+    DAYS, FALLBACK_SEARCH_TERM, OPENAI_MAX_TOKENS, OPENAI_MODEL, OPENAI_TEMPERATURE, OPENAI_TIMEOUT,
+    MealIndex, PlanStreamParser, apply_thumbs, attach_meal_refs, build_meal_list, build_messages, build_prompt,
+    candidate_queries, parse_plan_response, plan_cache_key, plan_meta, plan_response, rank_candidates,
+    read_plan_request, replay_plan_events, sse_event
+)
+from plancache import plan_cache
+from resilience import UpstreamUnavailable, aguard, call_timeout, request_deadline, start_deadline, unavailable_body
+from responses import compact_meals, dumps, finish_json, wants_compact
+from solver import finish_streamed_plan, repair_plan, solve_week_plan
+from startup import record_import
+from upstream import afetch_meal_lists, afilter_by_facets, alookup_meals, alookup_products, create_async_clients
+from weekplan import (
+    RECIPE_BATCH_LIMIT, count_plan_meals, nutrition_batch_result, shopping_list_result, split_known_nutrition
+)
+
+
+OPENAI_POOL_SIZE = int(os.getenv('OPENAI_POOL_SIZE', '100'))
+
+
+class Upstreams:
+    """Geteilte Async-Clients: TheMealDB/OFF im Lifespan des Event-Loops, OpenAI beim ersten KI-Plan"""
+    mealdb = None
+    off = None
+    _openai = None
+
+    def openai(self, shortened=False):
+        """
+        AsyncOpenAI-Client (der Import von openai wird so erst beim ersten KI-Plan bezahlt)
+        shortened: ohne eigene Wiederholungen, wenn die Request-Deadline den Timeout schon gekürzt hat
+        """
+        if self._openai is None:
+            from openai import AsyncOpenAI
+            client = AsyncOpenAI(
+                api_key=os.getenv('OPENAI_API_KEY'),
+                timeout=OPENAI_TIMEOUT,
+                http_client=httpx.AsyncClient(
+                    limits=httpx.Limits(max_connections=OPENAI_POOL_SIZE, max_keepalive_connections=20)
+                )
+            )
+            self._openai = (client, client.with_options(max_retries=0))
+        return self._openai[1 if shortened else 0]
+
+    async def aclose(self):
+        await self.mealdb.aclose()
+        await self.off.aclose()
+        if self._openai is not None:
+            await self._openai[0].close()
+
+
+upstreams = Upstreams()
+
+
+# ==========================================
+# ROUTEN (ASYNC)
+# ==========================================
+async def get_categories(data):
+    catalog = get_catalog()
+    if catalog and catalog.get_list('categories'):
+        return catalog.get_list('categories')
+    return await upstreams.mealdb.cached_json('categories.php')
+
+
+async def search_recipes(data):
+    query = data.get('query', '')
+    category = data.get('category', '')
+    catalog = get_catalog()
+
+    if category:
+        if catalog:
+            return catalog.filter(category=category)
+        return await upstreams.mealdb.cached_json('filter.php', params={'c': category})
+    if query:
+        if catalog:
+            return catalog.search(query)
+        return await upstreams.mealdb.cached_json('search.php', params={'s': query})
+    return {'error': 'Query or category required'}, 400
+
+
+async def filter_recipes(data):
+    if not data.get('filter') and not any(data.get(name) for name in FACET_NAMES.values()):
+        return {'error': 'Filter required'}, 400
+
+    # Erstes Laden der Facettenlisten ist synchron -> im Thread
+    if not facet_index.ready:
+        await asyncio.to_thread(facet_index.ensure_loaded)
+    else:
+        facet_index.ensure_loaded()
+
+    facets, filter_value = plan_filter(data)
+    catalog = get_catalog()
+
+    if not filter_value:
+        if not facets:
+            return {'meals': None}
+        if catalog:
+            return catalog.filter(area=facets.get('a'), category=facets.get('c'), ingredient=facets.get('i'))
+        return await afilter_by_facets(upstreams.mealdb, facets)
+
+    # Fallback ohne Facetten-Index: bisherige Kaskade, mit expliziten Facetten geschnitten
+    result = {'meals': None}
+    for query in cascade_facets(facets, filter_value):
+        if catalog:
+            result = catalog.filter(area=query.get('a'), category=query.get('c'), ingredient=query.get('i'))
+        else:
+            result = await afilter_by_facets(upstreams.mealdb, query)
+        if result.get('meals'):
+            return result
+    return result
+
+
+async def get_recipe_detail(data, meal_id):
+    catalog = get_catalog()
+    if catalog:
+        result = catalog.lookup(meal_id)
+    else:
+        result = await upstreams.mealdb.cached_json('lookup.php', params={'i': meal_id})
+    return compact_meals(result) if wants_compact(data) else result
+
+
+async def get_random_recipe(data):
+    result = await upstreams.mealdb.get_json('random.php')
+    return compact_meals(result) if wants_compact(data) else result
+
+
+async def get_nutrition_info(data, barcode):
+    code = normalize_barcode(barcode)
+    found, errors = await alookup_products(upstreams.off, [code]) if code else ({}, {})
+    if isinstance(errors.get(code), UpstreamUnavailable):
+        raise errors[code]
+    if code in errors:
+        return {'success': False, 'error': str(errors[code])}, 500
+    if found.get(code):
+        return {'success': True, 'nutrition': found[code]}
+    return {'success': False, 'error': 'Produkt nicht gefunden'}, 404
+
+
+async def get_nutrition_batch(data):
+    barcodes, invalid = read_barcode_request(data)
+    if not barcodes and not invalid:
+        return {'success': False, 'error': 'Keine Barcodes angegeben'}, 400
+    if len(barcodes) > BARCODE_BATCH_LIMIT:
+        return {'success': False, 'error': f'Maximal {BARCODE_BATCH_LIMIT} Barcodes pro Request'}, 400
+
+    found, errors = await alookup_products(upstreams.off, barcodes)
+    return bulk_nutrition_result(barcodes, invalid, found, errors)
+
+
+async def search_by_nutriscore(data):
+    store = get_off_store()
+    if store:
+        return store.search(**search_query(data))
+    return await upstreams.off.get_json('api/v2/search', params=search_params(data))
+
+
+async def get_recipe_nutrition(data, meal_id):
+    # Wie get_recipe_detail: Upstream-Fehler gehen an _success_error (503 statt 404)
+    catalog = get_catalog()
+    if catalog:
+        meal_data = catalog.lookup(meal_id)
+    else:
+        meal_data = await upstreams.mealdb.cached_json('lookup.php', params={'i': meal_id})
+    if not meal_data.get('meals'):
+        return {'success': False, 'error': 'Rezept nicht gefunden'}, 404
+    return {'success': True, **estimate_recipe_nutrition(meal_data['meals'][0])}
+
+
+async def get_recipe_nutrition_batch(data):
+    week_plan = data.get('weekPlan') or {}
+    meal_ids = data.get('meal_ids') or []
+    if not isinstance(meal_ids, list):
+        return {'success': False, 'error': 'meal_ids muss eine Liste sein'}, 400
+    to_fetch, nutrition_by_id = split_known_nutrition(week_plan, meal_ids)
+    if not to_fetch and not nutrition_by_id:
+        return {'success': False, 'error': 'Keine Rezepte angegeben'}, 400
+    if len(to_fetch) > RECIPE_BATCH_LIMIT:
+        return {'success': False, 'error': f'Maximal {RECIPE_BATCH_LIMIT} Rezepte pro Request'}, 400
+
+    recipes = await alookup_meals(upstreams.mealdb, to_fetch)
+    return nutrition_batch_result(week_plan, to_fetch, nutrition_by_id, recipes)
+
+
+async def build_shopping_list(data):
+    meal_counts = count_plan_meals(data.get('weekPlan', data))
+    if not meal_counts:
+        return {'success': False, 'error': 'Wochenplan ist leer'}, 400
+
+    recipes = await alookup_meals(upstreams.mealdb, meal_counts.keys())
+    return shopping_list_result(meal_counts, recipes)
+
+
+async def fetch_plan_candidates(params):
+    with timing('candidates'):
+        queries = candidate_queries(params['goal'])
+        meal_list = rank_candidates(queries, await afetch_meal_lists(upstreams.mealdb, queries))
+        if not meal_list:
+            result = await upstreams.mealdb.cached_json('search.php', params={'s': FALLBACK_SEARCH_TERM}, timeout=10)
+            meal_list = build_meal_list(result.get('meals', []))
+    return meal_list
+
+
+async def generate_ai_meal_plan(data):
+    params = read_plan_request(data)
+
+    meal_list = await fetch_plan_candidates(params)
+    if not meal_list:
+        return {'success': False, 'error': 'Keine passenden Rezepte gefunden'}, 400
+
+    if params['mode'] == 'solver':
+        with timing('solver'):
+            plan_data = solve_week_plan(meal_list, params)
+        return plan_response(plan_data, params, source='solver')
+
+    async def generate():
+        prompt = build_prompt(meal_list, params['goal'], params['calories'], params['protein'], params['dietary'])
+        timeout, shortened = call_timeout('openai', OPENAI_TIMEOUT)
+        openai_client = upstreams.openai(shortened)
+        async with aguard('openai'):
+            with observe_openai(OPENAI_MODEL) as call:
+                response = await openai_client.chat.completions.create(
+                    model=OPENAI_MODEL,
+                    messages=build_messages(prompt),
+                    temperature=OPENAI_TEMPERATURE,
+                    max_tokens=OPENAI_MAX_TOKENS,
+                    timeout=timeout
+                )
+                call.record_usage(response.usage)
+
+        with timing('enrich'):
+            plan_data = parse_plan_response(response.choices[0].message.content)
+
+            missing_thumbs = attach_meal_refs(plan_data, meal_list)
+            if missing_thumbs:
+                details = await alookup_meals(upstreams.mealdb, [meal_id for _, _, meal_id in missing_thumbs])
+                apply_thumbs(plan_data, missing_thumbs, details)
+
+            if params['mode'] == 'hybrid':
+                plan_data, _ = repair_plan(plan_data, meal_list, params)
+            elif not any(day in plan_data for day in DAYS):
+                raise ValueError('KI-Antwort enthielt keinen gültigen Plan')
+        return plan_data
+
+    try:
+        plan_data = await plan_cache.aget_or_generate(plan_cache_key(params, meal_list), generate)
+        source = params['mode']
+    except Exception as e:
+        print(f"Error in generate_ai_meal_plan (async, OpenAI), nutze lokalen Optimierer: {str(e)}")
+        with timing('solver'):
+            plan_data = solve_week_plan(meal_list, params)
+        source = 'solver'
+    return plan_response(plan_data, params, source=source)
+
+
+async def generate_ai_meal_plan_stream(data):
+    """SSE-Variante: liefert einen Async-Generator statt eines JSON-Payloads"""
+    params = read_plan_request(data)
+
+    async def events():
+        yield sse_event('meta', plan_meta(params))
+        try:
+            meal_list = await fetch_plan_candidates(params)
+            if not meal_list:
+                yield sse_event('error', {'success': False, 'error': 'Keine passenden Rezepte gefunden'})
+                return
+
+            if params['mode'] == 'solver':
+                plan_data = solve_week_plan(meal_list, params)
+                for event in replay_plan_events(plan_data):
+                    yield event
+                yield sse_event('done', plan_response(plan_data, params, source='solver'))
+                return
+
+            cache_key = plan_cache_key(params, meal_list)
+            cached_plan = plan_cache.get(cache_key)
+            if cached_plan is not None:
+                for event in replay_plan_events(cached_plan):
+                    yield event
+                yield sse_event('done', plan_response(cached_plan, params, source=params['mode']))
+                return
+
+            index = MealIndex(meal_list)
+            parser = PlanStreamParser()
+            source = params['mode']
+            failed = False
+            try:
+                prompt = build_prompt(
+                    meal_list, params['goal'], params['calories'], params['protein'], params['dietary']
+                )
+                timeout, shortened = call_timeout('openai', OPENAI_TIMEOUT)
+                openai_client = upstreams.openai(shortened)
+                async with aguard('openai'):
+                    with observe_openai(OPENAI_MODEL) as call:
+                        stream = await openai_client.chat.completions.create(
+                            model=OPENAI_MODEL,
+                            messages=build_messages(prompt),
+                            temperature=OPENAI_TEMPERATURE,
+                            max_tokens=OPENAI_MAX_TOKENS,
+                            stream=True,
+                            stream_options={'include_usage': True},
+                            timeout=timeout
+                        )
+
+                        async for chunk in stream:
+                            call.record_usage(chunk.usage)
+                            if not chunk.choices or not chunk.choices[0].delta.content:
+                                continue
+                            for key, value in parser.feed(chunk.choices[0].delta.content):
+                                if key in DAYS and isinstance(value, dict):
+                                    day_plan = {key: value}
+                                    missing_thumbs = attach_meal_refs(day_plan, index, days=[key])
+                                    if missing_thumbs:
+                                        thumb_ids = [meal_id for _, _, meal_id in missing_thumbs]
+                                        details = await alookup_meals(upstreams.mealdb, thumb_ids)
+                                        apply_thumbs(day_plan, missing_thumbs, details)
+                                    yield sse_event('day', {'day': key, 'meals': value})
+                                elif key == 'reasoning':
+                                    yield sse_event('reasoning', {'reasoning': value})
+
+                if not any(day in parser.result for day in DAYS):
+                    raise ValueError('KI-Antwort enthielt keinen gültigen Plan')
+
+            except Exception as e:
+                print(f"Error in generate_ai_meal_plan_stream (async, OpenAI), nutze lokalen Optimierer: {str(e)}")
+                source = 'hybrid' if any(day in parser.result for day in DAYS) else 'solver'
+                failed = True
+
+            plan_data = parser.result
+            if source != 'llm':
+                plan_data, events = finish_streamed_plan(plan_data, meal_list, params)
+                for event in events:
+                    yield event
+            if not failed:
+                plan_cache.add(cache_key, plan_data)
+            yield sse_event('done', plan_response(plan_data, params, source=source))
+
+        except UpstreamUnavailable as e:
+            yield sse_event('error', unavailable_body(e))
+        except Exception as e:
+            print(f"Error in generate_ai_meal_plan_stream (async): {str(e)}")
+            yield sse_event('error', {'success': False, 'error': f'Fehler beim Generieren: {str(e)}'})
+
+    return events()
+
+
+async def stream_ai_plan_job(data, job_id):
+    """
+    SSE-Updates eines KI-Plan-Jobs (Job-Queue aus main.py)
+    Wartet per asyncio.sleep statt einen Thread zu belegen.
+    """
+    async def events():
+        sent = None
+        while True:
+            job = plan_jobs.get(job_id)
+            job_updates, sent, finished = job_events(job, sent)
+            for event, payload in job_updates:
+                yield sse_event(event, payload)
+            if finished:
+                return
+            await asyncio.sleep(JOBS_POLL_INTERVAL)
+
+    return events()
+
+
+def _plan_error(e):
+    return {'success': False, 'error': f'Fehler beim Generieren: {str(e)}'}
+
+
+def _success_error(e):
+    return {'success': False, 'error': str(e)}
+
+
+def _plain_error(e):
+    return {'error': str(e)}
+
+
+# (Methode, Pfad-Regex, Handler, Fehlerformat wie in main.py)
+ROUTES = [
+    ('GET', r'/api/categories', get_categories, _plain_error),
+    ('POST', r'/api/search', search_recipes, _plain_error),
+    ('POST', r'/api/filter', filter_recipes, _plain_error),
+    ('GET', r'/api/recipe/(?P<meal_id>[^/]+)', get_recipe_detail, _plain_error),
+    ('GET', r'/api/random', get_random_recipe, _plain_error),
+    ('POST', r'/api/nutrition/batch', get_nutrition_batch, _success_error),
+    ('GET', r'/api/nutrition/(?P<barcode>[^/]+)', get_nutrition_info, _success_error),
+    ('POST', r'/api/search-nutrition', search_by_nutriscore, _success_error),
+    ('POST', r'/api/recipe-nutrition/batch', get_recipe_nutrition_batch, _success_error),
+    ('GET', r'/api/recipe-nutrition/(?P<meal_id>[^/]+)', get_recipe_nutrition, _success_error),
+    ('POST', r'/api/shopping-list', build_shopping_list, _success_error),
+    ('POST', r'/api/generate-ai-plan', generate_ai_meal_plan, _plan_error),
+    ('POST', r'/api/generate-ai-plan/stream', generate_ai_meal_plan_stream, _plan_error),
+    ('GET', r'/api/generate-ai-plan/jobs/(?P<job_id>[^/]+)/events', stream_ai_plan_job, _success_error),
+]
+ROUTE_LABELS = {handler: re.sub(r'\(\?P<(\w+)>[^)]*\)', r'<\1>', pattern) for _, pattern, handler, _ in ROUTES}
+ROUTES = [(method, re.compile(pattern + r'/?$'), handler, on_error) for method, pattern, handler, on_error in ROUTES]
+
+
+# ==========================================
+# ASGI-APP
+# ==========================================
+async def _read_body(receive):
+    body = b''
+    while True:
+        message = await receive()
+        body += message.get('body', b'')
+        if not message.get('more_body'):
+            break
+    return body
+
+
+async def _read_json(receive):
+    body = await _read_body(receive)
+    if not body:
+        return {}
+    return orjson.loads(body)
+
+
+def _request_header(scope, name):
+    for key, value in scope.get('headers', []):
+        if key == name:
+            return value.decode('latin1')
+    return ''
+
+
+async def _send_json(send, payload, status=200, headers=(), scope=None, route=None):
+    body = dumps(payload)
+    if scope is not None:
+        # Cache-Control, ETag/304 und gzip wie in main.py (after_request)
+        status, body, extra = finish_json(
+            body, status, route, scope['method'],
+            _request_header(scope, b'if-none-match'), _request_header(scope, b'accept-encoding')
+        )
+        headers = [*headers, *((name.lower().encode('latin1'), value.encode('latin1')) for name, value in extra)]
+    await send({
+        'type': 'http.response.start',
+        'status': status,
+        'headers': [
+            (b'content-type', b'application/json; charset=utf-8'),
+            (b'content-length', str(len(body)).encode()),
+            *headers,
+        ],
+    })
+    await send({'type': 'http.response.body', 'body': body})
+
+
+async def _send_stream(send, events):
+    await send({
+        'type': 'http.response.start',
+        'status': 200,
+        'headers': [
+            (b'content-type', b'text/event-stream; charset=utf-8'),
+            (b'cache-control', b'no-cache'),
+            (b'x-accel-buffering', b'no'),
+        ],
+    })
+    async for event in events:
+        await send({'type': 'http.response.body', 'body': event.encode('utf-8'), 'more_body': True})
+    await send({'type': 'http.response.body', 'body': b''})
+
+
+async def _lifespan(receive, send):
+    while True:
+        message = await receive()
+        if message['type'] == 'lifespan.startup':
+            upstreams.mealdb, upstreams.off = create_async_clients()
+            await send({'type': 'lifespan.startup.complete'})
+        elif message['type'] == 'lifespan.shutdown':
+            await upstreams.aclose()
+            await send({'type': 'lifespan.shutdown.complete'})
+            return
+
+
+def route_label(handler):
+    """Route wie in Flask (z.B. /api/recipe/<meal_id>) als Metrik-Label"""
+    return ROUTE_LABELS.get(handler, handler.__name__)
+
+
+def _match(method, path):
+    for route_method, pattern, handler, on_error in ROUTES:
+        if route_method != method:
+            continue
+        match = pattern.match(path)
+        if match:
+            return handler, on_error, match.groupdict()
+    return None
+
+
+def _wsgi_environ(scope, body):
+    environ = {
+        'REQUEST_METHOD': scope['method'],
+        'SCRIPT_NAME': scope.get('root_path', '').encode('utf-8').decode('latin1'),
+        'PATH_INFO': scope['path'].encode('utf-8').decode('latin1'),
+        'QUERY_STRING': scope.get('query_string', b'').decode('latin1'),
+        'SERVER_PROTOCOL': f"HTTP/{scope.get('http_version', '1.1')}",
+        'SERVER_NAME': (scope.get('server') or ('localhost', 80))[0],
+        'SERVER_PORT': str((scope.get('server') or ('localhost', 80))[1]),
+        'REMOTE_ADDR': (scope.get('client') or ('', 0))[0],
+        'wsgi.version': (1, 0),
+        'wsgi.url_scheme': scope.get('scheme', 'http'),
+        'wsgi.input': io.BytesIO(body),
+        'wsgi.errors': sys.stderr,
+        'wsgi.multithread': True,
+        'wsgi.multiprocess': True,
+        'wsgi.run_once': False,
+    }
+    for name, value in scope.get('headers', []):
+        name = name.decode('latin1').upper().replace('-', '_')
+        key = name if name in ('CONTENT_TYPE', 'CONTENT_LENGTH') else f'HTTP_{name}'
+        value = value.decode('latin1')
+        environ[key] = f'{environ[key]},{value}' if key in environ else value
+    return environ
+
+
+def _call_flask(environ):
+    """Führt die Flask-App im Worker-Thread aus und liefert (Status, Header, Body)"""
+    response = {}
+
+    def start_response(status, headers, exc_info=None):
+        response['status'] = int(status.split(' ', 1)[0])
+        response['headers'] = headers
+
+    result = flask_app(environ, start_response)
+    try:
+        body = b''.join(result)
+    finally:
+        if hasattr(result, 'close'):
+            result.close()
+    return response['status'], response['headers'], body
+
+
+async def flask_asgi(scope, receive, send):
+    """
+    Flask-Routen (Seiten, statische Dateien, Statistiken) im Thread-Pool
+    Die Antwort wird gepuffert und aus dem Event-Loop gesendet; asgirefs
+    WsgiToAsgi sendet aus dem Worker-Thread und bleibt mit uvloop + httptools
+    beim zweiten Request auf einer Keep-Alive-Verbindung hängen.
+    """
+    if scope['type'] != 'http':
+        return
+    environ = _wsgi_environ(scope, await _read_body(receive))
+    status, headers, body = await asyncio.to_thread(_call_flask, environ)
+    await send({
+        'type': 'http.response.start',
+        'status': status,
+        'headers': [(name.lower().encode('latin1'), value.encode('latin1')) for name, value in headers],
+    })
+    await send({'type': 'http.response.body', 'body': body})
+
+
+async def app(scope, receive, send):
+    if scope['type'] == 'lifespan':
+        return await _lifespan(receive, send)
+
+    route = _match(scope.get('method'), scope.get('path', '')) if scope['type'] == 'http' else None
+    if route is None or upstreams.mealdb is None:
+        # Seiten, statische Dateien usw. (und Server ohne Lifespan-Support)
+        return await flask_asgi(scope, receive, send)
+
+    handler, on_error, path_params = route
+    started = time.perf_counter()
+    start_request()
+    start_deadline(request_deadline(scope['path']))
+    # Profiliert den Event-Loop-Thread für die Dauer des Requests: gleichzeitig
+    # laufende Coroutinen landen mit im Profil, Arbeit in asyncio.to_thread nicht
+    profiler = start_profile()
+    status = 500
+
+    async def send_with_timing(message):
+        # Server-Timing mit den bis zum Senden der Header gesammelten Phasen
+        nonlocal status
+        if message['type'] == 'http.response.start':
+            status = message['status']
+            timing_header = server_timing(time.perf_counter() - started).encode()
+            message = {**message, 'headers': [*message.get('headers', []), (b'server-timing', timing_header)]}
+        await send(message)
+
+    try:
+        try:
+            if scope['method'] == 'POST':
+                data = await _read_json(receive)
+            else:
+                data = dict(parse_qsl(scope.get('query_string', b'').decode('latin1')))
+            result = await handler(data or {}, **path_params)
+        except UpstreamUnavailable as e:
+            # Breaker offen, Bulkhead voll oder Deadline abgelaufen -> schnelles 503
+            retry_after = (b'retry-after', str(e.retry_after).encode())
+            return await _send_json(send_with_timing, unavailable_body(e), 503, [retry_after])
+        except Exception as e:
+            print(f"Error in {handler.__name__} (async): {str(e)}")
+            return await _send_json(send_with_timing, on_error(e), 500)
+
+        if inspect.isasyncgen(result):
+            return await _send_stream(send_with_timing, result)
+        label = route_label(handler)
+        if isinstance(result, tuple):
+            return await _send_json(send_with_timing, result[0], result[1], scope=scope, route=label)
+        return await _send_json(send_with_timing, result, scope=scope, route=label)
+    finally:
+        seconds = time.perf_counter() - started
+        observe_request(route_label(handler), scope['method'], status, seconds)
+        finish_profile(profiler, route_label(handler), seconds)
+
+
+record_import('asgi', time.perf_counter() - _import_started)
@@ -0,0 +1,17 @@
+"""
+uvicorn-Worker für gunicorn mit den Einstellungen für den ASGI-Pfad
+(siehe gunicorn_asgi.conf.py)
+"""
+import os
+
+from uvicorn.workers import UvicornWorker
+
+
+class MealPrepUvicornWorker(UvicornWorker):
+    # uvloop + httptools, Obergrenze gleichzeitiger Requests pro Worker
+    CONFIG_KWARGS = {
+        'loop': 'uvloop',
+        'http': 'httptools',
+        'lifespan': 'on',
+        'limit_concurrency': int(os.getenv('LIMIT_CONCURRENCY', '4096')),
+    }
@@ -0,0 +1,207 @@
+"""
+Persistenter Cache für Open-Food-Facts-Produkte (Barcode-Lookups)
+
+Speichert pro Barcode nur die projizierten Nährwerte (siehe
+foodfacts.project_nutrition), nicht das komplette OFF-Produktdokument.
+Unbekannte Barcodes werden mit kürzerer TTL negativ gecacht, damit sie nicht
+bei jedem Scan erneut bei OFF nachgefragt werden. Die SQLite-Datei ist
+zwischen allen Workern geteilt und übersteht Neustarts. Ist OFF nicht
+erreichbar, dienen abgelaufene Einträge noch bis BARCODE_STALE_IF_ERROR.
+"""
+import json
+import os
+import re
+import sqlite3
+import threading
+import time
+
+from sqlitedb import ThreadLocalConnection
+
+
+# ==========================================
+# KONFIGURATION
+# ==========================================
+BARCODE_CACHE_PATH = os.getenv('BARCODE_CACHE_PATH', 'barcode_cache.db')
+BARCODE_CACHE_TTL = float(os.getenv('BARCODE_CACHE_TTL', str(7 * 24 * 3600)))
+BARCODE_NEGATIVE_TTL = float(os.getenv('BARCODE_NEGATIVE_TTL', str(24 * 3600)))
+BARCODE_STALE_IF_ERROR = float(os.getenv('BARCODE_STALE_IF_ERROR', str(30 * 24 * 3600)))
+BARCODE_CACHE_MAX_ROWS = int(os.getenv('BARCODE_CACHE_MAX_ROWS', '100000'))
+# Max. Barcodes pro Bulk-Request
+BARCODE_BATCH_LIMIT = int(os.getenv('BARCODE_BATCH_LIMIT', '100'))
+
+# OFF kennt neben EAN/UPC auch kurze interne Codes
+BARCODE_PATTERN = re.compile(r'^\d{1,24}$')
+
+
+def normalize_barcode(barcode):
+    """Barcode ohne Leerzeichen/Bindestriche, None wenn ungültig"""
+    code = re.sub(r'[\s-]+', '', str(barcode or ''))
+    return code if BARCODE_PATTERN.match(code) else None
+
+
+def read_barcode_request(data):
+    """
+    Barcodes aus {"barcodes": [...]} (Liste oder kommagetrennter String)
+    Liefert (gültige Barcodes ohne Duplikate, ungültige Eingaben).
+    """
+    raw = data.get('barcodes') or []
+    if isinstance(raw, str):
+        raw = raw.split(',')
+    barcodes, invalid = [], []
+    for value in raw:
+        code = normalize_barcode(value)
+        if code is None:
+            invalid.append(str(value))
+        elif code not in barcodes:
+            barcodes.append(code)
+    return barcodes, invalid
+
+
+class BarcodeCache:
+    """SQLite-Cache: Barcode -> projizierte Nährwerte oder 'nicht gefunden'"""
+
+    def __init__(self, path, ttl=BARCODE_CACHE_TTL, negative_ttl=BARCODE_NEGATIVE_TTL,
+                 max_rows=BARCODE_CACHE_MAX_ROWS, stale_if_error=BARCODE_STALE_IF_ERROR):
+        self.path = path
+        self.ttl = ttl
+        self.negative_ttl = negative_ttl
+        self.stale_if_error = stale_if_error
+        self.max_rows = max_rows
+        self._db = ThreadLocalConnection(path)
+        self._conn = self._db.get
+        self._writes = 0
+
+        self.stats = {
+            'hits': 0,
+            'negative_hits': 0,
+            'misses': 0,
+            'stale_hits': 0,
+            'stored': 0,
+            'stored_negative': 0,
+        }
+
+        conn = self._conn()
+        conn.execute(
+            'CREATE TABLE IF NOT EXISTS products ('
+            ' barcode TEXT PRIMARY KEY,'
+            ' nutrition TEXT,'          # NULL = bei OFF nicht gefunden
+            ' expires_at REAL NOT NULL,'
+            ' stored_at REAL NOT NULL)'
+        )
+        conn.execute('CREATE INDEX IF NOT EXISTS idx_products_stored ON products (stored_at)')
+        conn.commit()
+
+    def get_many(self, barcodes, stale=False):
+        """
+        Gültige Einträge für mehrere Barcodes in einer Abfrage
+        Liefert {barcode: nutrition oder None (= nicht gefunden)}; fehlende oder
+        abgelaufene Barcodes sind nicht enthalten. stale=True liefert auch
+        abgelaufene Einträge (Notfall, wenn OFF nicht erreichbar ist).
+        """
+        barcodes = list(dict.fromkeys(barcodes))
+        if not barcodes:
+            return {}
+
+        found = {}
+        now = time.time() - (self.stale_if_error if stale else 0)
+        # SQLite erlaubt nur begrenzt viele Parameter pro Abfrage
+        for start in range(0, len(barcodes), 500):
+            chunk = barcodes[start:start + 500]
+            rows = self._conn().execute(
+                f"SELECT barcode, nutrition FROM products "
+                f"WHERE barcode IN ({','.join('?' * len(chunk))}) AND expires_at > ?",
+                (*chunk, now)
+            ).fetchall()
+            for barcode, nutrition in rows:
+                found[barcode] = json.loads(nutrition) if nutrition is not None else None
+
+        if stale:
+            self.stats['stale_hits'] += len(found)
+            return found
+
+        negative = sum(1 for value in found.values() if value is None)
+        self.stats['hits'] += len(found) - negative
+        self.stats['negative_hits'] += negative
+        self.stats['misses'] += len(barcodes) - len(found)
+        return found
+
+    def set_many(self, results):
+        """Speichert {barcode: nutrition oder None}; None wird negativ gecacht"""
+        if not results:
+            return
+
+        now = time.time()
+        rows = [
+            (
+                barcode,
+                json.dumps(nutrition) if nutrition is not None else None,
+                now + (self.ttl if nutrition is not None else self.negative_ttl),
+                now,
+            )
+            for barcode, nutrition in results.items()
+        ]
+        conn = self._conn()
+        conn.executemany(
+            'INSERT OR REPLACE INTO products (barcode, nutrition, expires_at, stored_at) VALUES (?, ?, ?, ?)',
+            rows
+        )
+        conn.commit()
+
+        negative = sum(1 for nutrition in results.values() if nutrition is None)
+        self.stats['stored'] += len(rows) - negative
+        self.stats['stored_negative'] += negative
+
+        # Gelegentlich aufräumen statt bei jedem Schreibzugriff
+        self._writes += len(rows)
+        if self._writes >= 100:
+            self._writes = 0
+            self.prune()
+
+    def set(self, barcode, nutrition):
+        self.set_many({barcode: nutrition})
+
+    def prune(self):
+        conn = self._conn()
+        conn.execute('DELETE FROM products WHERE expires_at < ?', (time.time() - self.stale_if_error,))
+        conn.execute(
+            'DELETE FROM products WHERE barcode IN ('
+            ' SELECT barcode FROM products ORDER BY stored_at DESC LIMIT -1 OFFSET ?)',
+            (self.max_rows,)
+        )
+        conn.commit()
+
+    def get_stats(self):
+        try:
+            rows, negative = self._conn().execute(
+                'SELECT COUNT(*), COUNT(*) - COUNT(nutrition) FROM products'
+            ).fetchone()
+        except sqlite3.Error as e:
+            print(f"Error in barcode cache stats: {str(e)}")
+            rows = negative = None
+        return {
+            **self.stats,
+            'rows': rows,
+            'negative_rows': negative,
+            'max_rows': self.max_rows,
+            'ttl': self.ttl,
+            'negative_ttl': self.negative_ttl,
+            'stale_if_error': self.stale_if_error,
+        }
+
+
+_barcode_cache = None
+_barcode_cache_lock = threading.Lock()
+
+
+def get_barcode_cache():
+    """Cache-Singleton (None, wenn BARCODE_CACHE_PATH leer ist oder die Datei nicht geöffnet werden kann)"""
+    global _barcode_cache
+    if _barcode_cache is None:
+        with _barcode_cache_lock:
+            if _barcode_cache is None:
+                try:
+                    _barcode_cache = BarcodeCache(BARCODE_CACHE_PATH) if BARCODE_CACHE_PATH else False
+                except sqlite3.Error as e:
+                    print(f"Error in barcode cache open: {str(e)}")
+                    _barcode_cache = False
+    return _barcode_cache or None
@@ -0,0 +1,9 @@
+"""
+Benchmark-Suite für MealPrepHub
+
+Lokale Stand-ins für TheMealDB, Open Food Facts und OpenAI (bench.fakes)
+und ein Lasttreiber für alle /api-Routen und Seitenabläufe (bench.run):
+
+    python -m bench.run --server wsgi --concurrency 8 --duration 10
+    python -m bench.fakes --openai 800:200:0     # nur die Fake-Server starten
+"""
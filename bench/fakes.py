@@ -0,0 +1,285 @@
+"""
+Fake-Server für TheMealDB, Open Food Facts und OpenAI
+
+Jeder Dienst läuft als eigener ThreadingHTTPServer auf einem eigenen Port,
+mit einstellbarer Latenz, Jitter und Fehlerquote (HTTP 503):
+
+    python -m bench.fakes --mealdb 40:15:0.01 --off 80:30:0 --openai 1500:300:0
+
+Latenz und Jitter in Millisekunden, Fehlerquote als Anteil (0.01 = 1%).
+Die Umgebungsvariablen für die App (THEMEALDB_BASE_URL, OFF_BASE_URL,
+OPENAI_BASE_URL, ...) werden beim Start ausgegeben.
+"""
+import argparse
+import json
+import random
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qs, urlparse
+
+from bench.payloads import Catalog, completion, plan_content, stream_chunks
+
+
+# ==========================================
+# KONFIGURATION
+# ==========================================
+DEFAULT_PROFILES = {
+    'mealdb': '40:15:0',
+    'off': '80:30:0',
+    'openai': '1500:300:0',
+}
+# Pause zwischen Stream-Chunks (Anteil der Gesamtlatenz)
+STREAM_SPREAD = 0.5
+
+
+class Profile:
+    """Latenz (ms), Jitter (ms) und Fehlerquote eines Fake-Dienstes"""
+
+    def __init__(self, latency=0.0, jitter=0.0, error_rate=0.0):
+        self.latency = latency
+        self.jitter = jitter
+        self.error_rate = error_rate
+
+    @classmethod
+    def parse(cls, spec):
+        """'40:15:0.01' -> Profile(40, 15, 0.01); fehlende Teile sind 0"""
+        parts = [float(part) for part in str(spec).split(':') if part != ''] + [0.0, 0.0, 0.0]
+        return cls(*parts[:3])
+
+    def delay(self, rng):
+        return max(0.0, rng.gauss(self.latency, self.jitter) if self.jitter else self.latency) / 1000
+
+    def __str__(self):
+        return f'{self.latency:g}±{self.jitter:g}ms, {self.error_rate:.1%} Fehler'
+
+
+class FakeServer(ThreadingHTTPServer):
+    daemon_threads = True
+    # Lasttests öffnen viele Verbindungen gleichzeitig
+    request_queue_size = 1024
+
+    def __init__(self, name, handler, profile, catalog, port=0):
+        super().__init__(('127.0.0.1', port), handler)
+        self.name = name
+        self.profile = profile
+        self.catalog = catalog
+        self.requests = 0
+        self.errors = 0
+        self._lock = threading.Lock()
+
+    def handle_error(self, request, client_address):
+        # Client hat nach einem Timeout aufgelegt: für Lasttests normal, kein Traceback
+        pass
+
+    @property
+    def url(self):
+        return f'http://127.0.0.1:{self.server_address[1]}'
+
+    def count(self, error):
+        with self._lock:
+            self.requests += 1
+            self.errors += int(error)
+
+
+class _Handler(BaseHTTPRequestHandler):
+    protocol_version = 'HTTP/1.1'
+
+    def log_message(self, format, *args):
+        pass
+
+    def _rng(self):
+        rng = getattr(self, '_random', None)
+        if rng is None:
+            rng = self._random = random.Random()
+        return rng
+
+    def _simulate(self):
+        """Wartet die Latenz ab; True, wenn ein Fehler simuliert werden soll"""
+        rng = self._rng()
+        profile = self.server.profile
+        error = rng.random() < profile.error_rate
+        time.sleep(profile.delay(rng))
+        self.server.count(error)
+        if error:
+            self._send_json(503, {'error': 'simulated upstream error'})
+        return error
+
+    def _send_json(self, status, payload):
+        body = json.dumps(payload).encode('utf-8')
+        self.send_response(status)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def _read_json(self):
+        length = int(self.headers.get('Content-Length') or 0)
+        return json.loads(self.rfile.read(length) or b'{}')
+
+    def _query(self):
+        url = urlparse(self.path)
+        return url.path, {key: values[0] for key, values in parse_qs(url.query).items()}
+
+
+class MealDBHandler(_Handler):
+    """/api/json/v1/1/<endpoint>.php"""
+
+    def do_GET(self):
+        path, query = self._query()
+        if self._simulate():
+            return
+        result = self.server.catalog.mealdb(path.rsplit('/', 1)[-1], query, self._rng())
+        if result is None:
+            self._send_json(404, {'error': 'not found'})
+        else:
+            self._send_json(200, result)
+
+
+class OFFHandler(_Handler):
+    """/api/v2/product/<code> und /api/v2/search"""
+
+    def do_GET(self):
+        path, query = self._query()
+        if self._simulate():
+            return
+        catalog = self.server.catalog
+        if path.startswith('/api/v2/product/'):
+            status, result = catalog.off_product(path.rsplit('/', 1)[-1], query.get('fields'))
+            self._send_json(status, result)
+        elif path.startswith('/api/v2/search'):
+            self._send_json(200, catalog.off_search(query))
+        else:
+            self._send_json(404, {'error': 'not found'})
+
+
+class OpenAIHandler(_Handler):
+    """/v1/chat/completions (mit und ohne stream=True)"""
+
+    def do_POST(self):
+        path, _ = self._query()
+        body = self._read_json()
+        if not path.endswith('/chat/completions'):
+            self._send_json(404, {'error': {'message': 'not found'}})
+            return
+
+        rng = self._rng()
+        profile = self.server.profile
+        prompt = '\n'.join(message.get('content') or '' for message in body.get('messages', []))
+        model = body.get('model', 'gpt-4o-mini')
+        content = plan_content(prompt, rng)
+
+        if not body.get('stream'):
+            if self._simulate():
+                return
+            self._send_json(200, completion(model, prompt, content))
+            return
+
+        # Stream: erstes Token nach der halben Latenz, der Rest verteilt
+        error = rng.random() < profile.error_rate
+        delay = profile.delay(rng)
+        time.sleep(delay * (1 - STREAM_SPREAD))
+        self.server.count(error)
+        if error:
+            self._send_json(503, {'error': {'message': 'simulated upstream error'}})
+            return
+
+        include_usage = bool((body.get('stream_options') or {}).get('include_usage'))
+        chunks = list(stream_chunks(model, prompt, content, include_usage))
+        pause = delay * STREAM_SPREAD / max(1, len(chunks))
+
+        self.send_response(200)
+        self.send_header('Content-Type', 'text/event-stream')
+        self.send_header('Cache-Control', 'no-cache')
+        self.send_header('Connection', 'close')
+        self.end_headers()
+        self.close_connection = True
+        try:
+            for chunk in chunks:
+                self.wfile.write(b'data: ' + json.dumps(chunk).encode('utf-8') + b'\n\n')
+                self.wfile.flush()
+                time.sleep(pause)
+            self.wfile.write(b'data: [DONE]\n\n')
+            self.wfile.flush()
+        except (BrokenPipeError, ConnectionResetError):
+            pass
+
+
+HANDLERS = {
+    'mealdb': MealDBHandler,
+    'off': OFFHandler,
+    'openai': OpenAIHandler,
+}
+
+
+class Fakes:
+    """Startet alle drei Fake-Dienste in Hintergrund-Threads"""
+
+    def __init__(self, profiles=None, catalog=None, ports=None):
+        profiles = {**DEFAULT_PROFILES, **(profiles or {})}
+        ports = ports or {}
+        self.catalog = catalog or Catalog()
+        self.servers = {
+            name: FakeServer(name, handler, Profile.parse(profiles[name]), self.catalog, ports.get(name, 0))
+            for name, handler in HANDLERS.items()
+        }
+        self._threads = []
+
+    def start(self):
+        for server in self.servers.values():
+            thread = threading.Thread(target=server.serve_forever, name=f'fake-{server.name}', daemon=True)
+            thread.start()
+            self._threads.append(thread)
+        return self
+
+    def stop(self):
+        for server in self.servers.values():
+            server.shutdown()
+            server.server_close()
+
+    def env(self):
+        """Umgebungsvariablen, mit denen die App die Fakes statt der echten APIs nutzt"""
+        return {
+            'THEMEALDB_BASE_URL': f"{self.servers['mealdb'].url}/api/json/v1/1",
+            'OFF_BASE_URL': self.servers['off'].url,
+            'OPENAI_BASE_URL': f"{self.servers['openai'].url}/v1",
+            'OPENAI_API_KEY': 'bench',
+        }
+
+    def stats(self):
+        return {
+            name: {'requests': server.requests, 'errors': server.errors, 'profile': str(server.profile)}
+            for name, server in self.servers.items()
+        }
+
+
+def add_profile_arguments(parser):
+    for name, default in DEFAULT_PROFILES.items():
+        parser.add_argument(f'--{name}', default=default, metavar='MS:JITTER:ERR',
+                            help=f'Latenz, Jitter und Fehlerquote für {name} (Standard: {default})')
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Fake-Server für TheMealDB, Open Food Facts und OpenAI')
+    add_profile_arguments(parser)
+    parser.add_argument('--port', type=int, default=0,
+                        help='Erster Port (mealdb, off, openai folgen aufeinander); 0 = frei wählen')
+    args = parser.parse_args()
+
+    ports = {name: args.port + i for i, name in enumerate(HANDLERS)} if args.port else None
+    fakes = Fakes({name: getattr(args, name) for name in HANDLERS}, ports=ports).start()
+    for name, server in fakes.servers.items():
+        print(f'{name:7} {server.url}  ({server.profile})')
+    print()
+    for key, value in fakes.env().items():
+        print(f'export {key}={value}')
+
+    try:
+        while True:
+            time.sleep(3600)
+    except KeyboardInterrupt:
+        fakes.stop()
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,286 @@
+"""
+Realistische Antworten für die Fake-Server
+
+Ein deterministisch erzeugter Katalog im Format von TheMealDB (volle
+Rezeptdokumente mit 20 Zutatenfeldern und langer Anleitung), Open-Food-Facts-
+Produkte in Originalgröße (mehrere KB pro Dokument) und Chat-Completions, die
+nur Rezepte aus dem Prompt verwenden.
+"""
+import json
+import random
+import re
+import string
+
+
+CATEGORIES = [
+    'Beef', 'Breakfast', 'Chicken', 'Dessert', 'Goat', 'Lamb', 'Miscellaneous',
+    'Pasta', 'Pork', 'Seafood', 'Side', 'Starter', 'Vegan', 'Vegetarian',
+]
+AREAS = [
+    'American', 'British', 'Canadian', 'Chinese', 'Croatian', 'Dutch', 'Egyptian', 'French', 'Greek',
+    'Indian', 'Irish', 'Italian', 'Jamaican', 'Japanese', 'Kenyan', 'Malaysian', 'Mexican', 'Moroccan',
+    'Polish', 'Portuguese', 'Russian', 'Spanish', 'Thai', 'Tunisian', 'Turkish', 'Vietnamese',
+]
+INGREDIENTS = [
+    ('Chicken Breast', ['400g', '2 large', '1 lb']), ('Beef', ['500g', '1 lb']), ('Salmon', ['2 fillets', '300g']),
+    ('Eggs', ['3', '2 large', '4']), ('Rice', ['1 cup', '200g']), ('Pasta', ['250g', '1 packet']),
+    ('Potatoes', ['4 medium', '500g']), ('Onion', ['1 chopped', '2']), ('Garlic', ['3 cloves', '2 cloves minced']),
+    ('Tomatoes', ['400g tin', '3 chopped']), ('Olive Oil', ['2 tbs', '3 tablespoons']), ('Butter', ['50g', '2 tbs']),
+    ('Milk', ['200ml', '1 cup']), ('Flour', ['100g', '2 tbs']), ('Cheddar Cheese', ['100g grated', '1 cup']),
+    ('Spinach', ['1 bunch', '200g']), ('Carrots', ['2 sliced', '3']), ('Lentils', ['200g', '1 cup']),
+    ('Chickpeas', ['400g tin', '1 can']), ('Coconut Milk', ['400ml', '1 can']), ('Tofu', ['300g', '1 block']),
+    ('Broccoli', ['1 head', '250g']), ('Peas', ['100g', '1 cup']), ('Soy Sauce', ['2 tbs', '3 tbsp']),
+    ('Ginger', ['1 tsp', '2 cm']), ('Lemon', ['1', 'Juice of 1']), ('Honey', ['1 tbs', '2 tsp']),
+    ('Salt', ['pinch', 'to taste']), ('Black Pepper', ['1 tsp', 'to taste']), ('Paprika', ['1 tsp', '2 tsp']),
+    ('Cumin', ['1 tsp']), ('Yogurt', ['150g', '1 cup']), ('Bell Pepper', ['1 sliced', '2']),
+    ('Mushrooms', ['200g', '1 cup sliced']), ('Oats', ['50g', '1 cup']), ('Banana', ['1', '2 ripe']),
+]
+NAME_WORDS = (
+    ['Spicy', 'Classic', 'Healthy', 'Creamy', 'Roasted', 'Grilled', 'Smoky', 'Crispy', 'Easy', 'Hearty'],
+    ['Chicken', 'Beef', 'Salmon', 'Egg', 'Tofu', 'Vegetable', 'Lentil', 'Vegan', 'Vegetarian', 'Mushroom',
+     'Lamb', 'Pork', 'Prawn', 'Chickpea', 'Rice', 'Pasta'],
+    ['Curry', 'Salad', 'Soup', 'Stew', 'Bowl', 'Bake', 'Stir Fry', 'Pie', 'Tacos', 'Wrap', 'Risotto',
+     'Skillet', 'Casserole', 'Noodles'],
+)
+SENTENCES = [
+    'Preheat the oven to 200C/180C fan/gas 6.',
+    'Heat the oil in a large pan over a medium heat and fry the onion for 5 minutes until softened.',
+    'Add the garlic and spices and cook for another minute, stirring constantly.',
+    'Stir in the remaining ingredients, bring to a simmer and cook for 20 minutes.',
+    'Season to taste with salt and pepper and serve immediately.',
+    'Meanwhile, cook the rice or pasta according to the pack instructions and drain well.',
+    'Scatter over the herbs and serve with crusty bread or a crisp green salad.',
+    'Leave to rest for 10 minutes before slicing so the juices can settle.',
+]
+FIRST_MEAL_ID = 52764
+
+
+class Catalog:
+    """Fester Fake-Katalog; gleiche Größe und gleicher Seed ergeben dieselben Daten"""
+
+    def __init__(self, size=600, products=2000, seed=42):
+        rng = random.Random(seed)
+        self.meals = []
+        names = set()
+        while len(self.meals) < size:
+            name = ' '.join(rng.choice(words) for words in NAME_WORDS)
+            if name in names:
+                name = f'{name} {len(self.meals)}'
+            names.add(name)
+            self.meals.append(self._meal(rng, FIRST_MEAL_ID + len(self.meals), name))
+
+        self.by_id = {meal['idMeal']: meal for meal in self.meals}
+        self.barcodes = [str(3017620420000 + i * 7) for i in range(products)]
+        self.product_seed = seed
+        self._products = {}
+        self._grades = None
+
+    def _meal(self, rng, meal_id, name):
+        meal = {
+            'idMeal': str(meal_id),
+            'strMeal': name,
+            'strDrinkAlternate': None,
+            'strCategory': rng.choice(CATEGORIES),
+            'strArea': rng.choice(AREAS),
+            'strInstructions': '\r\n'.join(rng.choice(SENTENCES) for _ in range(rng.randint(6, 14))),
+            'strMealThumb': f'https://www.themealdb.com/images/media/meals/{meal_id}.jpg',
+            'strTags': ','.join(rng.sample(['Meat', 'Spicy', 'Curry', 'Vegan', 'Healthy', 'Dinner', 'Quick'], 2)),
+            'strYoutube': f'https://www.youtube.com/watch?v={meal_id}',
+            'strSource': f'https://example.org/recipes/{meal_id}',
+            'strImageSource': None,
+            'strCreativeCommonsConfirmed': None,
+            'dateModified': None,
+        }
+        ingredients = rng.sample(INGREDIENTS, rng.randint(5, 14))
+        for i in range(1, 21):
+            if i <= len(ingredients):
+                ingredient, measures = ingredients[i - 1]
+                meal[f'strIngredient{i}'] = ingredient
+                meal[f'strMeasure{i}'] = rng.choice(measures)
+            else:
+                meal[f'strIngredient{i}'] = ''
+                meal[f'strMeasure{i}'] = ''
+        return meal
+
+    # ------------------------------------------
+    # TheMealDB
+    # ------------------------------------------
+    @staticmethod
+    def short(meal):
+        return {'strMeal': meal['strMeal'], 'strMealThumb': meal['strMealThumb'], 'idMeal': meal['idMeal']}
+
+    def mealdb(self, endpoint, query, rng):
+        """Antwort für /api/json/v1/1/<endpoint> oder None (404)"""
+        if endpoint == 'categories.php':
+            return {'categories': [
+                {'idCategory': str(i + 1), 'strCategory': category,
+                 'strCategoryThumb': f'https://www.themealdb.com/images/category/{category.lower()}.png',
+                 'strCategoryDescription': f'{category} dishes from around the world. ' * 8}
+                for i, category in enumerate(CATEGORIES)
+            ]}
+        if endpoint == 'list.php':
+            if 'c' in query:
+                return {'meals': [{'strCategory': c} for c in CATEGORIES]}
+            if 'a' in query:
+                return {'meals': [{'strArea': a} for a in AREAS]}
+            return {'meals': [{'idIngredient': str(i + 1), 'strIngredient': name, 'strDescription': None,
+                               'strType': None} for i, (name, _) in enumerate(INGREDIENTS)]}
+        if endpoint == 'search.php':
+            if 's' in query:
+                term = query['s'].lower()
+                meals = [m for m in self.meals if term in m['strMeal'].lower()][:25]
+            else:
+                letter = query.get('f', '').lower()[:1]
+                meals = [m for m in self.meals if m['strMeal'].lower().startswith(letter)] if letter else []
+            return {'meals': meals or None}
+        if endpoint == 'filter.php':
+            if 'c' in query:
+                meals = [m for m in self.meals if m['strCategory'].lower() == query['c'].lower()]
+            elif 'a' in query:
+                meals = [m for m in self.meals if m['strArea'].lower() == query['a'].lower()]
+            else:
+                ingredient = query.get('i', '').replace('_', ' ').lower()
+                meals = [m for m in self.meals
+                         if any(m[f'strIngredient{i}'].lower() == ingredient for i in range(1, 21))]
+            return {'meals': [self.short(m) for m in meals] or None}
+        if endpoint == 'lookup.php':
+            meal = self.by_id.get(query.get('i', ''))
+            return {'meals': [meal] if meal else None}
+        if endpoint == 'random.php':
+            return {'meals': [rng.choice(self.meals)]}
+        return None
+
+    # ------------------------------------------
+    # Open Food Facts
+    # ------------------------------------------
+    def product(self, code):
+        """Volles OFF-Produktdokument (mehrere KB) oder None für unbekannte Barcodes"""
+        if code.endswith('0') or not code.isdigit():
+            return None
+        product = self._products.get(code)
+        if product is None:
+            product = self._products[code] = self._product(code)
+        return product
+
+    def _product(self, code):
+        rng = random.Random(f'{self.product_seed}-{code}')
+        kcal = rng.randint(20, 600)
+        nutriments = {
+            'energy-kcal_100g': kcal, 'energy-kj_100g': round(kcal * 4.184), 'energy_100g': round(kcal * 4.184),
+            'proteins_100g': round(rng.uniform(0, 30), 1), 'carbohydrates_100g': round(rng.uniform(0, 80), 1),
+            'fat_100g': round(rng.uniform(0, 40), 1), 'sugars_100g': round(rng.uniform(0, 40), 1),
+            'fiber_100g': round(rng.uniform(0, 10), 1), 'salt_100g': round(rng.uniform(0, 3), 2),
+            'saturated-fat_100g': round(rng.uniform(0, 15), 1), 'sodium_100g': round(rng.uniform(0, 1.2), 3),
+        }
+        for key in list(nutriments):
+            base = key.replace('_100g', '')
+            nutriments[f'{base}_serving'] = nutriments[key]
+            nutriments[f'{base}_value'] = nutriments[key]
+            nutriments[f'{base}_unit'] = 'g'
+        name = f'{rng.choice(NAME_WORDS[0])} {rng.choice(NAME_WORDS[1])} Snack'
+        return {
+            'code': code,
+            'product_name': name,
+            'product_name_en': name,
+            'generic_name': name.lower(),
+            'brands': rng.choice(['Ferrero', 'Nestlé', 'Danone', 'Barilla', 'Alnatura', 'Rewe Bio']),
+            'categories': 'Snacks, Sweet snacks, Spreads',
+            'categories_tags': ['en:snacks', 'en:sweet-snacks', 'en:spreads'],
+            'nutrition_grades': rng.choice('abcde'),
+            'nutriscore_score': rng.randint(-5, 25),
+            'nutriments': nutriments,
+            'image_url': f'https://images.openfoodfacts.org/images/products/{code}/front_en.jpg',
+            'ingredients_text': ', '.join(rng.choice(INGREDIENTS)[0] for _ in range(25)),
+            'ingredients': [{'id': f'en:{i}', 'text': rng.choice(INGREDIENTS)[0], 'percent_estimate': rng.random()}
+                            for i in range(25)],
+            'allergens_tags': ['en:milk', 'en:nuts'],
+            'images': {str(i): {'sizes': {'100': {'h': 100, 'w': 75}, 'full': {'h': 1200, 'w': 900}},
+                                'uploaded_t': 1600000000 + i} for i in range(8)},
+            'countries_tags': ['en:france', 'en:germany', 'en:italy', 'en:spain'],
+            'states_tags': ['en:complete', 'en:nutrition-facts-completed', 'en:ingredients-completed'],
+        }
+
+    def off_product(self, code, fields=None):
+        """(Status, Antwort) wie /api/v2/product/<code>"""
+        product = self.product(code)
+        if product is None:
+            return 404, {'code': code, 'status': 0, 'status_verbose': 'product not found'}
+        if fields:
+            product = {key: product[key] for key in fields.split(',') if key in product}
+        return 200, {'code': code, 'status': 1, 'status_verbose': 'product found', 'product': product}
+
+    def off_search(self, query):
+        page = max(1, int(query.get('page', 1) or 1))
+        page_size = max(1, min(100, int(query.get('page_size', 20) or 20)))
+        if self._grades is None:
+            products = [p for p in (self.product(code) for code in self.barcodes) if p]
+            self._grades = {grade: [p for p in products if p['nutrition_grades'] == grade] for grade in 'abcde'}
+            self._grades[''] = products
+        products = self._grades.get(query.get('nutrition_grades_tags', ''), [])
+        fields = [key for key in query.get('fields', '').split(',') if key]
+        selected = products[(page - 1) * page_size:page * page_size]
+        if fields:
+            selected = [{key: p[key] for key in fields if key in p} for p in selected]
+        return {'count': len(products), 'page': page, 'page_size': page_size, 'products': selected}
+
+
+# ==========================================
+# OPENAI
+# ==========================================
+DAYS = ('monday', 'tuesday', 'wednesday', 'thursday', 'friday', 'saturday', 'sunday')
+
+
+def prompt_meals(prompt):
+    """Rezeptnamen aus der Liste 'VERFÜGBARE REZEPTE' im Prompt"""
+    section = prompt.split('VERFÜGBARE REZEPTE', 1)[-1].split('AUFGABEN', 1)[0]
+    return [line[2:].strip() for line in section.splitlines() if line.startswith('- ')]
+
+
+def plan_content(prompt, rng):
+    """Plan-JSON wie vom Modell: 3 Rezepte pro Tag, keines öfter als 2x"""
+    names = prompt_meals(prompt) or ['Classic Chicken Curry']
+    pool = names * 2
+    rng.shuffle(pool)
+    plan = {}
+    for i, day in enumerate(DAYS):
+        picked = [pool[(i * 3 + j) % len(pool)] for j in range(3)]
+        plan[day] = dict(zip(('breakfast', 'lunch', 'dinner'), picked))
+    plan['reasoning'] = 'Abwechslungsreicher Plan mit gleichmäßig verteiltem Protein. ' * 3
+    return json.dumps(plan, ensure_ascii=False, indent=2)
+
+
+def count_tokens(text):
+    """Grobe Token-Schätzung (ca. 4 Zeichen pro Token)"""
+    return max(1, len(text) // 4)
+
+
+def completion(model, prompt_text, content):
+    return {
+        'id': 'chatcmpl-bench-' + ''.join(random.choices(string.ascii_lowercase, k=12)),
+        'object': 'chat.completion',
+        'created': 0,
+        'model': model,
+        'choices': [{'index': 0, 'message': {'role': 'assistant', 'content': content}, 'finish_reason': 'stop'}],
+        'usage': {
+            'prompt_tokens': count_tokens(prompt_text),
+            'completion_tokens': count_tokens(content),
+            'total_tokens': count_tokens(prompt_text) + count_tokens(content),
+        },
+    }
+
+
+def stream_chunks(model, prompt_text, content, include_usage, chunk_chars=24):
+    """Chat-Completion-Chunks (ohne 'data: '-Rahmen) wie bei stream=True"""
+    base = {'id': 'chatcmpl-bench-stream', 'object': 'chat.completion.chunk', 'created': 0, 'model': model}
+    yield {**base, 'choices': [{'index': 0, 'delta': {'role': 'assistant', 'content': ''}, 'finish_reason': None}]}
+    for start in range(0, len(content), chunk_chars):
+        piece = content[start:start + chunk_chars]
+        yield {**base, 'choices': [{'index': 0, 'delta': {'content': piece}, 'finish_reason': None}]}
+    yield {**base, 'choices': [{'index': 0, 'delta': {}, 'finish_reason': 'stop'}]}
+    if include_usage:
+        yield {**base, 'choices': [], 'usage': completion(model, prompt_text, content)['usage']}
+
+
+def search_terms():
+    """Suchbegriffe, die im Fake-Katalog Treffer haben"""
+    return sorted({word.lower() for words in NAME_WORDS[1:] for word in words if re.match(r'^\w+$', word)})
@@ -0,0 +1,434 @@
+"""
+Lasttreiber für MealPrepHub
+
+Startet die Fake-Dienste (bench.fakes) und die App als Subprozess (gunicorn,
+WSGI oder ASGI), wärmt sie auf und misst danach jede /api-Route und die
+Seitenabläufe (Wochenplan, Einkaufsliste, KI-Plan direkt und als Job) nacheinander:
+
+    python -m bench.run --server wsgi --concurrency 8 --duration 10
+    python -m bench.run --server asgi --only 'ai plan' --compare bench_results/<datei>.json
+    python -m bench.run --url http://127.0.0.1:5000     # laufende App (eigene Fakes nötig)
+
+Pro Szenario werden Durchsatz, Mittelwert, p50/p95/p99 und Fehler ausgegeben
+und als JSON unter bench_results/<zeitpunkt>-<commit>.json gespeichert, damit
+sich Commits mit --compare vergleichen lassen.
+"""
+import argparse
+import json
+import math
+import os
+import random
+import shutil
+import socket
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+from datetime import datetime
+
+import requests
+
+from bench.fakes import HANDLERS, Fakes, add_profile_arguments
+from bench.payloads import AREAS, CATEGORIES, Catalog, search_terms
+
+
+# ==========================================
+# KONFIGURATION
+# ==========================================
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+RESULTS_DIR = os.path.join(ROOT, 'bench_results')
+READY_TIMEOUT = 60
+REQUEST_TIMEOUT = 120
+
+DAYS = ('monday', 'tuesday', 'wednesday', 'thursday', 'friday', 'saturday', 'sunday')
+GOALS = ('Abnehmen', 'Muskelaufbau', 'Gesund essen')
+
+
+class BenchError(Exception):
+    """Unerwartete Antwort (Status >= 400 oder 'error'-Event im Stream)"""
+
+
+# ==========================================
+# SZENARIEN
+# ==========================================
+class Client:
+    """requests.Session pro Lastthread; prüft Status und liest Antworten komplett"""
+
+    def __init__(self, base_url):
+        self.base_url = base_url.rstrip('/')
+        self.session = requests.Session()
+
+    def _check(self, response, expected=()):
+        if response.status_code >= 400 and response.status_code not in expected:
+            raise BenchError(f'{response.request.method} {response.url} -> {response.status_code}')
+        return response
+
+    def get(self, path, expected=()):
+        return self._check(self.session.get(self.base_url + path, timeout=REQUEST_TIMEOUT), expected)
+
+    def post(self, path, body):
+        return self._check(self.session.post(self.base_url + path, json=body, timeout=REQUEST_TIMEOUT))
+
+    def stream(self, path, body=None):
+        """SSE-Route bis zum Ende lesen (ohne body per GET); 'error'-Events zählen als Fehler"""
+        method = 'GET' if body is None else 'POST'
+        with self.session.request(method, self.base_url + path, json=body, stream=True,
+                                  timeout=REQUEST_TIMEOUT) as response:
+            self._check(response)
+            for line in response.iter_lines():
+                if line == b'event: error':
+                    raise BenchError(f'{method} {path} -> error event')
+
+
+class Data:
+    """Zufällige Eingaben passend zum Fake-Katalog"""
+
+    def __init__(self, catalog):
+        self.meal_ids = [meal['idMeal'] for meal in catalog.meals]
+        self.barcodes = catalog.barcodes
+        self.terms = search_terms()
+
+    def week_plan(self, rng, per_day=3):
+        return {
+            day: [{'id': rng.choice(self.meal_ids)} for _ in range(per_day)]
+            for day in DAYS
+        }
+
+    @staticmethod
+    def plan_request(rng, cached):
+        if cached:
+            return {'goal': 'Gesund essen', 'calories': 2000, 'protein': 100, 'dietary': ''}
+        # Zufällige Ziele -> Plan-Cache-Miss, d.h. ein OpenAI-Call pro Request
+        return {'goal': rng.choice(GOALS), 'calories': rng.randrange(1400, 3200, 10),
+                'protein': rng.randrange(60, 200, 5), 'dietary': ''}
+
+
+def build_scenarios(data):
+    """Name -> Funktion(client, rng); Routen zuerst, dann die Seitenabläufe"""
+
+    def week_plan_flow(client, rng):
+        client.get('/week-plan')
+        client.post('/api/search', {'query': rng.choice(data.terms)})
+        client.post('/api/recipe-nutrition/batch', {'weekPlan': data.week_plan(rng)})
+
+    def shopping_list_flow(client, rng):
+        client.get('/shopping-list')
+        client.post('/api/shopping-list', {'weekPlan': data.week_plan(rng)})
+
+    def ai_plan_flow(client, rng):
+        client.get('/ai-planner')
+        client.stream('/api/generate-ai-plan/stream', data.plan_request(rng, cached=False))
+
+    def ai_plan_job_flow(client, rng):
+        job = client.post('/api/generate-ai-plan/jobs', data.plan_request(rng, cached=False)).json()
+        client.stream(job['events_url'])
+
+    return {
+        'GET /api/categories': lambda c, r: c.get('/api/categories'),
+        'POST /api/search': lambda c, r: c.post('/api/search', {'query': r.choice(data.terms)}),
+        'POST /api/search (category)': lambda c, r: c.post('/api/search', {'category': r.choice(CATEGORIES)}),
+        'POST /api/filter': lambda c, r: c.post('/api/filter', {'filter': r.choice(AREAS + CATEGORIES)}),
+        'GET /api/recipe/<id>': lambda c, r: c.get(f'/api/recipe/{r.choice(data.meal_ids)}'),
+        'GET /api/random': lambda c, r: c.get('/api/random'),
+        'GET /api/recipe-nutrition/<id>': lambda c, r: c.get(f'/api/recipe-nutrition/{r.choice(data.meal_ids)}'),
+        'POST /api/recipe-nutrition/batch': lambda c, r: c.post(
+            '/api/recipe-nutrition/batch', {'weekPlan': data.week_plan(r)}),
+        'POST /api/shopping-list': lambda c, r: c.post('/api/shopping-list', {'weekPlan': data.week_plan(r)}),
+        'GET /api/nutrition/<barcode>': lambda c, r: c.get(
+            f'/api/nutrition/{r.choice(data.barcodes)}', expected=(404,)),  # unbekannte Barcodes
+        'POST /api/nutrition/batch': lambda c, r: c.post(
+            '/api/nutrition/batch', {'barcodes': r.sample(data.barcodes, 20)}),
+        'POST /api/search-nutrition': lambda c, r: c.post(
+            '/api/search-nutrition', {'nutriscore': r.choice('abcde'), 'page': r.randint(1, 5)}),
+        'POST /api/generate-ai-plan (cached)': lambda c, r: c.post(
+            '/api/generate-ai-plan', data.plan_request(r, cached=True)),
+        'POST /api/generate-ai-plan': lambda c, r: c.post(
+            '/api/generate-ai-plan', data.plan_request(r, cached=False)),
+        'POST /api/generate-ai-plan (solver)': lambda c, r: c.post(
+            '/api/generate-ai-plan', {**data.plan_request(r, cached=False), 'mode': 'solver'}),
+        'POST /api/generate-ai-plan/stream': lambda c, r: c.stream(
+            '/api/generate-ai-plan/stream', data.plan_request(r, cached=False)),
+        'GET /api/cache/stats': lambda c, r: c.get('/api/cache/stats'),
+        'GET /metrics': lambda c, r: c.get('/metrics'),
+        'flow: week plan': week_plan_flow,
+        'flow: shopping list': shopping_list_flow,
+        'flow: ai plan': ai_plan_flow,
+        'flow: ai plan (job)': ai_plan_job_flow,
+    }
+
+
+# ==========================================
+# LASTERZEUGUNG
+# ==========================================
+def percentile(values, pct):
+    """Nearest-Rank-Perzentil einer sortierten Liste"""
+    if not values:
+        return None
+    rank = max(1, math.ceil(pct / 100 * len(values)))
+    return values[min(rank, len(values)) - 1]
+
+
+def summarize(latencies, errors, elapsed):
+    latencies = sorted(latencies)
+    count = len(latencies)
+    ms = lambda seconds: round(seconds * 1000, 2) if seconds is not None else None  # noqa: E731
+    return {
+        'requests': count,
+        'errors': errors,
+        'rps': round(count / elapsed, 2) if elapsed > 0 else 0,
+        'mean_ms': ms(sum(latencies) / count) if count else None,
+        'p50_ms': ms(percentile(latencies, 50)),
+        'p95_ms': ms(percentile(latencies, 95)),
+        'p99_ms': ms(percentile(latencies, 99)),
+        'max_ms': ms(latencies[-1]) if count else None,
+    }
+
+
+def run_scenario(base_url, scenario, concurrency, duration, requests_limit, seed):
+    """
+    Führt ein Szenario mit `concurrency` Threads aus, bis `duration` Sekunden
+    vorbei sind bzw. `requests_limit` Durchläufe erreicht sind
+    Fehlgeschlagene Durchläufe zählen nur als Fehler, nicht in die Latenzen.
+    """
+    latencies = []
+    errors = [0]
+    samples = []
+    lock = threading.Lock()
+    started = time.perf_counter()
+    deadline = started + duration if duration else None
+    remaining = [requests_limit] if requests_limit else None
+
+    def worker(index):
+        client = Client(base_url)
+        rng = random.Random(seed * 1000 + index)
+        while True:
+            if deadline is not None and time.perf_counter() >= deadline:
+                return
+            if remaining is not None:
+                with lock:
+                    if remaining[0] <= 0:
+                        return
+                    remaining[0] -= 1
+            t0 = time.perf_counter()
+            try:
+                scenario(client, rng)
+            except (BenchError, requests.RequestException) as e:
+                with lock:
+                    errors[0] += 1
+                    if len(samples) < 3:
+                        samples.append(str(e))
+                continue
+            with lock:
+                latencies.append(time.perf_counter() - t0)
+
+    threads = [threading.Thread(target=worker, args=(i,), daemon=True) for i in range(concurrency)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+
+    result = summarize(latencies, errors[0], time.perf_counter() - started)
+    if samples:
+        result['error_samples'] = samples
+    return result
+
+
+def warm_up(base_url, scenarios, seed):
+    """Jedes Szenario einmal (füllt Caches, Facetten-Index und Verbindungspools)"""
+    client = Client(base_url)
+    rng = random.Random(seed)
+    for name, scenario in scenarios.items():
+        try:
+            scenario(client, rng)
+        except (BenchError, requests.RequestException) as e:
+            print(f'  Warm-up {name}: {e}')
+
+
+# ==========================================
+# APP-PROZESS
+# ==========================================
+def free_port():
+    with socket.socket() as sock:
+        sock.bind(('127.0.0.1', 0))
+        return sock.getsockname()[1]
+
+
+def start_app(server, port, env, workers, threads, log):
+    """Startet die App per gunicorn im Repo-Verzeichnis"""
+    bind = f'127.0.0.1:{port}'
+    if server == 'asgi':
+        command = ['gunicorn', '-c', 'gunicorn_asgi.conf.py', '-b', bind, '-w', str(workers), 'asgi:app']
+    else:
+        command = ['gunicorn', '-b', bind, '-w', str(workers), '-k', 'gthread', '--threads', str(threads),
+                   '--timeout', '120', 'main:app']
+    return subprocess.Popen(command, cwd=ROOT, env={**os.environ, **env}, stdout=log, stderr=subprocess.STDOUT)
+
+
+def wait_ready(base_url, process):
+    deadline = time.time() + READY_TIMEOUT
+    while time.time() < deadline:
+        if process is not None and process.poll() is not None:
+            raise RuntimeError(f'App beendet mit Code {process.returncode}')
+        try:
+            if requests.get(base_url + '/api/categories', timeout=5).status_code == 200:
+                return
+        except requests.RequestException:
+            pass
+        time.sleep(0.2)
+    raise RuntimeError(f'App unter {base_url} nicht erreichbar')
+
+
+# ==========================================
+# AUSGABE
+# ==========================================
+def git_commit():
+    try:
+        return subprocess.run(['git', 'rev-parse', '--short', 'HEAD'], cwd=ROOT, capture_output=True,
+                              text=True, check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return 'unknown'
+
+
+def format_report(results, baseline=None):
+    header = f"{'Szenario':38} {'req/s':>8} {'mean':>8} {'p50':>8} {'p95':>8} {'p99':>8} {'Fehler':>7}"
+    if baseline:
+        header += f" {'Δreq/s':>8} {'Δp95':>8}"
+    lines = [header, '-' * len(header)]
+
+    def number(value):
+        return f'{value:8.1f}' if value is not None else f"{'-':>8}"
+
+    for name, result in results.items():
+        line = (f"{name[:38]:38} {number(result['rps'])} {number(result['mean_ms'])} {number(result['p50_ms'])} "
+                f"{number(result['p95_ms'])} {number(result['p99_ms'])} {result['errors']:7d}")
+        previous = (baseline or {}).get(name)
+        if previous:
+            line += f" {_delta(result['rps'], previous.get('rps'))} {_delta(result['p95_ms'], previous.get('p95_ms'))}"
+        lines.append(line)
+    return '\n'.join(lines)
+
+
+def _delta(current, previous):
+    if not current or not previous:
+        return f"{'-':>8}"
+    return f'{(current - previous) / previous:+8.1%}'
+
+
+def save_results(report):
+    os.makedirs(RESULTS_DIR, exist_ok=True)
+    stamp = datetime.now().strftime('%Y%m%d-%H%M%S')
+    path = os.path.join(RESULTS_DIR, f"{stamp}-{report['meta']['commit']}.json")
+    with open(path, 'w', encoding='utf-8') as f:
+        json.dump(report, f, indent=2, ensure_ascii=False)
+    return path
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Lasttest für MealPrepHub mit lokalen Fake-APIs')
+    parser.add_argument('--server', choices=('wsgi', 'asgi'), default='wsgi',
+                        help='wsgi = gunicorn gthread (main:app), asgi = gunicorn_asgi.conf.py (asgi:app)')
+    parser.add_argument('--url', help='Bereits laufende App messen (startet weder App noch Fakes)')
+    parser.add_argument('--workers', type=int, default=2, help='gunicorn-Worker')
+    parser.add_argument('--threads', type=int, default=16, help='Threads pro Worker (nur wsgi)')
+    parser.add_argument('--concurrency', type=int, default=8, help='Gleichzeitige Clients pro Szenario')
+    parser.add_argument('--duration', type=float, default=5.0, help='Sekunden pro Szenario')
+    parser.add_argument('--requests', type=int, default=0, help='Durchläufe pro Szenario statt --duration')
+    parser.add_argument('--only', action='append', default=[],
+                        help='Nur Szenarien, deren Name den Text enthält (mehrfach möglich)')
+    parser.add_argument('--seed', type=int, default=1)
+    parser.add_argument('--no-save', action='store_true', help='Ergebnis nicht unter bench_results/ speichern')
+    parser.add_argument('--compare', help='Früheres Ergebnis (JSON) zum Vergleich')
+    add_profile_arguments(parser)
+    args = parser.parse_args()
+
+    catalog = Catalog()
+    scenarios = build_scenarios(Data(catalog))
+    if args.only:
+        scenarios = {name: fn for name, fn in scenarios.items()
+                     if any(part.lower() in name.lower() for part in args.only)}
+    if not scenarios:
+        parser.error('Keine Szenarien ausgewählt')
+    duration = 0 if args.requests else args.duration
+
+    fakes = process = None
+    workdir = tempfile.mkdtemp(prefix='mealprep-bench-')
+    log_path = os.path.join(workdir, 'app.log')
+    try:
+        if args.url:
+            base_url = args.url.rstrip('/')
+        else:
+            fakes = Fakes({name: getattr(args, name) for name in HANDLERS}, catalog=catalog).start()
+            env = {
+                **fakes.env(),
+                # Frische Caches pro Lauf, damit Ergebnisse vergleichbar bleiben
+                'BARCODE_CACHE_PATH': os.path.join(workdir, 'barcode_cache.db'),
+                # Jobs zwischen allen Workern teilen; alle Lastthreads kommen von 127.0.0.1
+                'JOBS_SQLITE_PATH': os.path.join(workdir, 'plan_jobs.db'),
+                'JOBS_MAX_PER_CLIENT': '0',
+                'CATALOG_MODE': 'live',
+                'OFF_MODE': 'live',
+            }
+            port = free_port()
+            base_url = f'http://127.0.0.1:{port}'
+            with open(log_path, 'w') as log:
+                process = start_app(args.server, port, env, args.workers, args.threads, log)
+            for name, server in fakes.servers.items():
+                print(f'Fake {name:7} {server.url}  ({server.profile})')
+
+        print(f'App: {base_url} ({args.url and "extern" or args.server})')
+        wait_ready(base_url, process)
+        print('Warm-up ...')
+        warm_up(base_url, scenarios, args.seed)
+
+        results = {}
+        for name, scenario in scenarios.items():
+            print(f'  {name} ...', end='', flush=True)
+            results[name] = run_scenario(base_url, scenario, args.concurrency, duration, args.requests, args.seed)
+            print(f" {results[name]['rps']} req/s, p95 {results[name]['p95_ms']} ms")
+
+        report = {
+            'meta': {
+                'commit': git_commit(),
+                'date': datetime.now().isoformat(timespec='seconds'),
+                'server': 'external' if args.url else args.server,
+                'workers': args.workers,
+                'threads': args.threads,
+                'concurrency': args.concurrency,
+                'duration': duration,
+                'requests': args.requests,
+                'fakes': fakes.stats() if fakes else None,
+            },
+            'results': results,
+        }
+
+        baseline = None
+        if args.compare:
+            with open(args.compare, encoding='utf-8') as f:
+                baseline = json.load(f)['results']
+
+        print()
+        print(format_report(results, baseline))
+        if not args.no_save:
+            print(f'\nGespeichert: {os.path.relpath(save_results(report), ROOT)}')
+
+    except RuntimeError as e:
+        print(f'Error in bench: {str(e)}')
+        if os.path.exists(log_path):
+            with open(log_path) as f:
+                print(f.read()[-4000:])
+        sys.exit(1)
+    finally:
+        if process is not None:
+            process.terminate()
+            try:
+                process.wait(timeout=15)
+            except subprocess.TimeoutExpired:
+                process.kill()
+        if fakes is not None:
+            fakes.stop()
+        shutil.rmtree(workdir, ignore_errors=True)
+
+
+if __name__ == '__main__':
+    main()
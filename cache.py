@@ -0,0 +1,316 @@
+"""
+Response-Cache für Upstream-Lookups
+
+In-Process-LRU mit TTL pro Eintrag, optionalem SQLite-Backend (geteilt
+zwischen allen gunicorn-Workern) und Stale-While-Revalidate: abgelaufene
+Einträge werden noch eine Weile ausgeliefert, während ein Hintergrund-Thread
+sie neu lädt. Schlägt das Neuladen fehl (Upstream down, Circuit Breaker
+offen), werden auch ältere Einträge noch bis CACHE_STALE_IF_ERROR ausgeliefert.
+"""
+import asyncio
+import contextvars
+import json
+import os
+import sqlite3
+import threading
+import time
+from collections import OrderedDict
+
+from sqlitedb import ThreadLocalConnection
+
+
+# ==========================================
+# KONFIGURATION
+# ==========================================
+CACHE_MAX_ENTRIES = int(os.getenv('CACHE_MAX_ENTRIES', '2000'))
+CACHE_MAX_BYTES = int(os.getenv('CACHE_MAX_BYTES', str(32 * 1024 * 1024)))
+CACHE_STALE_TTL = float(os.getenv('CACHE_STALE_TTL', '3600'))
+# Wie lange abgelaufene Einträge als Notfall-Antwort dienen, wenn der Upstream fehlschlägt
+CACHE_STALE_IF_ERROR = float(os.getenv('CACHE_STALE_IF_ERROR', str(24 * 3600)))
+CACHE_SQLITE_PATH = os.getenv('CACHE_SQLITE_PATH', '')
+CACHE_SQLITE_MAX_ROWS = int(os.getenv('CACHE_SQLITE_MAX_ROWS', '50000'))
+
+
+class SQLiteCacheBackend:
+    """Geteiltes Cache-Backend in einer SQLite-Datei"""
+
+    def __init__(self, path, max_rows=CACHE_SQLITE_MAX_ROWS):
+        self.path = path
+        self.max_rows = max_rows
+        self._db = ThreadLocalConnection(path)
+        self._conn = self._db.get
+        self._writes = 0
+        conn = self._conn()
+        conn.execute(
+            'CREATE TABLE IF NOT EXISTS response_cache ('
+            ' key TEXT PRIMARY KEY,'
+            ' value TEXT NOT NULL,'
+            ' expires_at REAL NOT NULL,'
+            ' stored_at REAL NOT NULL)'
+        )
+        conn.execute('CREATE INDEX IF NOT EXISTS idx_response_cache_stored ON response_cache (stored_at)')
+        conn.commit()
+
+    def get(self, key):
+        row = self._conn().execute(
+            'SELECT value, expires_at FROM response_cache WHERE key = ?', (key,)
+        ).fetchone()
+        if row is None:
+            return None
+        return json.loads(row[0]), row[1]
+
+    def set(self, key, value, expires_at):
+        conn = self._conn()
+        conn.execute(
+            'INSERT OR REPLACE INTO response_cache (key, value, expires_at, stored_at) VALUES (?, ?, ?, ?)',
+            (key, json.dumps(value), expires_at, time.time())
+        )
+        conn.commit()
+
+        # Gelegentlich aufräumen statt bei jedem Schreibzugriff
+        self._writes += 1
+        if self._writes % 100 == 0:
+            self.prune()
+
+    def prune(self):
+        conn = self._conn()
+        conn.execute(
+            'DELETE FROM response_cache WHERE expires_at < ?',
+            (time.time() - max(CACHE_STALE_TTL, CACHE_STALE_IF_ERROR),)
+        )
+        conn.execute(
+            'DELETE FROM response_cache WHERE key IN ('
+            ' SELECT key FROM response_cache ORDER BY stored_at DESC LIMIT -1 OFFSET ?)',
+            (self.max_rows,)
+        )
+        conn.commit()
+
+
+class ResponseCache:
+    """Größenbegrenzter LRU-Cache mit TTL und Stale-While-Revalidate"""
+
+    def __init__(self, max_entries=CACHE_MAX_ENTRIES, max_bytes=CACHE_MAX_BYTES,
+                 stale_ttl=CACHE_STALE_TTL, stale_if_error=CACHE_STALE_IF_ERROR, backend=None):
+        self.max_entries = max_entries
+        self.max_bytes = max_bytes
+        self.stale_ttl = stale_ttl
+        self.stale_if_error = stale_if_error
+        self.backend = backend
+
+        self._entries = OrderedDict()  # key -> (value, expires_at, size)
+        self._bytes = 0
+        self._lock = threading.Lock()
+        self._refreshing = set()
+
+        self.stats = {
+            'hits': 0,
+            'stale_hits': 0,
+            'misses': 0,
+            'backend_hits': 0,
+            'refreshes': 0,
+            'refresh_errors': 0,
+            'error_fallbacks': 0,
+            'evictions': 0,
+        }
+
+    def _count(self, name):
+        # Zähler unter dem Lock, sonst gehen unter gthread Inkremente verloren
+        with self._lock:
+            self.stats[name] += 1
+
+    # ------------------------------------------
+    # Lokaler LRU
+    # ------------------------------------------
+    def _get_local(self, key):
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                return None
+            self._entries.move_to_end(key)
+            return entry[0], entry[1]
+
+    def _set_local(self, key, value, expires_at, size):
+        with self._lock:
+            old = self._entries.pop(key, None)
+            if old is not None:
+                self._bytes -= old[2]
+            if size > self.max_bytes:
+                return
+            self._entries[key] = (value, expires_at, size)
+            self._bytes += size
+
+            while len(self._entries) > self.max_entries or self._bytes > self.max_bytes:
+                _, evicted = self._entries.popitem(last=False)
+                self._bytes -= evicted[2]
+                self.stats['evictions'] += 1
+
+    def _store(self, key, value, ttl):
+        expires_at = time.time() + ttl
+        serialized = json.dumps(value)
+        self._set_local(key, value, expires_at, len(serialized))
+        if self.backend is not None:
+            try:
+                self.backend.set(key, value, expires_at)
+            except sqlite3.Error as e:
+                print(f"Error in cache backend set: {str(e)}")
+
+    def _lookup(self, key):
+        entry = self._get_local(key)
+        if entry is not None:
+            return entry
+
+        if self.backend is not None:
+            try:
+                entry = self.backend.get(key)
+            except sqlite3.Error as e:
+                print(f"Error in cache backend get: {str(e)}")
+                entry = None
+            if entry is not None:
+                value, expires_at = entry
+                self._set_local(key, value, expires_at, len(json.dumps(value)))
+                self._count('backend_hits')
+                return entry
+
+        return None
+
+    # ------------------------------------------
+    # Hintergrund-Refresh
+    # ------------------------------------------
+    def _refresh(self, key, ttl, fetch):
+        try:
+            self._store(key, fetch(), ttl)
+            result = 'refreshes'
+        except Exception as e:
+            result = 'refresh_errors'
+            print(f"Error in cache refresh ({key}): {str(e)}")
+        finally:
+            with self._lock:
+                self._refreshing.discard(key)
+                self.stats[result] += 1
+
+    def _schedule_refresh(self, key, ttl, fetch):
+        with self._lock:
+            if key in self._refreshing:
+                return
+            self._refreshing.add(key)
+        threading.Thread(target=self._refresh, args=(key, ttl, fetch), daemon=True).start()
+
+    # ------------------------------------------
+    # Öffentliche API
+    # ------------------------------------------
+    def _check(self, key):
+        """
+        Liefert ('fresh' | 'stale' | 'miss', Wert, Notfall-Wert)
+        Der Notfall-Wert ist ein zu alter Eintrag, der nur bei Upstream-Fehlern dient.
+        """
+        now = time.time()
+        entry = self._lookup(key)
+        fallback = None
+        if entry is not None:
+            value, expires_at = entry
+            if now < expires_at:
+                self._count('hits')
+                return 'fresh', value, None
+            if now < expires_at + self.stale_ttl:
+                self._count('stale_hits')
+                return 'stale', value, None
+            if now < expires_at + self.stale_if_error:
+                fallback = value
+
+        self._count('misses')
+        return 'miss', None, fallback
+
+    def _error_fallback(self, key, fallback, error):
+        if fallback is None:
+            raise error
+        self._count('error_fallbacks')
+        print(f"Error in cache fetch ({key}), nutze veralteten Eintrag: {str(error)}")
+        return fallback
+
+    def get_or_fetch(self, key, ttl, fetch):
+        """Liefert den Cache-Wert oder ruft fetch() auf und speichert das Ergebnis"""
+        if ttl <= 0:
+            return fetch()
+
+        state, value, fallback = self._check(key)
+        if state == 'stale':
+            # Veralteten Wert sofort ausliefern, im Hintergrund neu laden
+            self._schedule_refresh(key, ttl, fetch)
+        if state != 'miss':
+            return value
+
+        try:
+            value = fetch()
+        except Exception as e:
+            return self._error_fallback(key, fallback, e)
+        self._store(key, value, ttl)
+        return value
+
+    async def _arefresh(self, key, ttl, fetch):
+        try:
+            self._store(key, await fetch(), ttl)
+            result = 'refreshes'
+        except Exception as e:
+            result = 'refresh_errors'
+            print(f"Error in cache refresh ({key}): {str(e)}")
+        finally:
+            with self._lock:
+                self._refreshing.discard(key)
+                self.stats[result] += 1
+
+    async def aget_or_fetch(self, key, ttl, fetch):
+        """Async-Variante von get_or_fetch; fetch ist eine Coroutine-Funktion"""
+        if ttl <= 0:
+            return await fetch()
+
+        state, value, fallback = self._check(key)
+        if state == 'stale':
+            with self._lock:
+                schedule = key not in self._refreshing
+                self._refreshing.add(key)
+            if schedule:
+                # Leerer Kontext: der Refresh gehört nicht zum Request (keine Deadline, keine Phasen)
+                contextvars.Context().run(
+                    asyncio.get_running_loop().create_task, self._arefresh(key, ttl, fetch))
+        if state != 'miss':
+            return value
+
+        try:
+            value = await fetch()
+        except Exception as e:
+            return self._error_fallback(key, fallback, e)
+        self._store(key, value, ttl)
+        return value
+
+    def peek(self, key):
+        """Liefert einen (auch veralteten) Wert ohne Upstream-Aufruf, sonst None"""
+        entry = self._lookup(key)
+        if entry is None or time.time() >= entry[1] + self.stale_ttl:
+            return None
+        return entry[0]
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+            self._bytes = 0
+
+    def get_stats(self):
+        with self._lock:
+            size = {'entries': len(self._entries), 'bytes': self._bytes}
+            stats = dict(self.stats)
+        lookups = stats['hits'] + stats['stale_hits'] + stats['misses']
+        hit_rate = (stats['hits'] + stats['stale_hits']) / lookups if lookups else 0.0
+        return {
+            **stats,
+            **size,
+            'hit_rate': round(hit_rate, 4),
+            'max_entries': self.max_entries,
+            'max_bytes': self.max_bytes,
+            'backend': 'sqlite' if self.backend is not None else None,
+        }
+
+
+def create_cache():
+    """Baut den Cache gemäß Umgebungsvariablen (SQLite-Backend optional)"""
+    backend = SQLiteCacheBackend(CACHE_SQLITE_PATH) if CACHE_SQLITE_PATH else None
+    return ResponseCache(backend=backend)
@@ -0,0 +1,399 @@
+"""
+Lokaler TheMealDB-Katalog (SQLite-Mirror mit FTS5-Volltextindex)
+
+Ingest:
+    python catalog.py sync            # inkrementell (Buchstaben, Kategorien, Küchen)
+    python catalog.py sync --full     # zusätzlich alle Zutaten-Filter
+    python catalog.py export dump.json
+    python catalog.py import dump.json   # z.B. Fixture für Offline-Betrieb
+
+Mit CATALOG_MODE=mirror beantworten die /api-Routen Suche, Filter und
+Rezept-Details aus dem Mirror statt über die Live-API.
+"""
+import argparse
+import hashlib
+import json
+import os
+import string
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from ingredients import extract_ingredients
+from sqlitedb import ThreadLocalConnection
+
+
+# ==========================================
+# KONFIGURATION
+# ==========================================
+CATALOG_MODE = os.getenv('CATALOG_MODE', 'live')  # live | mirror
+CATALOG_DB_PATH = os.getenv('CATALOG_DB_PATH', 'mealdb_catalog.db')
+CATALOG_SYNC_WORKERS = int(os.getenv('CATALOG_SYNC_WORKERS', '8'))
+CATALOG_SEARCH_LIMIT = int(os.getenv('CATALOG_SEARCH_LIMIT', '50'))
+
+LIST_KINDS = {'c': 'strCategory', 'a': 'strArea', 'i': 'strIngredient'}
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS meals (
+    id_meal TEXT PRIMARY KEY,
+    name TEXT NOT NULL,
+    category TEXT,
+    area TEXT,
+    thumb TEXT,
+    data TEXT NOT NULL,
+    content_hash TEXT NOT NULL,
+    updated_at REAL NOT NULL
+);
+CREATE INDEX IF NOT EXISTS idx_meals_category ON meals (category COLLATE NOCASE);
+CREATE INDEX IF NOT EXISTS idx_meals_area ON meals (area COLLATE NOCASE);
+
+CREATE TABLE IF NOT EXISTS meal_ingredients (
+    id_meal TEXT NOT NULL,
+    ingredient TEXT NOT NULL COLLATE NOCASE,
+    PRIMARY KEY (id_meal, ingredient)
+);
+CREATE INDEX IF NOT EXISTS idx_meal_ingredients_ingredient ON meal_ingredients (ingredient);
+
+CREATE VIRTUAL TABLE IF NOT EXISTS meals_fts USING fts5(
+    id_meal UNINDEXED,
+    name,
+    ingredients,
+    instructions,
+    tokenize = 'unicode61 remove_diacritics 2'
+);
+
+CREATE TABLE IF NOT EXISTS lists (
+    kind TEXT PRIMARY KEY,
+    data TEXT NOT NULL
+);
+
+CREATE TABLE IF NOT EXISTS sync_state (
+    key TEXT PRIMARY KEY,
+    value TEXT
+);
+"""
+
+
+def _short(row):
+    """Kurzformat wie filter.php"""
+    return {'strMeal': row[0], 'strMealThumb': row[1], 'idMeal': row[2]}
+
+
+def _fts_query(text):
+    """Macht aus Freitext eine FTS5-Präfix-Abfrage ("chick cur" -> "chick"* "cur"*)"""
+    tokens = [''.join(ch for ch in token if ch.isalnum()) for token in text.split()]
+    return ' '.join(f'"{token}"*' for token in tokens if token)
+
+
+class MealCatalog:
+    """SQLite-Mirror von TheMealDB mit TheMealDB-kompatiblen Abfragen"""
+
+    def __init__(self, path=CATALOG_DB_PATH):
+        self.path = path
+        self._db = ThreadLocalConnection(path, timeout=10)
+        self._conn = self._db.get
+        conn = self._conn()
+        conn.executescript(SCHEMA)
+        conn.commit()
+
+    # ------------------------------------------
+    # Schreiben
+    # ------------------------------------------
+    def upsert_meal(self, meal, conn=None):
+        """Speichert ein vollständiges Meal; liefert 'inserted', 'updated' oder 'unchanged'"""
+        conn = conn or self._conn()
+        meal_id = str(meal['idMeal'])
+        data = json.dumps(meal, sort_keys=True)
+        content_hash = hashlib.sha1(data.encode('utf-8')).hexdigest()
+
+        row = conn.execute('SELECT content_hash FROM meals WHERE id_meal = ?', (meal_id,)).fetchone()
+        if row and row[0] == content_hash:
+            return 'unchanged'
+
+        ingredients = [entry['ingredient'] for entry in extract_ingredients(meal)]
+
+        conn.execute(
+            'INSERT OR REPLACE INTO meals (id_meal, name, category, area, thumb, data, content_hash, updated_at)'
+            ' VALUES (?, ?, ?, ?, ?, ?, ?, ?)',
+            (meal_id, meal.get('strMeal') or '', meal.get('strCategory'), meal.get('strArea'),
+             meal.get('strMealThumb'), data, content_hash, time.time())
+        )
+        conn.execute('DELETE FROM meal_ingredients WHERE id_meal = ?', (meal_id,))
+        conn.executemany(
+            'INSERT OR IGNORE INTO meal_ingredients (id_meal, ingredient) VALUES (?, ?)',
+            [(meal_id, ingredient) for ingredient in ingredients]
+        )
+        conn.execute('DELETE FROM meals_fts WHERE id_meal = ?', (meal_id,))
+        conn.execute(
+            'INSERT INTO meals_fts (id_meal, name, ingredients, instructions) VALUES (?, ?, ?, ?)',
+            (meal_id, meal.get('strMeal') or '', ' '.join(ingredients), meal.get('strInstructions') or '')
+        )
+        return 'updated' if row else 'inserted'
+
+    def delete_meals(self, meal_ids, conn=None):
+        """Entfernt Rezepte samt Zutaten und Suchindex; liefert die Anzahl"""
+        conn = conn or self._conn()
+        params = [(meal_id,) for meal_id in meal_ids]
+        conn.executemany('DELETE FROM meal_ingredients WHERE id_meal = ?', params)
+        conn.executemany('DELETE FROM meals_fts WHERE id_meal = ?', params)
+        return conn.executemany('DELETE FROM meals WHERE id_meal = ?', params).rowcount
+
+    def set_list(self, kind, data, conn=None):
+        conn = conn or self._conn()
+        conn.execute('INSERT OR REPLACE INTO lists (kind, data) VALUES (?, ?)', (kind, json.dumps(data)))
+
+    def set_state(self, key, value, conn=None):
+        conn = conn or self._conn()
+        conn.execute('INSERT OR REPLACE INTO sync_state (key, value) VALUES (?, ?)', (key, json.dumps(value)))
+
+    def get_state(self, key, default=None):
+        row = self._conn().execute('SELECT value FROM sync_state WHERE key = ?', (key,)).fetchone()
+        return json.loads(row[0]) if row else default
+
+    # ------------------------------------------
+    # Lesen (TheMealDB-Antwortformat)
+    # ------------------------------------------
+    def lookup(self, meal_id):
+        """Wie lookup.php?i="""
+        row = self._conn().execute('SELECT data FROM meals WHERE id_meal = ?', (str(meal_id),)).fetchone()
+        return {'meals': [json.loads(row[0])] if row else None}
+
+    def search(self, query, limit=CATALOG_SEARCH_LIMIT):
+        """
+        Volltextsuche über Name, Zutaten und Anleitung
+        Treffer im Namen werden über bm25-Gewichte stark bevorzugt.
+        """
+        fts = _fts_query(query)
+        if not fts:
+            return {'meals': None}
+        rows = self._conn().execute(
+            'SELECT m.data FROM meals_fts f JOIN meals m ON m.id_meal = f.id_meal'
+            ' WHERE meals_fts MATCH ? ORDER BY bm25(meals_fts, 0.0, 10.0, 3.0, 1.0) LIMIT ?',
+            (fts, limit)
+        ).fetchall()
+        return {'meals': [json.loads(row[0]) for row in rows] or None}
+
+    def search_first_letter(self, letter):
+        """Wie search.php?f="""
+        rows = self._conn().execute(
+            'SELECT data FROM meals WHERE name LIKE ? ORDER BY name', (f'{letter[:1]}%',)
+        ).fetchall()
+        return {'meals': [json.loads(row[0]) for row in rows] or None}
+
+    def filter(self, area=None, category=None, ingredient=None):
+        """Wie filter.php; mehrere Facetten werden geschnitten"""
+        clauses, params = [], []
+        if area:
+            clauses.append('m.area = ? COLLATE NOCASE')
+            params.append(area)
+        if category:
+            clauses.append('m.category = ? COLLATE NOCASE')
+            params.append(category)
+        if ingredient:
+            clauses.append('m.id_meal IN (SELECT id_meal FROM meal_ingredients WHERE ingredient = ?)')
+            params.append(ingredient.replace('_', ' '))
+        if not clauses:
+            return {'meals': None}
+
+        rows = self._conn().execute(
+            f'SELECT m.name, m.thumb, m.id_meal FROM meals m WHERE {" AND ".join(clauses)} ORDER BY m.name',
+            params
+        ).fetchall()
+        return {'meals': [_short(row) for row in rows] or None}
+
+    def get_list(self, kind):
+        """Wie list.php?{kind}=list bzw. categories.php (kind='categories')"""
+        row = self._conn().execute('SELECT data FROM lists WHERE kind = ?', (kind,)).fetchone()
+        return json.loads(row[0]) if row else None
+
+    def all_meals(self):
+        return [json.loads(row[0]) for row in self._conn().execute('SELECT data FROM meals ORDER BY id_meal')]
+
+    def stats(self):
+        conn = self._conn()
+        return {
+            'meals': conn.execute('SELECT COUNT(*) FROM meals').fetchone()[0],
+            'ingredients': conn.execute('SELECT COUNT(DISTINCT ingredient) FROM meal_ingredients').fetchone()[0],
+            'last_sync': self.get_state('last_sync'),
+        }
+
+    # ------------------------------------------
+    # Fixture-Dump
+    # ------------------------------------------
+    def export_dump(self, path):
+        conn = self._conn()
+        dump = {
+            'meals': self.all_meals(),
+            'lists': {kind: json.loads(data) for kind, data in conn.execute('SELECT kind, data FROM lists')},
+        }
+        with open(path, 'w', encoding='utf-8') as f:
+            json.dump(dump, f, ensure_ascii=False)
+        return len(dump['meals'])
+
+    def import_dump(self, path):
+        with open(path, encoding='utf-8') as f:
+            dump = json.load(f)
+        conn = self._conn()
+        counts = {'inserted': 0, 'updated': 0, 'unchanged': 0}
+        with conn:
+            for meal in dump.get('meals', []):
+                counts[self.upsert_meal(meal, conn)] += 1
+            for kind, data in dump.get('lists', {}).items():
+                self.set_list(kind, data, conn)
+            self.set_state('last_sync', {'at': time.time(), 'source': path, **counts}, conn)
+        return counts
+
+
+# ==========================================
+# CRAWLER
+# ==========================================
+class CatalogSync:
+    """Crawlt TheMealDB in den lokalen Katalog"""
+
+    def __init__(self, catalog, client, workers=CATALOG_SYNC_WORKERS):
+        self.catalog = catalog
+        self.client = client
+        self.workers = workers
+
+    def _fetch(self, path, params=None):
+        try:
+            return self.client.get_json(path, params=params)
+        except Exception as e:
+            print(f"Error in catalog sync ({path} {params}): {str(e)}")
+            return None
+
+    def _fetch_many(self, requests_):
+        with ThreadPoolExecutor(max_workers=self.workers) as executor:
+            return list(executor.map(lambda r: self._fetch(*r), requests_))
+
+    def sync(self, full=False):
+        """
+        Abgleich mit TheMealDB: Listen, Suche nach Anfangsbuchstaben und Filter
+        nach Kategorie/Küche; mit full=True zusätzlich alle Zutaten.
+        Gecrawlt wird jedes Mal alles; inkrementell sind nur die Schreibzugriffe
+        (unveränderte Rezepte per Content-Hash übersprungen). War der Crawl
+        vollständig (kein Request fehlgeschlagen), werden Rezepte gelöscht, die
+        upstream weder per Suche noch per Filter mehr auftauchen.
+        """
+        started = time.time()
+        conn = self.catalog._conn()
+        counts = {'inserted': 0, 'updated': 0, 'unchanged': 0, 'deleted': 0}
+
+        # 1. Listen (Kategorien, Küchen, Zutaten)
+        list_results = self._fetch_many([('list.php', {kind: 'list'}) for kind in LIST_KINDS])
+        categories = self._fetch('categories.php')
+        complete = all(result is not None for result in list_results)
+        lists = {}
+        with conn:
+            for kind, result in zip(LIST_KINDS, list_results):
+                if result and result.get('meals'):
+                    lists[kind] = [item[LIST_KINDS[kind]] for item in result['meals'] if item.get(LIST_KINDS[kind])]
+                    self.catalog.set_list(kind, result, conn)
+            if categories:
+                self.catalog.set_list('categories', categories, conn)
+
+        # 2. Vollständige Rezepte über search.php?f=<Buchstabe>
+        letters = string.ascii_lowercase + string.digits
+        seen = set()
+        for result in self._fetch_many([('search.php', {'f': letter}) for letter in letters]):
+            complete = complete and result is not None
+            with conn:
+                for meal in (result or {}).get('meals') or []:
+                    seen.add(str(meal['idMeal']))
+                    counts[self.catalog.upsert_meal(meal, conn)] += 1
+
+        # 3. Fehlende IDs über filter.php entdecken
+        facets = [('filter.php', {'c': value}) for value in lists.get('c', [])]
+        facets += [('filter.php', {'a': value}) for value in lists.get('a', [])]
+        if full:
+            facets += [('filter.php', {'i': value}) for value in lists.get('i', [])]
+
+        discovered = set()
+        for result in self._fetch_many(facets):
+            complete = complete and result is not None
+            for meal in (result or {}).get('meals') or []:
+                discovered.add(str(meal['idMeal']))
+
+        known = {row[0] for row in conn.execute('SELECT id_meal FROM meals')}
+        missing = sorted((discovered - seen) - known)
+        for result in self._fetch_many([('lookup.php', {'i': meal_id}) for meal_id in missing]):
+            with conn:
+                for meal in (result or {}).get('meals') or []:
+                    counts[self.catalog.upsert_meal(meal, conn)] += 1
+
+        # 4. Upstream verschwundene Rezepte entfernen (nur nach vollständigem Crawl)
+        if complete and seen:
+            vanished = sorted(known - seen - discovered)
+            with conn:
+                counts['deleted'] = self.catalog.delete_meals(vanished, conn)
+
+        summary = {
+            'at': time.time(),
+            'full': full,
+            'complete': complete,
+            'duration': round(time.time() - started, 2),
+            'discovered': len(discovered - seen),
+            **counts
+        }
+        with conn:
+            self.catalog.set_state('last_sync', summary, conn)
+        return summary
+
+
+_catalog = None
+_catalog_lock = threading.Lock()
+
+
+def get_catalog():
+    """Katalog-Singleton, falls CATALOG_MODE=mirror aktiv ist, sonst None"""
+    global _catalog
+    if CATALOG_MODE != 'mirror':
+        return None
+    if _catalog is None:
+        with _catalog_lock:
+            if _catalog is None:
+                _catalog = MealCatalog(CATALOG_DB_PATH)
+    return _catalog
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Lokaler TheMealDB-Katalog')
+    parser.add_argument('--db', default=CATALOG_DB_PATH, help='Pfad zur SQLite-Datei')
+    sub = parser.add_subparsers(dest='command', required=True)
+
+    sync_parser = sub.add_parser('sync', help='TheMealDB crawlen (schreibt nur Änderungen)')
+    sync_parser.add_argument('--full', action='store_true', help='auch alle Zutaten-Filter crawlen')
+    sub.add_parser('stats', help='Katalog-Statistik ausgeben')
+    export_parser = sub.add_parser('export', help='Katalog als JSON-Dump exportieren')
+    export_parser.add_argument('path')
+    import_parser = sub.add_parser('import', help='JSON-Dump importieren')
+    import_parser.add_argument('path')
+    sub.add_parser('nutrition', help='Nährwerte aller Rezepte aus den Zutaten berechnen')
+
+    args = parser.parse_args()
+    catalog = MealCatalog(args.db)
+
+    if args.command == 'sync':
+        from upstream import mealdb
+        print(json.dumps(CatalogSync(catalog, mealdb).sync(full=args.full), indent=2))
+    elif args.command == 'stats':
+        print(json.dumps(catalog.stats(), indent=2))
+    elif args.command == 'export':
+        print(f"{catalog.export_dump(args.path)} Rezepte exportiert")
+    elif args.command == 'import':
+        print(json.dumps(catalog.import_dump(args.path), indent=2))
+    elif args.command == 'nutrition':
+        from nutrition import estimate_recipes_nutrition
+        started = time.time()
+        results = estimate_recipes_nutrition(catalog.all_meals())
+        sources = [result['nutrition']['source'] for result in results.values()]
+        print(json.dumps({
+            'meals': len(results),
+            'from_ingredients': sources.count('ingredients'),
+            'from_category': sources.count('category'),
+            'seconds': round(time.time() - started, 3),
+        }, indent=2))
+
+
+if __name__ == '__main__':
+    main()
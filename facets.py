@@ -0,0 +1,212 @@
+"""
+Facetten-Index für /api/filter
+
+Hält die Werte aus list.php?a=list, ?c=list und ?i=list im Speicher, damit
+ein Filterwert vorab klassifiziert und mit genau einer filter.php-Abfrage
+beantwortet werden kann (statt Area -> Category -> Ingredient nacheinander).
+"""
+import os
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from catalog import get_catalog
+from metrics import bind
+from upstream import mealdb
+
+
+FACET_REFRESH_SECONDS = float(os.getenv('FACET_REFRESH_SECONDS', str(6 * 3600)))
+FACET_RETRY_SECONDS = float(os.getenv('FACET_RETRY_SECONDS', '60'))
+
+# Reihenfolge entspricht der bisherigen Kaskade in filter_recipes
+FACET_KINDS = ('a', 'c', 'i')
+FACET_NAMES = {'a': 'area', 'c': 'category', 'i': 'ingredient'}
+LIST_FIELDS = {'a': 'strArea', 'c': 'strCategory', 'i': 'strIngredient'}
+
+
+def _normalize(value):
+    return ' '.join(str(value).replace('_', ' ').lower().split())
+
+
+def values_from_list_response(kind, response):
+    """Extrahiert die Werte aus einer list.php-Antwort"""
+    field = LIST_FIELDS[kind]
+    return [item[field] for item in (response or {}).get('meals') or [] if item.get(field)]
+
+
+class FacetIndex:
+    """Klassifiziert Filterwerte (exakt, case-insensitive, Präfix) nach Facette"""
+
+    def __init__(self, loader, refresh_seconds=FACET_REFRESH_SECONDS):
+        self.loader = loader
+        self.refresh_seconds = refresh_seconds
+        self._exact = {}     # normalisierter Wert -> (kind, Originalwert)
+        self._by_kind = {}   # kind -> {normalisierter Wert -> Originalwert}
+        self._sorted = []    # [(normalisierter Wert, kind, Originalwert)] für Präfix-Suche
+        self._loaded_at = 0.0
+        self._last_attempt = 0.0
+        self._lock = threading.Lock()
+        self._refreshing = False
+
+    def _build(self, lists):
+        exact = {}
+        by_kind = {kind: {} for kind in FACET_KINDS}
+        entries = []
+        for kind in FACET_KINDS:
+            for value in lists.get(kind, []):
+                key = _normalize(value)
+                by_kind[kind][key] = value
+                # Bei Kollisionen gewinnt die frühere Facette (Area vor Category vor Ingredient)
+                if key not in exact:
+                    exact[key] = (kind, value)
+                entries.append((key, FACET_KINDS.index(kind), kind, value))
+        entries.sort()
+        self._exact = exact
+        self._by_kind = by_kind
+        self._sorted = [(key, kind, value) for key, _, kind, value in entries]
+        self._loaded_at = time.time()
+
+    def refresh(self):
+        """Lädt die Facettenlisten neu; bei Fehlern bleibt der alte Stand erhalten"""
+        self._last_attempt = time.time()
+        try:
+            lists = self.loader()
+            if any(lists.get(kind) for kind in FACET_KINDS):
+                self._build(lists)
+        except Exception as e:
+            print(f"Error in facet refresh: {str(e)}")
+        finally:
+            self._refreshing = False
+
+    def ensure_loaded(self):
+        """
+        Lädt beim ersten Zugriff synchron, danach periodisch im Hintergrund
+        Lädt gerade ein anderer Thread, wird nicht gewartet (False -> Kaskade).
+        """
+        if not self._loaded_at:
+            # Nach einem Fehlschlag nicht bei jedem Request erneut laden
+            if time.time() - self._last_attempt < FACET_RETRY_SECONDS:
+                return False
+            if not self._lock.acquire(blocking=False):
+                return self.ready
+            try:
+                if not self._loaded_at:
+                    self._refreshing = True
+                    self.refresh()
+            finally:
+                self._lock.release()
+        elif time.time() - self._loaded_at > self.refresh_seconds and not self._refreshing:
+            with self._lock:
+                if self._refreshing:
+                    return self.ready
+                self._refreshing = True
+            threading.Thread(target=self.refresh, daemon=True).start()
+        return self.ready
+
+    @property
+    def ready(self):
+        return bool(self._loaded_at)
+
+    def classify(self, value):
+        """
+        Liefert (kind, kanonischer Wert) für einen Filterwert oder None
+        Zuerst exakter Treffer (case-insensitive), dann kürzester Präfix-Treffer.
+        """
+        key = _normalize(value or '')
+        if not key:
+            return None
+
+        if key in self._exact:
+            return self._exact[key]
+
+        # Binärsuche auf die sortierte Liste, dann alle Präfix-Treffer einsammeln
+        entries = self._sorted
+        lo, hi = 0, len(entries)
+        while lo < hi:
+            mid = (lo + hi) // 2
+            if entries[mid][0] < key:
+                lo = mid + 1
+            else:
+                hi = mid
+        matches = []
+        while lo < len(entries) and entries[lo][0].startswith(key):
+            matches.append(entries[lo])
+            lo += 1
+        if not matches:
+            return None
+
+        best = min(matches, key=lambda entry: (len(entry[0]), FACET_KINDS.index(entry[1])))
+        return best[1], best[2]
+
+    def canonical(self, kind, value):
+        """Schreibweise aus list.php für einen Wert einer bekannten Facette"""
+        return self._by_kind.get(kind, {}).get(_normalize(value or ''), value)
+
+    def stats(self):
+        counts = {FACET_NAMES[kind]: 0 for kind in FACET_KINDS}
+        for _, kind, _ in self._sorted:
+            counts[FACET_NAMES[kind]] += 1
+        return {**counts, 'loaded_at': self._loaded_at}
+
+
+def load_facet_lists():
+    """Facettenlisten aus dem Mirror oder von list.php (parallel, über den Response-Cache)"""
+    catalog = get_catalog()
+    if catalog:
+        return {kind: values_from_list_response(kind, catalog.get_list(kind)) for kind in FACET_KINDS}
+
+    def fetch(kind):
+        return values_from_list_response(kind, mealdb.cached_json('list.php', params={kind: 'list'}))
+
+    with ThreadPoolExecutor(max_workers=len(FACET_KINDS)) as executor:
+        return dict(zip(FACET_KINDS, executor.map(bind(fetch), FACET_KINDS)))
+
+
+facet_index = FacetIndex(load_facet_lists)
+
+
+def plan_filter(data, index=facet_index):
+    """
+    Wertet den /api/filter-Body aus
+    Liefert (facets, cascade_value):
+      - facets: {'a'|'c'|'i': Wert} für genau eine Abfrage, {} = kein Treffer
+      - cascade_value: Filterwert für die alte Kaskade, falls der Index fehlt
+    "filter" wird klassifiziert, "area"/"category"/"ingredient" werden kombiniert.
+    Widerspricht der klassifizierte Wert einer expliziten Facette derselben Art
+    (z.B. category=Dessert und filter=Pasta), ist die Schnittmenge leer.
+    """
+    # Zahlen u.ä. wie bisher als Text an filter.php weitergeben
+    filter_value = str(data.get('filter') or '')
+
+    # Optionale kombinierte Facetten, z.B. {"area": "Italian", "category": "Pasta"}
+    facets = {
+        kind: index.canonical(kind, str(data[name]))
+        for kind, name in FACET_NAMES.items() if data.get(name)
+    }
+
+    if not filter_value:
+        return facets, None
+    if not index.ready:
+        return facets, filter_value
+
+    # Filterwert vorab klassifizieren -> genau eine Abfrage
+    match = index.classify(filter_value)
+    if match is None:
+        return {}, None
+    kind, value = match
+    if kind in facets and _normalize(facets[kind]) != _normalize(value):
+        return {}, None
+    facets[kind] = value
+    return facets, None
+
+
+def cascade_facets(facets, filter_value):
+    """
+    Abfragen für die Kaskade ohne Index (Area -> Category -> Ingredient)
+    Explizite Facetten werden mit jeder Deutung des Filterwerts kombiniert;
+    eine Deutung, die einer expliziten Facette derselben Art widerspricht, entfällt.
+    """
+    return [
+        {**facets, kind: filter_value} for kind in FACET_KINDS
+        if kind not in facets or _normalize(facets[kind]) == _normalize(filter_value)
+    ]
@@ -0,0 +1,101 @@
+"""
+Open Food Facts: Projektion der Produktdaten und Such-Parameter
+"""
+
+# Nur die Felder, die project_nutrition braucht (statt des ganzen Produktdokuments)
+PRODUCT_FIELDS = 'product_name,nutrition_grades,nutriments,image_url,brands,categories'
+# Max. Produkte pro Seite bei /api/search-nutrition
+SEARCH_PAGE_SIZE_MAX = 100
+
+
+def project_nutrition(product):
+    """Extrahiere wichtige Nährwerte aus einem OFF-Produkt"""
+    nutriments = product.get('nutriments', {})
+    return {
+        'product_name': product.get('product_name', 'Unbekannt'),
+        'nutriscore': product.get('nutrition_grades', 'Nicht berechnet'),
+        'calories': nutriments.get('energy-kcal_100g', 0),
+        'protein': nutriments.get('proteins_100g', 0),
+        'carbs': nutriments.get('carbohydrates_100g', 0),
+        'fat': nutriments.get('fat_100g', 0),
+        'sugar': nutriments.get('sugars_100g', 0),
+        'fiber': nutriments.get('fiber_100g', 0),
+        'salt': nutriments.get('salt_100g', 0),
+        'image_url': product.get('image_url', ''),
+        'brands': product.get('brands', ''),
+        'categories': product.get('categories', ''),
+    }
+
+
+def product_from_response(data):
+    """Liefert das Produkt aus einer /api/v2/product-Antwort oder None"""
+    if data.get('status') == 1 and data.get('product'):
+        return data['product']
+    return None
+
+
+def product_params():
+    """Query-Parameter für /api/v2/product/<barcode>"""
+    return {'fields': PRODUCT_FIELDS}
+
+
+def nutrition_from_response(response):
+    """
+    Projizierte Nährwerte aus einer Produkt-Antwort (requests oder httpx)
+    None, wenn OFF den Barcode nicht kennt (404 bzw. status 0)
+    """
+    if response.status_code == 404:
+        return None
+    response.raise_for_status()
+    product = product_from_response(response.json())
+    return project_nutrition(product) if product else None
+
+
+def bulk_nutrition_result(barcodes, invalid, found, errors):
+    """Antwort für /api/nutrition/batch in der Reihenfolge der Anfrage"""
+    products = {code: found[code] for code in barcodes if found.get(code) is not None}
+    return {
+        'success': True,
+        'products': products,
+        'not_found': [code for code in barcodes if code in found and found[code] is None],
+        'errors': {code: str(errors[code]) for code in barcodes if code in errors},
+        'invalid': invalid,
+        'count': len(products),
+    }
+
+
+def _positive_int(value, default):
+    try:
+        value = int(value)
+    except (TypeError, ValueError):
+        return default
+    return value if value > 0 else default
+
+
+def search_query(data):
+    """Normalisierte Suchanfrage: Nutri-Score, Kategorie, Sortierung und Seite"""
+    return {
+        'grade': str(data.get('nutriscore', 'a')).lower(),  # a, b, c, d, e
+        'category': data.get('category', ''),
+        'sort': data.get('sort'),
+        'descending': str(data.get('order', 'asc')).lower() == 'desc',
+        'page': _positive_int(data.get('page'), 1),
+        'page_size': min(_positive_int(data.get('page_size'), 20), SEARCH_PAGE_SIZE_MAX),
+    }
+
+
+def search_params(data):
+    """Open Food Facts Search API Parameter aus dem Request-Body"""
+    query = search_query(data)
+
+    params = {
+        'nutrition_grades_tags': query['grade'],
+        'fields': 'code,product_name,nutrition_grades,nutriments,image_url,brands',
+        'page': query['page'],
+        'page_size': query['page_size']
+    }
+
+    if query['category']:
+        params['categories_tags_en'] = query['category']
+
+    return params
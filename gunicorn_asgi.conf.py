@@ -0,0 +1,31 @@
+"""
+gunicorn-Konfiguration für den ASGI-Einstiegspunkt (asgi.py)
+
+    gunicorn -c gunicorn_asgi.conf.py asgi:app
+
+Jeder Worker ist ein uvicorn-Event-Loop (asgi_worker.py); ein wartender
+Upstream-Call belegt dort nur eine Coroutine statt eines ganzen Workers.
+Mit LIMIT_CONCURRENCY=4096 (Standard) hält ein Prozess einige tausend
+gleichzeitige Requests. Das Limit für offene
+Dateien muss dazu passen (z.B. `ulimit -n 65535`).
+"""
+import multiprocessing
+import os
+
+import startup
+
+bind = os.getenv('BIND', '0.0.0.0:5000')
+workers = int(os.getenv('WEB_CONCURRENCY', str(multiprocessing.cpu_count())))
+worker_class = 'asgi_worker.MealPrepUvicornWorker'
+backlog = int(os.getenv('BACKLOG', '4096'))
+
+# KI-Pläne können lange dauern; Keep-Alive für Browser und Load Balancer
+timeout = int(os.getenv('WORKER_TIMEOUT', '120'))
+graceful_timeout = 30
+keepalive = 5
+
+# PRELOAD=1: App einmal im Master laden; mit WARMUP=1 dort auch aufwärmen,
+# die Worker erben Caches und Tabellen copy-on-write (siehe startup.py)
+preload_app = os.getenv('PRELOAD', '0') == '1'
+when_ready = startup.when_ready
+post_worker_init = startup.post_worker_init
@@ -0,0 +1,29 @@
+"""
+gunicorn-Konfiguration für den WSGI-Betrieb (main.py)
+
+    gunicorn -c gunicorn_wsgi.conf.py 'main:create_app()'
+
+gthread-Worker: jeder Prozess bedient THREADS Requests gleichzeitig.
+Mit PRELOAD=1 und WARMUP=1 wird die App einmal im Master geladen und
+aufgewärmt, bevor die Worker geforkt werden (siehe startup.py).
+"""
+import multiprocessing
+import os
+
+import startup
+
+bind = os.getenv('BIND', '0.0.0.0:5000')
+workers = int(os.getenv('WEB_CONCURRENCY', str(multiprocessing.cpu_count())))
+worker_class = 'gthread'
+threads = int(os.getenv('THREADS', '8'))
+
+# KI-Pläne können lange dauern; Keep-Alive für Browser und Load Balancer
+timeout = int(os.getenv('WORKER_TIMEOUT', '120'))
+graceful_timeout = 30
+keepalive = 5
+
+# PRELOAD=1: App einmal im Master laden; mit WARMUP=1 dort auch aufwärmen,
+# die Worker erben Caches und Tabellen copy-on-write
+preload_app = os.getenv('PRELOAD', '0') == '1'
+when_ready = startup.when_ready
+post_worker_init = startup.post_worker_init
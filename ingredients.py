@@ -0,0 +1,284 @@
+"""
+Zutaten-Hilfsfunktionen: Mengen parsen, normalisieren und aggregieren
+
+Wird von der Einkaufsliste genutzt, um doppelte Zutaten aus mehreren
+Rezepten zusammenzufassen ("2 tbsp" + "1/2 cup" -> "150 ml").
+"""
+import re
+from collections import OrderedDict
+
+
+# ==========================================
+# EINHEITEN
+# ==========================================
+# Einheit -> (Dimension, Faktor zur Basiseinheit g bzw. ml)
+UNITS = {
+    # Masse
+    'g': ('mass', 1.0), 'gr': ('mass', 1.0), 'gram': ('mass', 1.0), 'grams': ('mass', 1.0),
+    'gramm': ('mass', 1.0),
+    'kg': ('mass', 1000.0), 'kilo': ('mass', 1000.0), 'kilogram': ('mass', 1000.0),
+    'kilograms': ('mass', 1000.0),
+    'mg': ('mass', 0.001),
+    'oz': ('mass', 28.35), 'ounce': ('mass', 28.35), 'ounces': ('mass', 28.35),
+    'lb': ('mass', 453.6), 'lbs': ('mass', 453.6), 'pound': ('mass', 453.6), 'pounds': ('mass', 453.6),
+
+    # Volumen
+    'ml': ('volume', 1.0), 'millilitre': ('volume', 1.0), 'milliliter': ('volume', 1.0),
+    'millilitres': ('volume', 1.0), 'milliliters': ('volume', 1.0),
+    'cl': ('volume', 10.0), 'dl': ('volume', 100.0),
+    'l': ('volume', 1000.0), 'litre': ('volume', 1000.0), 'liter': ('volume', 1000.0),
+    'litres': ('volume', 1000.0), 'liters': ('volume', 1000.0),
+    'tsp': ('volume', 5.0), 'teaspoon': ('volume', 5.0), 'teaspoons': ('volume', 5.0),
+    'tbsp': ('volume', 15.0), 'tbs': ('volume', 15.0), 'tblsp': ('volume', 15.0), 'tbls': ('volume', 15.0),
+    'tablespoon': ('volume', 15.0), 'tablespoons': ('volume', 15.0),
+    'cup': ('volume', 240.0), 'cups': ('volume', 240.0),
+    'fl oz': ('volume', 29.57), 'floz': ('volume', 29.57),
+    'pint': ('volume', 473.0), 'pints': ('volume', 473.0),
+    'quart': ('volume', 946.0), 'quarts': ('volume', 946.0),
+}
+
+# Zähleinheiten, die nicht umgerechnet werden (Plural -> Singular)
+COUNT_UNITS = {
+    'pinch': 'pinch', 'pinches': 'pinch',
+    'dash': 'dash', 'dashes': 'dash',
+    'clove': 'clove', 'cloves': 'clove',
+    'can': 'can', 'cans': 'can', 'tin': 'can', 'tins': 'can',
+    'slice': 'slice', 'slices': 'slice',
+    'handful': 'handful', 'handfuls': 'handful',
+    'bunch': 'bunch', 'bunches': 'bunch',
+    'sprig': 'sprig', 'sprigs': 'sprig',
+    'stick': 'stick', 'sticks': 'stick',
+    'piece': 'piece', 'pieces': 'piece',
+    'packet': 'packet', 'packets': 'packet', 'package': 'packet', 'pkg': 'packet',
+    'leaf': 'leaf', 'leaves': 'leaf',
+    'drop': 'drop', 'drops': 'drop',
+}
+
+# Richtwerte in Gramm pro Zähleinheit (für die Nährwertberechnung)
+COUNT_UNIT_GRAMS = {
+    'pinch': 0.4, 'dash': 0.6, 'clove': 5.0, 'can': 400.0, 'slice': 25.0, 'handful': 30.0,
+    'bunch': 30.0, 'sprig': 1.0, 'stick': 113.0, 'packet': 200.0, 'leaf': 0.5, 'drop': 0.05,
+}
+DEFAULT_PIECE_GRAMS = 50.0
+DEFAULT_DENSITY = 1.0
+
+UNICODE_FRACTIONS = {
+    '½': 0.5, '⅓': 1 / 3, '⅔': 2 / 3, '¼': 0.25, '¾': 0.75,
+    '⅕': 0.2, '⅛': 0.125, '⅜': 0.375, '⅝': 0.625, '⅞': 0.875,
+}
+
+# Zahl: "1 1/2", "1/2", "1.5", "1,5", "2"
+NUMBER_PATTERN = re.compile(r'^(\d+\s+\d+/\d+|\d+/\d+|\d+(?:[.,]\d+)?)\s*(?:-\s*\d+(?:[.,]\d+)?)?\s*')
+UNIT_PATTERN = re.compile(r'^(fl\.?\s*oz|[a-zA-Z]+)\.?')
+
+# Gleiche Kategorien wie categorizeIngredient() im Frontend
+INGREDIENT_CATEGORIES = OrderedDict([
+    ('🥩 Fleisch & Fisch', ['chicken', 'beef', 'pork', 'fish', 'salmon', 'tuna', 'turkey', 'lamb', 'meat']),
+    ('🥬 Gemüse & Obst', ['tomato', 'onion', 'garlic', 'pepper', 'carrot', 'potato', 'lettuce', 'apple', 'banana',
+                         'lemon']),
+    ('🥛 Milchprodukte', ['milk', 'cheese', 'butter', 'cream', 'yogurt', 'egg']),
+    ('🌾 Getreide & Backwaren', ['rice', 'pasta', 'bread', 'flour', 'noodles']),
+    ('🧂 Gewürze & Öle', ['salt', 'pepper', 'oil', 'sugar', 'spice', 'herb']),
+    ('🥫 Konserven', ['tomato paste', 'stock', 'broth']),
+])
+DEFAULT_CATEGORY = '📦 Sonstiges'
+
+
+def _parse_number(text):
+    text = text.replace(',', '.')
+    if ' ' in text:
+        whole, fraction = text.split(None, 1)
+        return float(whole) + _parse_number(fraction)
+    if '/' in text:
+        numerator, denominator = text.split('/')
+        return float(numerator) / float(denominator) if float(denominator) else 0.0
+    return float(text)
+
+
+def parse_measure(measure):
+    """
+    Zerlegt eine Mengenangabe in (Menge, Einheit)
+    Masse wird in 'g', Volumen in 'ml' normalisiert, Zähleinheiten bleiben
+    erhalten ('clove', 'pinch', ...), reine Zahlen werden zu 'pc'.
+    Nicht parsebare Angaben ("to taste") liefern (None, None).
+    """
+    text = (measure or '').strip().lower()
+    if not text:
+        return None, None
+
+    # "a pinch", "an onion" -> 1
+    text = re.sub(r'^(?:a|an|one)\s+', '1 ', text)
+
+    # Unicode-Brüche ("1½" -> "1 1/2"-Äquivalent)
+    quantity = None
+    for symbol, value in UNICODE_FRACTIONS.items():
+        if symbol in text:
+            head, _, tail = text.partition(symbol)
+            head = head.strip()
+            try:
+                quantity = (float(head) if head else 0.0) + value
+            except ValueError:
+                return None, None
+            text = tail.strip()
+            break
+
+    if quantity is None:
+        match = NUMBER_PATTERN.match(text)
+        if match:
+            quantity = _parse_number(match.group(1).strip())
+            text = text[match.end():]
+
+    unit_match = UNIT_PATTERN.match(text)
+    unit_text = re.sub(r'[\s.]', '', unit_match.group(1)) if unit_match else ''
+    if unit_text == 'floz':
+        unit_text = 'fl oz'
+
+    if unit_text in UNITS:
+        dimension, factor = UNITS[unit_text]
+        base = 'g' if dimension == 'mass' else 'ml'
+        return (quantity if quantity is not None else 1.0) * factor, base
+
+    if unit_text in COUNT_UNITS:
+        return (quantity if quantity is not None else 1.0), COUNT_UNITS[unit_text]
+
+    if quantity is not None:
+        return quantity, 'pc'
+
+    return None, None
+
+
+def measure_to_grams(measure, density=None, piece_grams=None):
+    """
+    Rechnet eine Mengenangabe in Gramm um
+    Volumen über die Dichte der Zutat (g/ml), Stückangaben über ihr
+    Stückgewicht, sonstige Zähleinheiten über COUNT_UNIT_GRAMS.
+    Nicht parsebare Angaben liefern None.
+    """
+    quantity, unit = parse_measure(measure)
+    if quantity is None:
+        return None
+    if unit == 'g':
+        return quantity
+    if unit == 'ml':
+        return quantity * (density or DEFAULT_DENSITY)
+    if unit in ('pc', 'piece'):
+        return quantity * (piece_grams or DEFAULT_PIECE_GRAMS)
+    return quantity * COUNT_UNIT_GRAMS.get(unit, DEFAULT_PIECE_GRAMS)
+
+
+def categorize_ingredient(ingredient):
+    """Ordnet eine Zutat einer Einkaufslisten-Kategorie zu"""
+    lower = ingredient.lower()
+    for category, keywords in INGREDIENT_CATEGORIES.items():
+        if any(keyword in lower for keyword in keywords):
+            return category
+    return DEFAULT_CATEGORY
+
+
+def format_amount(quantity, unit):
+    """Formatiert eine normalisierte Menge lesbar ("1500 g" -> "1.5 kg")"""
+    if unit == 'g' and quantity >= 1000:
+        quantity, unit = quantity / 1000, 'kg'
+    elif unit == 'ml' and quantity >= 1000:
+        quantity, unit = quantity / 1000, 'l'
+
+    if quantity >= 10:
+        number = str(int(round(quantity)))
+    else:
+        number = f"{quantity:.2f}".rstrip('0').rstrip('.')
+
+    return number if unit == 'pc' else f"{number} {unit}"
+
+
+def extract_ingredients(meal):
+    """Liest strIngredient1..20 / strMeasure1..20 aus einem TheMealDB-Meal"""
+    ingredients = []
+    for i in range(1, 21):
+        ingredient = meal.get(f'strIngredient{i}') or ''
+        measure = meal.get(f'strMeasure{i}') or ''
+        if ingredient.strip():
+            ingredients.append({
+                'ingredient': ingredient.strip(),
+                'measure': measure.strip()
+            })
+    return ingredients
+
+
+def ingredient_key(name):
+    """Schlüssel zum Zusammenfassen gleicher Zutaten (Groß-/Kleinschreibung, Leerzeichen egal)"""
+    return ' '.join(name.lower().split())
+
+
+def ingredient_contribution(meal):
+    """
+    Beitrag eines Rezepts zur Einkaufsliste als [[key, name, unit, quantity]]
+    Nicht parsebare Angaben haben unit None und den Originaltext als quantity.
+    """
+    contribution = []
+    for entry in extract_ingredients(meal):
+        name, measure = entry['ingredient'], entry['measure']
+        quantity, unit = parse_measure(measure)
+        if quantity is not None:
+            contribution.append([ingredient_key(name), name, unit, quantity])
+        else:
+            contribution.append([ingredient_key(name), name, None, measure])
+    return contribution
+
+
+class IngredientAggregator:
+    """Fasst Zutaten mehrerer Rezepte zusammen, gruppiert nach Kategorie"""
+
+    def __init__(self):
+        self.items = OrderedDict()
+
+    def add(self, name, measure, times=1):
+        item = self.item(name)
+        item['occurrences'] += times
+
+        quantity, unit = parse_measure(measure)
+        if quantity is not None:
+            item['amounts'][unit] = item['amounts'].get(unit, 0.0) + quantity * times
+        elif measure and measure.lower() not in (m.lower() for m in item['other']):
+            item['other'].append(measure)
+
+    def item(self, name):
+        """Eintrag für eine Zutat (wird beim ersten Zugriff angelegt)"""
+        key = ingredient_key(name)
+        item = self.items.get(key)
+        if item is None:
+            item = self.items[key] = {
+                'name': name,
+                'category': categorize_ingredient(name),
+                'amounts': OrderedDict(),
+                'other': [],
+                'occurrences': 0,
+            }
+        return item
+
+    def add_meal(self, meal, times=1):
+        for entry in extract_ingredients(meal):
+            self.add(entry['ingredient'], entry['measure'], times)
+
+    def to_item(self, item):
+        parts = [format_amount(quantity, unit) for unit, quantity in item['amounts'].items()]
+        parts.extend(item['other'])
+        return {
+            'name': item['name'],
+            'category': item['category'],
+            'measure': ' + '.join(parts),
+            'amounts': [
+                {'quantity': round(quantity, 2), 'unit': unit}
+                for unit, quantity in item['amounts'].items()
+            ],
+            'occurrences': item['occurrences'],
+        }
+
+    def grouped(self):
+        """Liefert {Kategorie: [Items]} in fester Kategorie-Reihenfolge"""
+        order = list(INGREDIENT_CATEGORIES) + [DEFAULT_CATEGORY]
+        grouped = OrderedDict((category, []) for category in order)
+        for item in self.items.values():
+            grouped[item['category']].append(self.to_item(item))
+        for items in grouped.values():
+            items.sort(key=lambda i: i['name'].lower())
+        return OrderedDict((category, items) for category, items in grouped.items() if items)
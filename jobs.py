@@ -0,0 +1,524 @@
+"""
+Job-Queue für KI-Wochenpläne
+
+Ein KI-Plan hält einen Web-Worker für den ganzen OpenAI-Call samt Anreicherung
+fest. Im Job-Modus antwortet POST /api/generate-ai-plan/jobs sofort mit einer
+Job-ID; ein begrenzter Pool von Hintergrund-Threads erzeugt die Pläne, der
+Client fragt den Status ab (GET .../jobs/<id>) oder abonniert ihn als
+Server-Sent Events (GET .../jobs/<id>/events).
+
+Backends:
+  - im Prozess (Standard): Jobs im Speicher, nur der annehmende Worker kennt sie
+  - SQLite (JOBS_SQLITE_PATH): alle gunicorn-Worker teilen sich die Jobs; jeder
+    Prozess holt wartende Jobs ab, jeder kann den Status beantworten
+
+Zulassung: höchstens JOBS_MAX_QUEUE wartende Jobs und JOBS_MAX_PER_CLIENT
+offene Jobs pro Client, sonst JobRejected (503 bzw. 429 mit Retry-After).
+Client ist die Adresse aus request.remote_addr; hinter einem Reverse-Proxy
+nur mit TRUSTED_PROXY_HOPS (main.py), sonst teilen sich alle Nutzer das Limit.
+Jobs, die länger als JOBS_TIMEOUT laufen oder länger als JOBS_QUEUE_TIMEOUT
+warten, schlagen fehl; die Deadline begrenzt dabei auch alle Upstream-Calls.
+"""
+import contextvars
+import json
+import math
+import os
+import sqlite3
+import threading
+import time
+import uuid
+from collections import deque
+from contextlib import contextmanager
+
+from metrics import registry, start_request
+from resilience import start_deadline
+from sqlitedb import ThreadLocalConnection
+
+
+# ==========================================
+# KONFIGURATION
+# ==========================================
+# Leer = Jobs nur im Speicher des jeweiligen Worker-Prozesses
+JOBS_SQLITE_PATH = os.getenv('JOBS_SQLITE_PATH', '')
+# Hintergrund-Threads pro Prozess
+JOBS_WORKERS = int(os.getenv('JOBS_WORKERS', '4'))
+JOBS_MAX_QUEUE = int(os.getenv('JOBS_MAX_QUEUE', '50'))
+JOBS_MAX_PER_CLIENT = int(os.getenv('JOBS_MAX_PER_CLIENT', '3'))
+JOBS_TIMEOUT = float(os.getenv('JOBS_TIMEOUT', '90'))
+JOBS_QUEUE_TIMEOUT = float(os.getenv('JOBS_QUEUE_TIMEOUT', '120'))
+# So lange bleiben fertige Jobs abrufbar
+JOBS_RESULT_TTL = float(os.getenv('JOBS_RESULT_TTL', '3600'))
+# Abfrageintervall der SQLite-Worker und der Event-Streams
+JOBS_POLL_INTERVAL = float(os.getenv('JOBS_POLL_INTERVAL', '0.5'))
+
+OPEN_STATES = ('queued', 'running')
+
+plan_jobs_total = registry.counter(
+    'mealprep_plan_jobs_total', 'KI-Plan-Jobs nach Ergebnis (done, failed, timeout, expired, rejected)', ('result',))
+plan_job_duration = registry.histogram(
+    'mealprep_plan_job_duration_seconds', 'Wartezeit und Laufzeit der KI-Plan-Jobs', ('phase',))
+
+
+class JobRejected(Exception):
+    """Job wurde nicht angenommen (Queue voll oder zu viele offene Jobs des Clients)"""
+
+    def __init__(self, reason, retry_after=1):
+        message = {
+            'queue_full': 'Zu viele KI-Pläne in Arbeit, bitte später erneut versuchen',
+            'client_limit': 'Zu viele offene KI-Pläne für diesen Client',
+        }.get(reason, reason)
+        super().__init__(message)
+        self.reason = reason
+        self.status = 429 if reason == 'client_limit' else 503
+        self.retry_after = max(1, int(math.ceil(retry_after)))
+
+
+def _new_job(params, client):
+    return {
+        'id': uuid.uuid4().hex,
+        'status': 'queued',
+        'client': client,
+        'params': params,
+        'result': None,
+        'error': None,
+        'created_at': time.time(),
+        'started_at': None,
+        'finished_at': None,
+    }
+
+
+# ==========================================
+# BACKEND: IM PROZESS
+# ==========================================
+class MemoryJobBackend:
+    """Jobs im Speicher; Worker werden über eine Condition geweckt"""
+
+    shared = False
+
+    def __init__(self):
+        self._jobs = {}        # id -> Job (Einfügereihenfolge = Alter)
+        self._queue = deque()  # IDs wartender Jobs
+        self._cond = threading.Condition()
+
+    def add(self, job, max_queue, max_per_client):
+        """Legt den Job an; liefert den Ablehnungsgrund oder None"""
+        with self._cond:
+            if len(self._queue) >= max_queue:
+                return 'queue_full'
+            if max_per_client and sum(
+                1 for other in self._jobs.values()
+                if other['client'] == job['client'] and other['status'] in OPEN_STATES
+            ) >= max_per_client:
+                return 'client_limit'
+            self._jobs[job['id']] = job
+            self._queue.append(job['id'])
+            self._cond.notify_all()
+            return None
+
+    def claim(self, timeout):
+        """Nächster wartender Job (jetzt 'running') oder None nach timeout Sekunden"""
+        with self._cond:
+            if not self._queue:
+                self._cond.wait(timeout)
+            while self._queue:
+                job = self._jobs.get(self._queue.popleft())
+                if job is None or job['status'] != 'queued':
+                    continue
+                job.update(status='running', started_at=time.time())
+                self._cond.notify_all()
+                return dict(job)
+            return None
+
+    def update(self, job_id, expected, **fields):
+        """Ändert den Job nur, wenn er noch im Zustand expected ist (sonst False)"""
+        with self._cond:
+            job = self._jobs.get(job_id)
+            if job is None or job['status'] != expected:
+                return False
+            job.update(fields)
+            self._cond.notify_all()
+            return True
+
+    def get(self, job_id):
+        with self._cond:
+            job = self._jobs.get(job_id)
+            if job is None:
+                return None
+            job = dict(job)
+            if job['status'] == 'queued':
+                job['position'] = self._queue.index(job_id) + 1 if job_id in self._queue else 1
+            return job
+
+    def wait(self, job_id, status, timeout):
+        """Wartet, bis sich etwas an den Jobs ändert (höchstens timeout Sekunden)"""
+        with self._cond:
+            job = self._jobs.get(job_id)
+            if job is not None and job['status'] == status:
+                self._cond.wait(timeout)
+
+    def open_jobs(self):
+        """[(id, status, created_at, started_at)] aller wartenden und laufenden Jobs"""
+        with self._cond:
+            return [
+                (job['id'], job['status'], job['created_at'], job['started_at'])
+                for job in self._jobs.values() if job['status'] in OPEN_STATES
+            ]
+
+    def prune(self, finished_before):
+        with self._cond:
+            for job_id in [
+                job_id for job_id, job in self._jobs.items()
+                if job['finished_at'] is not None and job['finished_at'] < finished_before
+            ]:
+                del self._jobs[job_id]
+
+    def counts(self):
+        with self._cond:
+            counts = {}
+            for job in self._jobs.values():
+                counts[job['status']] = counts.get(job['status'], 0) + 1
+            return counts
+
+
+# ==========================================
+# BACKEND: SQLITE (GETEILT ZWISCHEN WORKERN)
+# ==========================================
+class SQLiteJobBackend:
+    """Jobs in einer SQLite-Datei; Worker aller Prozesse holen sich wartende Jobs per Polling"""
+
+    shared = True
+
+    def __init__(self, path, poll_interval=JOBS_POLL_INTERVAL):
+        self.path = path
+        self.poll_interval = poll_interval
+        # Autocommit, Transaktionen explizit über _transaction()
+        self._db = ThreadLocalConnection(path, isolation_level=None)
+        self._conn = self._db.get
+        conn = self._conn()
+        conn.execute(
+            'CREATE TABLE IF NOT EXISTS plan_jobs ('
+            ' id TEXT PRIMARY KEY,'
+            ' status TEXT NOT NULL,'
+            ' client TEXT,'
+            ' params TEXT NOT NULL,'
+            ' result TEXT,'
+            ' error TEXT,'
+            ' created_at REAL NOT NULL,'
+            ' started_at REAL,'
+            ' finished_at REAL)'
+        )
+        conn.execute('CREATE INDEX IF NOT EXISTS idx_plan_jobs_status ON plan_jobs (status, created_at)')
+
+    @contextmanager
+    def _transaction(self):
+        # IMMEDIATE: Schreibsperre sofort, damit Prüfen und Schreiben atomar sind
+        conn = self._conn()
+        conn.execute('BEGIN IMMEDIATE')
+        try:
+            yield conn
+        except BaseException:
+            conn.execute('ROLLBACK')
+            raise
+        conn.execute('COMMIT')
+
+    @staticmethod
+    def _row_to_job(row):
+        job_id, status, client, params, result, error, created_at, started_at, finished_at = row
+        return {
+            'id': job_id,
+            'status': status,
+            'client': client,
+            'params': json.loads(params),
+            'result': json.loads(result) if result is not None else None,
+            'error': error,
+            'created_at': created_at,
+            'started_at': started_at,
+            'finished_at': finished_at,
+        }
+
+    def add(self, job, max_queue, max_per_client):
+        with self._transaction() as conn:
+            queued = conn.execute("SELECT COUNT(*) FROM plan_jobs WHERE status = 'queued'").fetchone()[0]
+            if queued >= max_queue:
+                return 'queue_full'
+            if max_per_client:
+                open_jobs = conn.execute(
+                    "SELECT COUNT(*) FROM plan_jobs WHERE client = ? AND status IN ('queued', 'running')",
+                    (job['client'],)
+                ).fetchone()[0]
+                if open_jobs >= max_per_client:
+                    return 'client_limit'
+            conn.execute(
+                'INSERT INTO plan_jobs (id, status, client, params, created_at) VALUES (?, ?, ?, ?, ?)',
+                (job['id'], job['status'], job['client'], json.dumps(job['params']), job['created_at'])
+            )
+            return None
+
+    def claim(self, timeout):
+        deadline = time.monotonic() + timeout
+        while True:
+            with self._transaction() as conn:
+                row = conn.execute(
+                    "SELECT * FROM plan_jobs WHERE status = 'queued' ORDER BY created_at LIMIT 1"
+                ).fetchone()
+                if row is not None:
+                    started_at = time.time()
+                    conn.execute(
+                        "UPDATE plan_jobs SET status = 'running', started_at = ? WHERE id = ?",
+                        (started_at, row[0])
+                    )
+                    job = self._row_to_job(row)
+                    job.update(status='running', started_at=started_at)
+                    return job
+            left = deadline - time.monotonic()
+            if left <= 0:
+                return None
+            time.sleep(min(self.poll_interval, left))
+
+    def update(self, job_id, expected, **fields):
+        if 'result' in fields:
+            fields['result'] = json.dumps(fields['result']) if fields['result'] is not None else None
+        columns = ', '.join(f'{name} = ?' for name in fields)
+        cursor = self._conn().execute(
+            f'UPDATE plan_jobs SET {columns} WHERE id = ? AND status = ?',
+            (*fields.values(), job_id, expected)
+        )
+        return cursor.rowcount > 0
+
+    def get(self, job_id):
+        conn = self._conn()
+        row = conn.execute('SELECT * FROM plan_jobs WHERE id = ?', (job_id,)).fetchone()
+        if row is None:
+            return None
+        job = self._row_to_job(row)
+        if job['status'] == 'queued':
+            job['position'] = conn.execute(
+                "SELECT COUNT(*) FROM plan_jobs WHERE status = 'queued' AND created_at <= ?",
+                (job['created_at'],)
+            ).fetchone()[0]
+        return job
+
+    def wait(self, job_id, status, timeout):
+        time.sleep(min(self.poll_interval, timeout))
+
+    def open_jobs(self):
+        return self._conn().execute(
+            "SELECT id, status, created_at, started_at FROM plan_jobs WHERE status IN ('queued', 'running')"
+        ).fetchall()
+
+    def prune(self, finished_before):
+        self._conn().execute('DELETE FROM plan_jobs WHERE finished_at < ?', (finished_before,))
+
+    def counts(self):
+        return dict(self._conn().execute('SELECT status, COUNT(*) FROM plan_jobs GROUP BY status').fetchall())
+
+
+def create_job_backend():
+    """Baut das Backend gemäß Umgebungsvariablen (SQLite optional, sonst im Prozess)"""
+    if JOBS_SQLITE_PATH:
+        try:
+            return SQLiteJobBackend(JOBS_SQLITE_PATH)
+        except sqlite3.Error as e:
+            print(f"Error in job backend open, nutze Speicher: {str(e)}")
+    return MemoryJobBackend()
+
+
+# ==========================================
+# JOB-QUEUE
+# ==========================================
+class JobQueue:
+    """Nimmt Jobs an, führt runner(params) in einem begrenzten Thread-Pool aus und liefert den Status"""
+
+    def __init__(self, runner, backend=None, workers=JOBS_WORKERS, max_queue=JOBS_MAX_QUEUE,
+                 max_per_client=JOBS_MAX_PER_CLIENT, timeout=JOBS_TIMEOUT, queue_timeout=JOBS_QUEUE_TIMEOUT,
+                 result_ttl=JOBS_RESULT_TTL):
+        self.runner = runner
+        self.workers = max(1, workers)
+        self.max_queue = max_queue
+        self.max_per_client = max_per_client
+        self.timeout = timeout
+        self.queue_timeout = queue_timeout
+        self.result_ttl = result_ttl
+
+        self._backend = backend
+        self._lock = threading.Lock()
+        self._pid = None          # Threads überleben kein fork -> pro Prozess starten
+        self._threads = []
+        self._last_sweep = 0.0
+        self._durations = deque(maxlen=50)
+
+        self.stats = {
+            'submitted': 0,
+            'rejected': 0,
+            'done': 0,
+            'failed': 0,
+            'timeouts': 0,
+            'expired': 0,
+        }
+
+    @property
+    def backend(self):
+        if self._backend is None:
+            with self._lock:
+                if self._backend is None:
+                    self._backend = create_job_backend()
+        return self._backend
+
+    def start(self):
+        """Startet die Worker-Threads im aktuellen Prozess (beim ersten Zugriff)"""
+        if self._pid == os.getpid():
+            return
+        self.backend
+        with self._lock:
+            if self._pid == os.getpid():
+                return
+            self._threads = [
+                threading.Thread(target=self._work, name=f'plan-job-{i}', daemon=True)
+                for i in range(self.workers)
+            ]
+            for thread in self._threads:
+                thread.start()
+            self._pid = os.getpid()
+
+    def submit(self, params, client):
+        """Legt einen Job an und liefert dessen Status; wirft JobRejected bei Überlast"""
+        self.start()
+        self.sweep()
+        job = _new_job(params, client)
+        reason = self.backend.add(job, self.max_queue, self.max_per_client)
+        if reason is not None:
+            self.stats['rejected'] += 1
+            plan_jobs_total.inc(result='rejected')
+            raise JobRejected(reason, self.retry_after())
+        self.stats['submitted'] += 1
+        return self.get(job['id'])
+
+    def get(self, job_id):
+        """Job-Status (mit Position in der Queue) oder None"""
+        self.sweep()
+        return self.backend.get(job_id)
+
+    def wait(self, job_id, status, timeout):
+        """Blockiert, bis sich der Job (vermutlich) geändert hat, höchstens timeout Sekunden"""
+        self.backend.wait(job_id, status, timeout)
+
+    def retry_after(self):
+        """Geschätzte Sekunden, bis wieder Platz ist (wartende Jobs × mittlere Laufzeit / Worker)"""
+        counts = self.backend.counts()
+        runtime = sum(self._durations) / len(self._durations) if self._durations else 5.0
+        return max(1.0, counts.get('queued', 0) * runtime / self.workers)
+
+    def sweep(self):
+        """Lässt überfällige Jobs fehlschlagen und löscht alte Ergebnisse (höchstens einmal pro Sekunde)"""
+        now = time.time()
+        if now - self._last_sweep < 1.0:
+            return
+        self._last_sweep = now
+
+        for job_id, status, created_at, started_at in self.backend.open_jobs():
+            if status == 'queued' and now - created_at > self.queue_timeout:
+                if self.backend.update(job_id, 'queued', status='failed', finished_at=now,
+                                       error='Wartezeit in der Queue überschritten'):
+                    self.stats['expired'] += 1
+                    plan_jobs_total.inc(result='expired')
+            elif status == 'running' and started_at and now - started_at > self.timeout + JOBS_POLL_INTERVAL:
+                # Worker hängt oder Prozess ist weg; ein spätes Ergebnis wird verworfen
+                if self.backend.update(job_id, 'running', status='failed', finished_at=now,
+                                       error='Zeitlimit für den KI-Plan überschritten'):
+                    self.stats['timeouts'] += 1
+                    plan_jobs_total.inc(result='timeout')
+        self.backend.prune(now - self.result_ttl)
+
+    def _work(self):
+        while True:
+            try:
+                # Freie Worker räumen auch ab, damit hängende Jobs ohne Abfragen fehlschlagen
+                self.sweep()
+                job = self.backend.claim(timeout=1.0)
+                if job is not None:
+                    # Eigener, leerer Kontext pro Job (Phasen, Deadline)
+                    contextvars.Context().run(self._run, job)
+            except Exception as e:
+                print(f"Error in plan job worker: {str(e)}")
+                time.sleep(JOBS_POLL_INTERVAL)
+
+    def _run(self, job):
+        start_request()
+        start_deadline(self.timeout)
+        plan_job_duration.observe(job['started_at'] - job['created_at'], phase='queued')
+        try:
+            result = self.runner(job['params'])
+            status, error = 'done', None
+        except Exception as e:
+            print(f"Error in plan job {job['id']}: {str(e)}")
+            result, status, error = None, 'failed', str(e)
+
+        finished_at = time.time()
+        runtime = finished_at - job['started_at']
+        self._durations.append(runtime)
+        plan_job_duration.observe(runtime, phase='running')
+        if self.backend.update(job['id'], 'running', status=status, result=result, error=error,
+                               finished_at=finished_at):
+            self.stats[status] += 1
+            plan_jobs_total.inc(result=status)
+
+    def get_stats(self):
+        return {
+            **self.stats,
+            'jobs': self.backend.counts(),
+            'workers': self.workers,
+            'max_queue': self.max_queue,
+            'max_per_client': self.max_per_client,
+            'timeout': self.timeout,
+            'backend': 'sqlite' if self.backend.shared else 'memory',
+        }
+
+
+def job_status(job):
+    """Öffentliche Sicht auf einen Job (ohne Client und Parameter)"""
+    status = {
+        'success': job['status'] != 'failed',
+        'job_id': job['id'],
+        'status': job['status'],
+        'created_at': job['created_at'],
+        'started_at': job['started_at'],
+        'finished_at': job['finished_at'],
+    }
+    if job['status'] == 'queued':
+        status['position'] = job.get('position')
+    if job['status'] == 'done':
+        status['result'] = job['result']
+    if job['status'] == 'failed':
+        status['error'] = job['error']
+    return status
+
+
+def job_events(job, sent):
+    """
+    Events für einen Event-Stream seit dem zuletzt gesendeten Zustand sent
+    Liefert ([(event, data)], neuer Zustand, fertig?); 'status' nur bei Änderungen.
+    """
+    if job is None:
+        return [('error', {'success': False, 'error': 'Job nicht gefunden'})], sent, True
+
+    state = (job['status'], job.get('position'))
+    events = []
+    if state != sent:
+        events.append(('status', {'job_id': job['id'], 'status': job['status'], 'position': job.get('position')}))
+    if job['status'] == 'done':
+        events.append(('done', job['result']))
+    elif job['status'] == 'failed':
+        events.append(('error', {'success': False, 'error': job['error'], 'job_id': job['id']}))
+    return events, state, job['status'] not in OPEN_STATES
+
+
+def watch_job(queue, job_id, timeout=1.0):
+    """Synchroner Event-Strom eines Jobs bis 'done' oder 'error' (für WSGI)"""
+    sent = None
+    while True:
+        job = queue.get(job_id)
+        events, sent, finished = job_events(job, sent)
+        yield from events
+        if finished:
+            return
+        queue.wait(job_id, job['status'], timeout)
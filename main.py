@@ -1,28 +1,125 @@
-from flask import Flask, render_template, request, jsonify
-import requests
+import time
+# Importzeit der App (startup.record_import, Budget IMPORT_BUDGET)
+_import_started = time.perf_counter()
+
+from flask import Blueprint, Flask, Response, g, render_template, request, jsonify, stream_with_context
 import os
+import threading
 from dotenv import load_dotenv
-from openai import OpenAI
-import json
-import re
+from werkzeug.middleware.proxy_fix import ProxyFix
+
+from barcodes import BARCODE_BATCH_LIMIT, get_barcode_cache, normalize_barcode, read_barcode_request
+from catalog import get_catalog
+from facets import FACET_NAMES, cascade_facets, facet_index, plan_filter
+from metrics import (
+    finish_profile, observe_openai, observe_request, registry, server_timing, start_profile, start_request, timing
+)
+from foodfacts import bulk_nutrition_result, search_params, search_query
+from jobs import JobQueue, JobRejected, job_status, watch_job
+from nutrition import WEEK_DAYS, estimate_recipe_nutrition
+from offstore import get_off_store
+from planner import (
+    DAYS, FALLBACK_SEARCH_TERM, OPENAI_MAX_TOKENS, OPENAI_MODEL, OPENAI_TEMPERATURE, OPENAI_TIMEOUT,
+    MealIndex, PlanStreamParser, apply_thumbs, attach_meal_refs, build_meal_list, build_messages, build_prompt,
+    candidate_queries, parse_plan_response, plan_cache_key, plan_meta, plan_response, rank_candidates,
+    read_plan_request, replay_plan_events, sse_event
+)
+from plancache import plan_cache
+from planstore import PlanFull, PlanRateLimited, get_plan_store
+from resilience import (
+    UpstreamUnavailable, call_timeout, get_upstream_stats, guard, request_deadline, start_deadline, unavailable_body
+)
+from responses import FastJSONProvider, compact_meals, etag_matches, finish_flask_response, version_etag, wants_compact
+from solver import finish_streamed_plan, repair_plan, solve_week_plan
+from startup import get_startup_stats, record_import
+from upstream import fetch_meal_lists, filter_by_facets, lookup_meals, lookup_products, mealdb, mealdb_cache, off
+from weekplan import (
+    RECIPE_BATCH_LIMIT, count_plan_meals, nutrition_batch_result, plan_meal_id, prepare_plan_meals, read_plan_days,
+    shopping_list_result, split_known_nutrition
+)
 
 # Load environment variables
 load_dotenv()
 
-app = Flask(__name__)
-app.config['SECRET_KEY'] = os.getenv('SECRET_KEY', 'mealprep-secret-key-2026')
+# Anzahl vertrauenswürdiger Reverse-Proxys vor der App; request.remote_addr kommt
+# dann aus X-Forwarded-For (Client-Schlüssel für JOBS_MAX_PER_CLIENT, 0 = direkt)
+TRUSTED_PROXY_HOPS = int(os.getenv('TRUSTED_PROXY_HOPS', '0'))
+
+# Alle Routen; die App selbst baut create_app()
+routes = Blueprint('mealprep', __name__)
+
+# OpenAI Client (erst beim ersten KI-Plan, der Import von openai kostet allein ~0,2 s)
+_openai_clients = None
+_openai_lock = threading.Lock()
+
+
+def get_openai_client(shortened=False):
+    """
+    OpenAI-Client (einmal pro Prozess erzeugt)
+    shortened: ohne eigene Wiederholungen, wenn die Request-Deadline den Timeout schon gekürzt hat
+    """
+    global _openai_clients
+    if _openai_clients is None:
+        with _openai_lock:
+            if _openai_clients is None:
+                from openai import OpenAI
+                client = OpenAI(api_key=os.getenv('OPENAI_API_KEY'), timeout=OPENAI_TIMEOUT)
+                _openai_clients = (client, client.with_options(max_retries=0))
+    return _openai_clients[1 if shortened else 0]
+
+
+# ==========================================
+# METRIKEN (Latenz pro Route, Server-Timing, Profiling)
+# ==========================================
+@routes.before_app_request
+def start_request_metrics():
+    g.metrics_started = time.perf_counter()
+    g.profiler = start_profile()
+    start_request()
+    start_deadline(request_deadline(request.path))
+
+
+@routes.after_app_request
+def finish_request_metrics(response):
+    seconds = time.perf_counter() - g.metrics_started
+    route = request.url_rule.rule if request.url_rule else 'unmatched'
+    observe_request(route, request.method, response.status_code, seconds)
+    # Bei Streams nur die Phasen bis zum Senden der Header
+    response.headers['Server-Timing'] = server_timing(seconds)
+    return response
+
+
+@routes.teardown_app_request
+def finish_request_profile(error=None):
+    if 'metrics_started' in g:
+        route = request.url_rule.rule if request.url_rule else 'unmatched'
+        finish_profile(g.pop('profiler', None), route, time.perf_counter() - g.metrics_started)
 
-# API Configuration
-THEMEALDB_BASE_URL = "https://www.themealdb.com/api/json/v1/1"
 
-# OpenAI Client
-client = OpenAI(api_key=os.getenv('OPENAI_API_KEY'))
+# ==========================================
+# HTTP-CACHING UND KOMPRESSION (ETag/304, Cache-Control, gzip)
+# ==========================================
+@routes.after_app_request
+def finish_json_response(response):
+    return finish_flask_response(request, response)
+
+
+def not_modified(etag):
+    return Response(status=304, headers={'ETag': etag, 'Cache-Control': 'private, no-cache'})
+
+
+def unavailable_response(e):
+    """Schnelles 503 mit Retry-After, wenn ein Upstream abgelehnt wurde (Breaker, Bulkhead, Deadline)"""
+    response = jsonify(unavailable_body(e))
+    response.status_code = 503
+    response.headers['Retry-After'] = str(e.retry_after)
+    return response
 
 
 # ==========================================
 # ROUTE 1: STARTSEITE
 # ==========================================
-@app.route('/')
+@routes.route('/')
 def index():
     """Rendert Startseite"""
     return render_template('index.html')
@@ -31,14 +128,16 @@ def index():
 # ==========================================
 # ROUTE 2: KATEGORIEN ABRUFEN
 # ==========================================
-@app.route('/api/categories')
+@routes.route('/api/categories')
 def get_categories():
     """Holt alle Meal-Kategorien von TheMealDB"""
     try:
-        url = f"{THEMEALDB_BASE_URL}/categories.php"
-        response = requests.get(url, timeout=5)
-        response.raise_for_status()
-        return jsonify(response.json())
+        catalog = get_catalog()
+        if catalog and catalog.get_list('categories'):
+            return jsonify(catalog.get_list('categories'))
+        return jsonify(mealdb.cached_json('categories.php'))
+    except UpstreamUnavailable as e:
+        return unavailable_response(e)
     except Exception as e:
         return jsonify({'error': str(e)}), 500
 
@@ -46,7 +145,7 @@ def get_categories():
 # ==========================================
 # ROUTE 3: REZEPT-SUCHE
 # ==========================================
-@app.route('/api/search', methods=['POST'])
+@routes.route('/api/search', methods=['POST'])
 def search_recipes():
     """Sucht Rezepte nach Name oder Kategorie"""
     try:
@@ -54,17 +153,25 @@ def search_recipes():
         query = data.get('query', '')
         category = data.get('category', '')
 
+        catalog = get_catalog()
+
         if category:
-            url = f"{THEMEALDB_BASE_URL}/filter.php?c={category}"
+            if catalog:
+                result = catalog.filter(category=category)
+            else:
+                result = mealdb.cached_json('filter.php', params={'c': category})
         elif query:
-            url = f"{THEMEALDB_BASE_URL}/search.php?s={query}"
+            if catalog:
+                result = catalog.search(query)
+            else:
+                result = mealdb.cached_json('search.php', params={'s': query})
         else:
             return jsonify({'error': 'Query or category required'}), 400
 
-        response = requests.get(url, timeout=5)
-        response.raise_for_status()
-        return jsonify(response.json())
+        return jsonify(result)
 
+    except UpstreamUnavailable as e:
+        return unavailable_response(e)
     except Exception as e:
         print(f"Error in search_recipes: {str(e)}")
         return jsonify({'error': str(e)}), 500
@@ -73,36 +180,45 @@ def search_recipes():
 # ==========================================
 # ROUTE 4: FILTER
 # ==========================================
-@app.route('/api/filter', methods=['POST'])
+@routes.route('/api/filter', methods=['POST'])
 def filter_recipes():
     """Filtert Rezepte nach Ernährung, Küche oder Kategorie"""
     try:
         data = request.get_json()
-        filter_value = data.get('filter', '')
 
-        if not filter_value:
+        if not data.get('filter') and not any(data.get(name) for name in FACET_NAMES.values()):
             return jsonify({'error': 'Filter required'}), 400
 
-        # TheMealDB nutzt unterschiedliche Endpoints für verschiedene Filter
-        # Versuch 1: Nach Area (Küche)
-        url = f"{THEMEALDB_BASE_URL}/filter.php?a={filter_value}"
-        response = requests.get(url, timeout=5)
-        result = response.json()
-
-        # Falls keine Ergebnisse, versuch Category
-        if not result.get('meals'):
-            url = f"{THEMEALDB_BASE_URL}/filter.php?c={filter_value}"
-            response = requests.get(url, timeout=5)
-            result = response.json()
+        facet_index.ensure_loaded()
+        facets, filter_value = plan_filter(data)
+        catalog = get_catalog()
 
-        # Falls immer noch keine Ergebnisse, versuch Ingredient
-        if not result.get('meals'):
-            url = f"{THEMEALDB_BASE_URL}/filter.php?i={filter_value}"
-            response = requests.get(url, timeout=5)
-            result = response.json()
+        if not filter_value:
+            if not facets:
+                return jsonify({'meals': None})
+            if catalog:
+                return jsonify(catalog.filter(
+                    area=facets.get('a'),
+                    category=facets.get('c'),
+                    ingredient=facets.get('i')
+                ))
+            return jsonify(filter_by_facets(facets))
+
+        # Fallback ohne Facetten-Index: bisherige Kaskade, mit expliziten Facetten geschnitten
+        result = {'meals': None}
+        for query in cascade_facets(facets, filter_value):
+            if catalog:
+                # Lokaler Mirror: alle Versuche sind reine Index-Abfragen
+                result = catalog.filter(area=query.get('a'), category=query.get('c'), ingredient=query.get('i'))
+            else:
+                result = filter_by_facets(query)
+            if result.get('meals'):
+                break
 
         return jsonify(result)
 
+    except UpstreamUnavailable as e:
+        return unavailable_response(e)
     except Exception as e:
         print(f"Error in filter_recipes: {str(e)}")
         return jsonify({'error': str(e)}), 500
@@ -111,14 +227,18 @@ def filter_recipes():
 # ==========================================
 # ROUTE 5: REZEPT-DETAILS
 # ==========================================
-@app.route('/api/recipe/<meal_id>')
+@routes.route('/api/recipe/<meal_id>')
 def get_recipe_detail(meal_id):
-    """Holt Details zu einem spezifischen Rezept"""
+    """Holt Details zu einem spezifischen Rezept (?compact=1: ohne leere Felder, Zutaten als Liste)"""
     try:
-        url = f"{THEMEALDB_BASE_URL}/lookup.php?i={meal_id}"
-        response = requests.get(url, timeout=5)
-        response.raise_for_status()
-        return jsonify(response.json())
+        catalog = get_catalog()
+        if catalog:
+            result = catalog.lookup(meal_id)
+        else:
+            result = mealdb.cached_json('lookup.php', params={'i': meal_id})
+        return jsonify(compact_meals(result) if wants_compact(request.args) else result)
+    except UpstreamUnavailable as e:
+        return unavailable_response(e)
     except Exception as e:
         return jsonify({'error': str(e)}), 500
 
@@ -126,7 +246,7 @@ def get_recipe_detail(meal_id):
 # ==========================================
 # ROUTE 6: REZEPT-DETAIL-SEITE
 # ==========================================
-@app.route('/recipe/<meal_id>')
+@routes.route('/recipe/<meal_id>')
 def recipe_detail_page(meal_id):
     """Rendert Rezept-Detail-Seite"""
     return render_template('recipe_detail.html', meal_id=meal_id)
@@ -135,14 +255,14 @@ def recipe_detail_page(meal_id):
 # ==========================================
 # ROUTE 7: ZUFÄLLIGES REZEPT
 # ==========================================
-@app.route('/api/random')
+@routes.route('/api/random')
 def get_random_recipe():
-    """Gibt ein zufälliges Rezept zurück"""
+    """Gibt ein zufälliges Rezept zurück (?compact=1 wie bei /api/recipe/<meal_id>)"""
     try:
-        url = f"{THEMEALDB_BASE_URL}/random.php"
-        response = requests.get(url, timeout=5)
-        response.raise_for_status()
-        return jsonify(response.json())
+        result = mealdb.get_json('random.php')
+        return jsonify(compact_meals(result) if wants_compact(request.args) else result)
+    except UpstreamUnavailable as e:
+        return unavailable_response(e)
     except Exception as e:
         return jsonify({'error': str(e)}), 500
 
@@ -150,7 +270,7 @@ def get_random_recipe():
 # ==========================================
 # ROUTE 8: WOCHENPLAN-SEITE
 # ==========================================
-@app.route('/week-plan')
+@routes.route('/week-plan')
 def week_plan():
     """Rendert Wochenplan-Seite"""
     return render_template('week_plan.html')
@@ -159,7 +279,7 @@ def week_plan():
 # ==========================================
 # ROUTE 9: EINKAUFSLISTE-SEITE
 # ==========================================
-@app.route('/shopping-list')
+@routes.route('/shopping-list')
 def shopping_list():
     """Rendert Einkaufslisten-Seite"""
     return render_template('shopping_list.html')
@@ -168,7 +288,7 @@ def shopping_list():
 # ==========================================
 # ROUTE 10: AI-PLANNER SEITE
 # ==========================================
-@app.route('/ai-planner')
+@routes.route('/ai-planner')
 def ai_planner():
     """Rendert KI-Planer-Seite"""
     return render_template('ai_planner.html')
@@ -177,222 +297,129 @@ def ai_planner():
 # ==========================================
 # ROUTE 11: IMPRESSUM
 # ==========================================
-@app.route('/impressum')
+@routes.route('/impressum')
 def impressum():
     """Rendert Impressum-Seite"""
     return render_template('impressum.html')
 
 
+def fetch_plan_candidates(params):
+    """Hole Rezepte von TheMealDB basierend auf Präferenz (mehrere Abfragen parallel)"""
+    with timing('candidates'):
+        queries = candidate_queries(params['goal'])
+        meal_list = rank_candidates(queries, fetch_meal_lists(queries))
+
+        if not meal_list:
+            # Fallback: Random recipes
+            meal_list = build_meal_list(mealdb.cached_json(
+                'search.php', params={'s': FALLBACK_SEARCH_TERM}, timeout=10
+            ).get('meals', []))
+
+    return meal_list
+
+
+def generate_plan(params, meal_list):
+    """OpenAI-Call plus Auflösung der Rezepte (IDs, Bilder)"""
+    prompt = build_prompt(meal_list, params['goal'], params['calories'], params['protein'], params['dietary'])
+
+    # OpenAI API Call (Breaker offen -> UpstreamUnavailable -> lokaler Optimierer)
+    timeout, shortened = call_timeout('openai', OPENAI_TIMEOUT)
+    openai_client = get_openai_client(shortened)
+    with guard('openai'), observe_openai(OPENAI_MODEL) as call:
+        response = openai_client.chat.completions.create(
+            model=OPENAI_MODEL,
+            messages=build_messages(prompt),
+            temperature=OPENAI_TEMPERATURE,
+            max_tokens=OPENAI_MAX_TOKENS,
+            timeout=timeout
+        )
+        call.record_usage(response.usage)
+
+    with timing('enrich'):
+        # Parse Response
+        plan_data = parse_plan_response(response.choices[0].message.content)
+
+        # Füge Meal IDs und Bilder hinzu
+        missing_thumbs = attach_meal_refs(plan_data, meal_list)
+
+        # Nur wirklich fehlende Bilder nachladen (dedupliziert und parallel)
+        if missing_thumbs:
+            apply_thumbs(plan_data, missing_thumbs, lookup_meals(meal_id for _, _, meal_id in missing_thumbs))
+
+        if params['mode'] == 'hybrid':
+            # Ungültige, doppelte oder fehlende Slots lokal optimiert füllen
+            plan_data, _ = repair_plan(plan_data, meal_list, params)
+        elif not any(day in plan_data for day in DAYS):
+            raise ValueError('KI-Antwort enthielt keinen gültigen Plan')
+
+    return plan_data
+
+
+def build_ai_plan(params):
+    """Kandidaten, Plan (Cache, OpenAI oder lokaler Optimierer) und Antwort; None ohne passende Rezepte"""
+    # Erstelle Meal-Liste für KI
+    meal_list = fetch_plan_candidates(params)
+
+    if not meal_list:
+        return None
+
+    if params['mode'] == 'solver':
+        # Lokal optimiert in Millisekunden, ohne OpenAI-Call
+        with timing('solver'):
+            plan_data = solve_week_plan(meal_list, params)
+        return plan_response(plan_data, params, source='solver')
+
+    try:
+        # Gleiche Eingaben + Kandidaten -> gecachter Plan, gleichzeitige Anfragen teilen einen Call
+        plan_data = plan_cache.get_or_generate(
+            plan_cache_key(params, meal_list),
+            lambda: generate_plan(params, meal_list)
+        )
+        source = params['mode']
+    except Exception as e:
+        # Timeout, API-Fehler oder kein gültiges JSON -> lokaler Optimierer
+        print(f"Error in generate_ai_meal_plan (OpenAI), nutze lokalen Optimierer: {str(e)}")
+        with timing('solver'):
+            plan_data = solve_week_plan(meal_list, params)
+        source = 'solver'
+
+    return plan_response(plan_data, params, source=source)
+
+
+def run_plan_job(params):
+    """Runner für die Job-Queue: wie /api/generate-ai-plan, Fehler statt 400"""
+    result = build_ai_plan(params)
+    if result is None:
+        raise ValueError('Keine passenden Rezepte gefunden')
+    return result
+
+
+plan_jobs = JobQueue(run_plan_job)
+
+
 # ==========================================
 # ROUTE 12: KI-WOCHENPLAN GENERATOR
 # ==========================================
-@app.route('/api/generate-ai-plan', methods=['POST'])
+@routes.route('/api/generate-ai-plan', methods=['POST'])
 def generate_ai_meal_plan():
     """
     Generiert intelligenten Wochenplan basierend auf User-Zielen
     Nutzt OpenAI API + TheMealDB
     """
     try:
-        data = request.get_json()
-        goal = data.get('goal', 'Gesund essen')
-        calories = data.get('calories', 2000)
-        protein = data.get('protein', 100)
-        dietary_preference = data.get('dietary', '')
-
-        # Hole verfügbare Rezepte basierend auf Präferenz
-        search_terms = {
-            'Muskelaufbau': 'chicken',
-            'Abnehmen': 'salad',
-            'Vegan': 'vegan',
-            'Vegetarisch': 'vegetarian',
-            'Gesund essen': 'healthy',
-            'High Protein': 'chicken',
-            'Ausgewogen': 'chicken',
-            'Energie & Leistung': 'chicken'
-        }
-
-        search_term = search_terms.get(goal, 'chicken')
-
-        # Hole Rezepte von TheMealDB
-        meals_response = requests.get(
-            f"{THEMEALDB_BASE_URL}/search.php?s={search_term}",
-            timeout=10
-        )
-        available_meals = meals_response.json().get('meals', [])
+        params = read_plan_request(request.get_json())
 
-        if not available_meals:
-            # Fallback: Random recipes
-            meals_response = requests.get(
-                f"{THEMEALDB_BASE_URL}/search.php?s=chicken",
-                timeout=10
-            )
-            available_meals = meals_response.json().get('meals', [])
-
-        # Erstelle Meal-Liste für KI
-        meal_list = []
-        for meal in available_meals[:25]:
-            if meal:
-                meal_list.append({
-                    'id': meal['idMeal'],
-                    'name': meal['strMeal'],
-                    'category': meal.get('strCategory', 'Unknown'),
-                    'area': meal.get('strArea', 'Unknown')
-                })
-
-        if not meal_list:
+        result = build_ai_plan(params)
+        if result is None:
             return jsonify({
                 'success': False,
                 'error': 'Keine passenden Rezepte gefunden'
             }), 400
 
-        # KI-Prompt erstellen
-        prompt = f"""
-Du bist ein professioneller Ernährungsberater. Erstelle einen ausgewogenen 7-Tage Wochenplan.
-
-NUTZERZIEL: {goal}
-TAGESZIEL KALORIEN: {calories} kcal
-TAGESZIEL PROTEIN: {protein}g
-ERNÄHRUNGSPRÄFERENZ: {dietary_preference if dietary_preference else 'Keine Einschränkung'}
-
-VERFÜGBARE REZEPTE (nutze NUR diese):
-{chr(10).join([f"- {m['name']}" for m in meal_list[:20]])}
-
-AUFGABEN:
-1. Wähle für jeden Wochentag (Montag bis Sonntag) genau 3 Mahlzeiten aus
-2. Mahlzeiten: Frühstück, Mittagessen, Abendessen
-3. Nutze AUSSCHLIESSLICH Rezepte aus der obigen Liste
-4. Verteile Protein gleichmäßig über den Tag (Ziel: {protein}g/Tag)
-5. Achte auf Abwechslung - kein Rezept mehr als 2x pro Woche
-6. Berücksichtige das Ziel "{goal}"
-
-WICHTIG: Antworte AUSSCHLIESSLICH mit folgendem JSON-Format (keine Erklärungen drumherum):
-
-{{
-  "monday": {{
-    "breakfast": "Exakter Rezeptname aus Liste",
-    "lunch": "Exakter Rezeptname aus Liste",
-    "dinner": "Exakter Rezeptname aus Liste"
-  }},
-  "tuesday": {{
-    "breakfast": "Exakter Rezeptname aus Liste",
-    "lunch": "Exakter Rezeptname aus Liste",
-    "dinner": "Exakter Rezeptname aus Liste"
-  }},
-  "wednesday": {{
-    "breakfast": "Exakter Rezeptname aus Liste",
-    "lunch": "Exakter Rezeptname aus Liste",
-    "dinner": "Exakter Rezeptname aus Liste"
-  }},
-  "thursday": {{
-    "breakfast": "Exakter Rezeptname aus Liste",
-    "lunch": "Exakter Rezeptname aus Liste",
-    "dinner": "Exakter Rezeptname aus Liste"
-  }},
-  "friday": {{
-    "breakfast": "Exakter Rezeptname aus Liste",
-    "lunch": "Exakter Rezeptname aus Liste",
-    "dinner": "Exakter Rezeptname aus Liste"
-  }},
-  "saturday": {{
-    "breakfast": "Exakter Rezeptname aus Liste",
-    "lunch": "Exakter Rezeptname aus Liste",
-    "dinner": "Exakter Rezeptname aus Liste"
-  }},
-  "sunday": {{
-    "breakfast": "Exakter Rezeptname aus Liste",
-    "lunch": "Exakter Rezeptname aus Liste",
-    "dinner": "Exakter Rezeptname aus Liste"
-  }},
-  "reasoning": "2-3 Sätze warum dieser Plan optimal für '{goal}' ist"
-}}
-"""
-
-        # OpenAI API Call
-        response = client.chat.completions.create(
-            model="gpt-4o-mini",
-            messages=[
-                {
-                    "role": "system",
-                    "content": "Du bist ein Ernährungsexperte. Antworte IMMER nur mit validem JSON, keine zusätzlichen Texte."
-                },
-                {
-                    "role": "user",
-                    "content": prompt
-                }
-            ],
-            temperature=0.7,
-            max_tokens=2000
-        )
-
-        # Parse Response
-        ai_response = response.choices[0].message.content.strip()
-
-        # Clean JSON (entferne Markdown falls vorhanden)
-        json_match = re.search(r'```json\s*(.*?)\s*```', ai_response, re.DOTALL)
-        if json_match:
-            ai_response = json_match.group(1)
-
-        # Parse JSON
-        try:
-            plan_data = json.loads(ai_response)
-        except json.JSONDecodeError:
-            # Fallback: Versuche JSON zu extrahieren
-            json_start = ai_response.find('{')
-            json_end = ai_response.rfind('}') + 1
-            if json_start != -1 and json_end > json_start:
-                ai_response = ai_response[json_start:json_end]
-                plan_data = json.loads(ai_response)
-            else:
-                raise
-
-        # Füge Meal IDs und Bilder hinzu
-        days = ['monday', 'tuesday', 'wednesday', 'thursday', 'friday', 'saturday', 'sunday']
-        meal_types = ['breakfast', 'lunch', 'dinner']
-
-        for day in days:
-            if day in plan_data:
-                for meal_type in meal_types:
-                    if meal_type in plan_data[day]:
-                        meal_name = plan_data[day][meal_type]
-
-                        # Finde passendes Meal
-                        matching_meal = None
-                        for m in meal_list:
-                            if m['name'].lower() == meal_name.lower():
-                                matching_meal = m
-                                break
-
-                        # Fuzzy Match falls exakter Match fehlt
-                        if not matching_meal:
-                            for m in meal_list:
-                                if meal_name.lower() in m['name'].lower() or m['name'].lower() in meal_name.lower():
-                                    matching_meal = m
-                                    break
-
-                        if matching_meal:
-                            plan_data[day][f'{meal_type}_id'] = matching_meal['id']
-                            # Hole Bild
-                            try:
-                                meal_detail = requests.get(
-                                    f"{THEMEALDB_BASE_URL}/lookup.php?i={matching_meal['id']}",
-                                    timeout=5
-                                ).json()
-                                if meal_detail.get('meals'):
-                                    plan_data[day][f'{meal_type}_thumb'] = meal_detail['meals'][0].get('strMealThumb',
-                                                                                                       '')
-                            except:
-                                pass
-
-        return jsonify({
-            'success': True,
-            'plan': plan_data,
-            'goal': goal,
-            'daily_targets': {
-                'calories': calories,
-                'protein': protein
-            }
-        })
+        return jsonify(result)
 
+    except UpstreamUnavailable as e:
+        return unavailable_response(e)
     except Exception as e:
         print(f"Error in generate_ai_meal_plan: {str(e)}")
         return jsonify({
@@ -404,41 +431,26 @@ WICHTIG: Antworte AUSSCHLIESSLICH mit folgendem JSON-Format (keine Erklärungen
 # ==========================================
 # ROUTE 13: NÄHRWERTE VON OPEN FOOD FACTS (API 3!)
 # ==========================================
-@app.route('/api/nutrition/<barcode>')
+@routes.route('/api/nutrition/<barcode>')
 def get_nutrition_info(barcode):
     """
     Holt Nährwertinformationen von Open Food Facts
     API 3 für Uni-Projekt
+    Über den persistenten Barcode-Cache; unbekannte Barcodes werden negativ gecacht.
     """
     try:
-        url = f"https://world.openfoodfacts.org/api/v2/product/{barcode}"
-        response = requests.get(url, timeout=5)
-        response.raise_for_status()
-
-        data = response.json()
-
-        if data.get('status') == 1 and data.get('product'):
-            product = data['product']
-
-            # Extrahiere wichtige Nährwerte
-            nutrition_info = {
-                'product_name': product.get('product_name', 'Unbekannt'),
-                'nutriscore': product.get('nutrition_grades', 'Nicht berechnet'),
-                'calories': product.get('nutriments', {}).get('energy-kcal_100g', 0),
-                'protein': product.get('nutriments', {}).get('proteins_100g', 0),
-                'carbs': product.get('nutriments', {}).get('carbohydrates_100g', 0),
-                'fat': product.get('nutriments', {}).get('fat_100g', 0),
-                'sugar': product.get('nutriments', {}).get('sugars_100g', 0),
-                'fiber': product.get('nutriments', {}).get('fiber_100g', 0),
-                'salt': product.get('nutriments', {}).get('salt_100g', 0),
-                'image_url': product.get('image_url', ''),
-                'brands': product.get('brands', ''),
-                'categories': product.get('categories', ''),
-            }
+        code = normalize_barcode(barcode)
+        found, errors = lookup_products([code]) if code else ({}, {})
+
+        if isinstance(errors.get(code), UpstreamUnavailable):
+            return unavailable_response(errors[code])
+        if code in errors:
+            return jsonify({'success': False, 'error': str(errors[code])}), 500
 
+        if found.get(code):
             return jsonify({
                 'success': True,
-                'nutrition': nutrition_info
+                'nutrition': found[code]
             })
         else:
             return jsonify({
@@ -446,6 +458,8 @@ def get_nutrition_info(barcode):
                 'error': 'Produkt nicht gefunden'
             }), 404
 
+    except UpstreamUnavailable as e:
+        return unavailable_response(e)
     except Exception as e:
         print(f"Error in get_nutrition_info: {str(e)}")
         return jsonify({
@@ -457,32 +471,25 @@ def get_nutrition_info(barcode):
 # ==========================================
 # ROUTE 14: PRODUKT NACH NUTRISCORE SUCHEN (API 3!)
 # ==========================================
-@app.route('/api/search-nutrition', methods=['POST'])
+@routes.route('/api/search-nutrition', methods=['POST'])
 def search_by_nutriscore():
     """
     Sucht Produkte nach Nutriscore
     """
     try:
-        data = request.get_json()
-        nutriscore = data.get('nutriscore', 'a')  # a, b, c, d, e
-        category = data.get('category', '')
-
-        # Open Food Facts Search API
-        url = f"https://world.openfoodfacts.org/api/v2/search"
-        params = {
-            'nutrition_grades_tags': nutriscore,
-            'fields': 'code,product_name,nutrition_grades,nutriments,image_url,brands',
-            'page_size': 20
-        }
-
-        if category:
-            params['categories_tags_en'] = category
+        data = request.get_json() or {}
 
-        response = requests.get(url, params=params, timeout=5)
-        response.raise_for_status()
+        # Offline-Store (OFF_MODE=store): echte Pagination und Sortierung
+        store = get_off_store()
+        if store:
+            return jsonify(store.search(**search_query(data)))
 
-        return jsonify(response.json())
+        # Open Food Facts Search API
+        params = search_params(data)
+        return jsonify(off.get_json('api/v2/search', params=params))
 
+    except UpstreamUnavailable as e:
+        return unavailable_response(e)
     except Exception as e:
         print(f"Error in search_by_nutriscore: {str(e)}")
         return jsonify({
@@ -491,7 +498,10 @@ def search_by_nutriscore():
         }), 500
 
 
-@app.route('/api/recipe-nutrition/<meal_id>')
+# ==========================================
+# ROUTE 15: REZEPT-NÄHRWERTE
+# ==========================================
+@routes.route('/api/recipe-nutrition/<meal_id>')
 def get_recipe_nutrition(meal_id):
     """
     Berechnet geschätzte Nährwerte basierend auf Zutaten
@@ -499,76 +509,540 @@ def get_recipe_nutrition(meal_id):
     """
     try:
         # Hole Rezept-Details
-        meal_response = requests.get(
-            f"{THEMEALDB_BASE_URL}/lookup.php?i={meal_id}",
-            timeout=5
-        )
-        meal_data = meal_response.json()
+        catalog = get_catalog()
+        if catalog:
+            meal_data = catalog.lookup(meal_id)
+        else:
+            meal_data = mealdb.cached_json('lookup.php', params={'i': meal_id})
 
         if not meal_data.get('meals'):
             return jsonify({'success': False, 'error': 'Rezept nicht gefunden'}), 404
 
         meal = meal_data['meals'][0]
 
-        # Sammle alle Zutaten
-        ingredients = []
-        for i in range(1, 21):
-            ingredient = meal.get(f'strIngredient{i}', '')
-            measure = meal.get(f'strMeasure{i}', '')
-            if ingredient and ingredient.strip():
-                ingredients.append({
-                    'ingredient': ingredient.strip(),
-                    'measure': measure.strip()
-                })
-
-        # Geschätzte Nährwerte basierend auf typischen Werten
-        # (In einer echten App würde man Open Food Facts für jede Zutat abfragen)
-
-        # Einfache Schätzung basierend auf Kategorie
-        category = meal.get('strCategory', '').lower()
-
-        # Standard-Nährwerte pro Kategorie (pro Portion)
-        nutrition_estimates = {
-            'beef': {'calories': 450, 'protein': 35, 'carbs': 25, 'fat': 22},
-            'chicken': {'calories': 380, 'protein': 42, 'carbs': 20, 'fat': 12},
-            'seafood': {'calories': 320, 'protein': 38, 'carbs': 18, 'fat': 8},
-            'pork': {'calories': 420, 'protein': 32, 'carbs': 22, 'fat': 20},
-            'vegetarian': {'calories': 320, 'protein': 15, 'carbs': 45, 'fat': 10},
-            'vegan': {'calories': 280, 'protein': 12, 'carbs': 48, 'fat': 8},
-            'pasta': {'calories': 480, 'protein': 18, 'carbs': 65, 'fat': 14},
-            'dessert': {'calories': 350, 'protein': 5, 'carbs': 55, 'fat': 15},
-            'breakfast': {'calories': 380, 'protein': 20, 'carbs': 42, 'fat': 12},
-            'side': {'calories': 180, 'protein': 5, 'carbs': 28, 'fat': 6},
-            'starter': {'calories': 220, 'protein': 8, 'carbs': 25, 'fat': 9},
-            'goat': {'calories': 400, 'protein': 30, 'carbs': 20, 'fat': 18},
-            'lamb': {'calories': 440, 'protein': 32, 'carbs': 18, 'fat': 24},
-            'miscellaneous': {'calories': 350, 'protein': 18, 'carbs': 35, 'fat': 14},
-        }
-
-        # Hole passende Schätzung
-        nutrition = nutrition_estimates.get(
-            category,
-            {'calories': 380, 'protein': 22, 'carbs': 35, 'fat': 15}
-        )
-
         return jsonify({
             'success': True,
-            'meal_id': meal_id,
-            'meal_name': meal.get('strMeal', ''),
-            'category': meal.get('strCategory', ''),
-            'nutrition': {
-                'calories': nutrition['calories'],
-                'protein': nutrition['protein'],
-                'carbs': nutrition['carbs'],
-                'fat': nutrition['fat'],
-                'note': 'Geschätzte Werte pro Portion'
-            },
-            'ingredients_count': len(ingredients)
+            **estimate_recipe_nutrition(meal)
         })
 
+    except UpstreamUnavailable as e:
+        return unavailable_response(e)
     except Exception as e:
         print(f"Error in get_recipe_nutrition: {str(e)}")
         return jsonify({'success': False, 'error': str(e)}), 500
 
+
+# ==========================================
+# ROUTE 16: CACHE-STATISTIKEN
+# ==========================================
+@routes.route('/api/cache/stats')
+def get_cache_stats():
+    """Hit/Miss-Zähler der Caches, KI-Plan-Jobs, Zustand der Circuit Breaker und Bulkheads, Startzeiten"""
+    barcode_cache = get_barcode_cache()
+    off_store = get_off_store()
+    plan_store = get_plan_store()
+    return jsonify({
+        **mealdb_cache.get_stats(),
+        'plans': plan_cache.get_stats(),
+        'jobs': plan_jobs.get_stats(),
+        'barcodes': barcode_cache.get_stats() if barcode_cache else None,
+        'week_plans': plan_store.get_stats() if plan_store else None,
+        'off_store': off_store.stats() if off_store else None,
+        'upstreams': get_upstream_stats(),
+        'startup': get_startup_stats(),
+    })
+
+
+# ==========================================
+# ROUTE 17: EINKAUFSLISTE (BATCH)
+# ==========================================
+@routes.route('/api/shopping-list', methods=['POST'])
+def build_shopping_list():
+    """
+    Erstellt die Einkaufsliste für den ganzen Wochenplan in einem Request
+    Erwartet das localStorage-Format: {"weekPlan": {"monday": [{"id": ...}], ...}}
+    """
+    try:
+        data = request.get_json() or {}
+        meal_counts = count_plan_meals(data.get('weekPlan', data))
+
+        if not meal_counts:
+            return jsonify({'success': False, 'error': 'Wochenplan ist leer'}), 400
+
+        # Eindeutige Rezepte parallel (bzw. aus dem Cache) laden
+        recipes = lookup_meals(meal_counts.keys())
+
+        return jsonify(shopping_list_result(meal_counts, recipes))
+
+    except Exception as e:
+        print(f"Error in build_shopping_list: {str(e)}")
+        return jsonify({'success': False, 'error': str(e)}), 500
+
+
+# ==========================================
+# ROUTE 18: REZEPT-NÄHRWERTE (BATCH)
+# ==========================================
+@routes.route('/api/recipe-nutrition/batch', methods=['POST'])
+def get_recipe_nutrition_batch():
+    """
+    Nährwerte für viele Rezepte auf einmal plus Tages- und Wochensummen
+    Erwartet {"meal_ids": [...]} und/oder {"weekPlan": {...}} im localStorage-Format.
+    Bereits bekannte Nährwerte aus dem weekPlan werden übernommen.
+    """
+    try:
+        data = request.get_json() or {}
+        week_plan = data.get('weekPlan') or {}
+        meal_ids = data.get('meal_ids') or []
+        if not isinstance(meal_ids, list):
+            return jsonify({'success': False, 'error': 'meal_ids muss eine Liste sein'}), 400
+        to_fetch, nutrition_by_id = split_known_nutrition(week_plan, meal_ids)
+
+        if not to_fetch and not nutrition_by_id:
+            return jsonify({'success': False, 'error': 'Keine Rezepte angegeben'}), 400
+        if len(to_fetch) > RECIPE_BATCH_LIMIT:
+            return jsonify({'success': False, 'error': f'Maximal {RECIPE_BATCH_LIMIT} Rezepte pro Request'}), 400
+
+        # Nur unbekannte Rezepte nachladen (dedupliziert und parallel)
+        recipes = lookup_meals(to_fetch)
+
+        return jsonify(nutrition_batch_result(week_plan, to_fetch, nutrition_by_id, recipes))
+
+    except Exception as e:
+        print(f"Error in get_recipe_nutrition_batch: {str(e)}")
+        return jsonify({'success': False, 'error': str(e)}), 500
+
+
+# ==========================================
+# ROUTE 19: KI-WOCHENPLAN ALS STREAM (SSE)
+# ==========================================
+@routes.route('/api/generate-ai-plan/stream', methods=['POST'])
+def generate_ai_meal_plan_stream():
+    """
+    Wie /api/generate-ai-plan, aber als Server-Sent Events
+    'meta' sofort, dann ein 'day'-Event pro fertigem Tag (mit IDs und Bildern),
+    'reasoning', zum Schluss 'done' mit dem kompletten Plan oder 'error'
+    """
+    params = read_plan_request(request.get_json() or {})
+
+    def generate():
+        yield sse_event('meta', plan_meta(params))
+        try:
+            meal_list = fetch_plan_candidates(params)
+            if not meal_list:
+                yield sse_event('error', {'success': False, 'error': 'Keine passenden Rezepte gefunden'})
+                return
+
+            if params['mode'] == 'solver':
+                plan_data = solve_week_plan(meal_list, params)
+                for event in replay_plan_events(plan_data):
+                    yield event
+                yield sse_event('done', plan_response(plan_data, params, source='solver'))
+                return
+
+            cache_key = plan_cache_key(params, meal_list)
+            cached_plan = plan_cache.get(cache_key)
+            if cached_plan is not None:
+                for event in replay_plan_events(cached_plan):
+                    yield event
+                yield sse_event('done', plan_response(cached_plan, params, source=params['mode']))
+                return
+
+            index = MealIndex(meal_list)
+            parser = PlanStreamParser()
+            source = params['mode']
+            failed = False
+            try:
+                prompt = build_prompt(
+                    meal_list, params['goal'], params['calories'], params['protein'], params['dietary']
+                )
+                timeout, shortened = call_timeout('openai', OPENAI_TIMEOUT)
+                openai_client = get_openai_client(shortened)
+                with guard('openai'), observe_openai(OPENAI_MODEL) as call:
+                    stream = openai_client.chat.completions.create(
+                        model=OPENAI_MODEL,
+                        messages=build_messages(prompt),
+                        temperature=OPENAI_TEMPERATURE,
+                        max_tokens=OPENAI_MAX_TOKENS,
+                        stream=True,
+                        stream_options={'include_usage': True},
+                        timeout=timeout
+                    )
+
+                    for chunk in stream:
+                        # Token-Verbrauch kommt im letzten Chunk (ohne choices)
+                        call.record_usage(chunk.usage)
+                        if not chunk.choices or not chunk.choices[0].delta.content:
+                            continue
+                        for key, value in parser.feed(chunk.choices[0].delta.content):
+                            if key in DAYS and isinstance(value, dict):
+                                day_plan = {key: value}
+                                missing_thumbs = attach_meal_refs(day_plan, index, days=[key])
+                                if missing_thumbs:
+                                    apply_thumbs(day_plan, missing_thumbs,
+                                                 lookup_meals(meal_id for _, _, meal_id in missing_thumbs))
+                                yield sse_event('day', {'day': key, 'meals': value})
+                            elif key == 'reasoning':
+                                yield sse_event('reasoning', {'reasoning': value})
+
+                if not any(day in parser.result for day in DAYS):
+                    raise ValueError('KI-Antwort enthielt keinen gültigen Plan')
+
+            except Exception as e:
+                # Bereits gesendete Tage bleiben, der Rest kommt vom lokalen Optimierer
+                print(f"Error in generate_ai_meal_plan_stream (OpenAI), nutze lokalen Optimierer: {str(e)}")
+                source = 'hybrid' if any(day in parser.result for day in DAYS) else 'solver'
+                failed = True
+
+            plan_data = parser.result
+            if source != 'llm':
+                plan_data, events = finish_streamed_plan(plan_data, meal_list, params)
+                for event in events:
+                    yield event
+            if not failed:
+                plan_cache.add(cache_key, plan_data)
+            yield sse_event('done', plan_response(plan_data, params, source=source))
+
+        except UpstreamUnavailable as e:
+            yield sse_event('error', unavailable_body(e))
+        except Exception as e:
+            print(f"Error in generate_ai_meal_plan_stream: {str(e)}")
+            yield sse_event('error', {'success': False, 'error': f'Fehler beim Generieren: {str(e)}'})
+
+    return Response(
+        stream_with_context(generate()),
+        mimetype='text/event-stream',
+        headers={'Cache-Control': 'no-cache', 'X-Accel-Buffering': 'no'}
+    )
+
+
+# ==========================================
+# ROUTE 20: NÄHRWERTE FÜR VIELE BARCODES (BATCH)
+# ==========================================
+@routes.route('/api/nutrition/batch', methods=['POST'])
+def get_nutrition_batch():
+    """
+    Nährwerte für einen ganzen Warenkorb in einem Request
+    Erwartet {"barcodes": [...]}; bekannte Barcodes kommen aus dem Cache,
+    der Rest wird parallel bei Open Food Facts geladen.
+    """
+    try:
+        barcodes, invalid = read_barcode_request(request.get_json() or {})
+
+        if not barcodes and not invalid:
+            return jsonify({'success': False, 'error': 'Keine Barcodes angegeben'}), 400
+        if len(barcodes) > BARCODE_BATCH_LIMIT:
+            return jsonify({'success': False, 'error': f'Maximal {BARCODE_BATCH_LIMIT} Barcodes pro Request'}), 400
+
+        found, errors = lookup_products(barcodes)
+
+        return jsonify(bulk_nutrition_result(barcodes, invalid, found, errors))
+
+    except Exception as e:
+        print(f"Error in get_nutrition_batch: {str(e)}")
+        return jsonify({'success': False, 'error': str(e)}), 500
+
+
+# ==========================================
+# ROUTE 21: METRIKEN (PROMETHEUS)
+# ==========================================
+@routes.route('/metrics')
+def get_metrics():
+    """Request-, Upstream- und OpenAI-Metriken im Prometheus-Textformat"""
+    return Response(registry.render(), mimetype='text/plain; version=0.0.4')
+
+
+# ==========================================
+# ROUTE 22: KI-WOCHENPLAN ALS JOB
+# ==========================================
+@routes.route('/api/generate-ai-plan/jobs', methods=['POST'])
+def submit_ai_plan_job():
+    """
+    Wie /api/generate-ai-plan, aber ohne auf OpenAI zu warten
+    Antwortet sofort mit 202 und der Job-ID; das Ergebnis liefern
+    /api/generate-ai-plan/jobs/<job_id> (Polling) oder .../events (SSE).
+    """
+    try:
+        params = read_plan_request(request.get_json() or {})
+        status = job_status(plan_jobs.submit(params, request.remote_addr))
+        status['status_url'] = f"/api/generate-ai-plan/jobs/{status['job_id']}"
+        status['events_url'] = f"{status['status_url']}/events"
+
+        response = jsonify(status)
+        response.status_code = 202
+        response.headers['Location'] = status['status_url']
+        return response
+
+    except JobRejected as e:
+        # Queue voll (503) oder zu viele offene Jobs dieses Clients (429)
+        response = jsonify({'success': False, 'error': str(e), 'reason': e.reason, 'retry_after': e.retry_after})
+        response.status_code = e.status
+        response.headers['Retry-After'] = str(e.retry_after)
+        return response
+    except Exception as e:
+        print(f"Error in submit_ai_plan_job: {str(e)}")
+        return jsonify({'success': False, 'error': str(e)}), 500
+
+
+# ==========================================
+# ROUTE 23: STATUS EINES KI-PLAN-JOBS
+# ==========================================
+@routes.route('/api/generate-ai-plan/jobs/<job_id>')
+def get_ai_plan_job(job_id):
+    """Status (queued mit Position, running, done mit Plan, failed mit Fehler)"""
+    try:
+        job = plan_jobs.get(job_id)
+        if job is None:
+            return jsonify({'success': False, 'error': 'Job nicht gefunden'}), 404
+        return jsonify(job_status(job))
+
+    except Exception as e:
+        print(f"Error in get_ai_plan_job: {str(e)}")
+        return jsonify({'success': False, 'error': str(e)}), 500
+
+
+# ==========================================
+# ROUTE 24: STATUS EINES KI-PLAN-JOBS ALS STREAM (SSE)
+# ==========================================
+@routes.route('/api/generate-ai-plan/jobs/<job_id>/events')
+def stream_ai_plan_job(job_id):
+    """
+    'status' bei jeder Änderung (Position, running), zum Schluss 'done' mit
+    dem Plan oder 'error'. Belegt unter WSGI einen Worker-Thread bis zum Ende;
+    Polling oder der ASGI-Server (asgi.py) kommen ohne aus.
+    """
+    def generate():
+        for event, data in watch_job(plan_jobs, job_id):
+            yield sse_event(event, data)
+
+    return Response(
+        stream_with_context(generate()),
+        mimetype='text/event-stream',
+        headers={'Cache-Control': 'no-cache', 'X-Accel-Buffering': 'no'}
+    )
+
+
+# ==========================================
+# SERVERSEITIGER WOCHENPLAN (PLAN-STORE)
+# ==========================================
+def prepare_plan_days(week_plan):
+    """localStorage-Plan -> [(day, [vorbereitete Mahlzeit])]; alle Rezepte in einem Batch"""
+    days = read_plan_days(week_plan)
+    recipes = lookup_meals(plan_meal_id(meal) for _, meals in days for meal in meals if plan_meal_id(meal))
+    return [(day, prepare_plan_meals(meals, recipes)) for day, meals in days]
+
+
+def plan_store_unavailable():
+    return jsonify({'success': False, 'error': 'Wochenplan-Speicher ist nicht verfügbar'}), 503
+
+
+def plan_not_found():
+    return jsonify({'success': False, 'error': 'Wochenplan nicht gefunden'}), 404
+
+
+def plan_etag(plan_store, plan_id, kind):
+    """ETag aus der Planversion (None, wenn der Plan nicht existiert)"""
+    version = plan_store.version(plan_id)
+    return None if version is None else version_etag(kind, plan_id, version)
+
+
+def plan_change_response(plan_store, plan_id, **extra):
+    """Antwort auf eine Änderung: neue Version plus Tages- und Wochensummen (ohne Neuberechnung)"""
+    return jsonify({
+        'success': True,
+        'plan_id': plan_id,
+        'version': plan_store.version(plan_id),
+        **extra,
+        **plan_store.summary(plan_id),
+    })
+
+
+# ==========================================
+# ROUTE 25: WOCHENPLAN ANLEGEN / IMPORTIEREN
+# ==========================================
+@routes.route('/api/week-plans', methods=['POST'])
+def create_week_plan():
+    """
+    Legt einen serverseitigen Wochenplan an
+    Optional {"weekPlan": {...}} im localStorage-Format als Startinhalt.
+    """
+    plan_store = get_plan_store()
+    if plan_store is None:
+        return plan_store_unavailable()
+    try:
+        days = prepare_plan_days((request.get_json(silent=True) or {}).get('weekPlan') or {})
+        plan_id = plan_store.create(days, request.remote_addr)
+        response = jsonify(plan_store.get(plan_id))
+        response.status_code = 201
+        response.headers['Location'] = f'/api/week-plans/{plan_id}'
+        return response
+
+    except PlanFull as e:
+        return jsonify({'success': False, 'error': str(e)}), 400
+    except PlanRateLimited as e:
+        response = jsonify({'success': False, 'error': str(e), 'retry_after': e.retry_after})
+        response.status_code = 429
+        response.headers['Retry-After'] = str(e.retry_after)
+        return response
+    except Exception as e:
+        print(f"Error in create_week_plan: {str(e)}")
+        return jsonify({'success': False, 'error': str(e)}), 500
+
+
+# ==========================================
+# ROUTE 26: WOCHENPLAN LESEN / ERSETZEN
+# ==========================================
+@routes.route('/api/week-plans/<plan_id>', methods=['GET', 'PUT'])
+def week_plan_detail(plan_id):
+    """
+    GET: Mahlzeiten (localStorage-Format, mit entry_id) plus Tages- und Wochensummen
+    PUT: ersetzt den Inhalt durch {"weekPlan": {...}}
+    """
+    plan_store = get_plan_store()
+    if plan_store is None:
+        return plan_store_unavailable()
+    try:
+        if request.method == 'PUT':
+            days = prepare_plan_days((request.get_json(silent=True) or {}).get('weekPlan') or {})
+            if not plan_store.replace(plan_id, days):
+                return plan_not_found()
+        else:
+            # Unveränderter Plan -> 304, ohne Mahlzeiten und Summen zu lesen
+            etag = plan_etag(plan_store, plan_id, 'plan')
+            if etag and etag_matches(request.headers.get('If-None-Match'), etag):
+                return not_modified(etag)
+
+        plan = plan_store.get(plan_id)
+        if plan is None:
+            return plan_not_found()
+        response = jsonify(plan)
+        response.headers['ETag'] = version_etag('plan', plan_id, plan['version'])
+        return response
+
+    except PlanFull as e:
+        return jsonify({'success': False, 'error': str(e)}), 400
+    except Exception as e:
+        print(f"Error in week_plan_detail: {str(e)}")
+        return jsonify({'success': False, 'error': str(e)}), 500
+
+
+# ==========================================
+# ROUTE 27: MAHLZEITEN HINZUFÜGEN / LEEREN
+# ==========================================
+@routes.route('/api/week-plans/<plan_id>/meals', methods=['POST', 'DELETE'])
+def week_plan_meals(plan_id):
+    """
+    POST {"day": "monday", "meal": {"id", "name", "thumb", "category", "nutrition"?}}
+    fügt eine Mahlzeit hinzu (nur ihr Rezept wird geladen);
+    DELETE leert den Plan, mit ?day=monday nur diesen Tag.
+    """
+    plan_store = get_plan_store()
+    if plan_store is None:
+        return plan_store_unavailable()
+    try:
+        if request.method == 'DELETE':
+            day = request.args.get('day')
+            if day is not None and day not in WEEK_DAYS:
+                return jsonify({'success': False, 'error': f'Unbekannter Tag: {day}'}), 400
+            if not plan_store.clear(plan_id, day):
+                return plan_not_found()
+            return plan_change_response(plan_store, plan_id)
+
+        data = request.get_json(silent=True) or {}
+        day, meal = data.get('day'), data.get('meal')
+        if day not in WEEK_DAYS:
+            return jsonify({'success': False, 'error': f'Unbekannter Tag: {day}'}), 400
+        if not isinstance(meal, dict) or not meal.get('id'):
+            return jsonify({'success': False, 'error': 'Keine Mahlzeit angegeben'}), 400
+
+        # Nur das Rezept dieser Mahlzeit laden, der Rest des Plans bleibt unberührt
+        prepared = prepare_plan_meals([meal], lookup_meals([plan_meal_id(meal)] if plan_meal_id(meal) else []))[0]
+        entry_id = plan_store.add(plan_id, day, prepared)
+        if entry_id is None:
+            return plan_not_found()
+
+        entry = {'entry_id': entry_id, 'id': prepared['meal_id'], 'name': prepared['name'],
+                 'thumb': prepared['thumb'], 'category': prepared['category']}
+        if prepared['nutrition'] is not None:
+            entry['nutrition'] = prepared['nutrition']
+        response = plan_change_response(plan_store, plan_id, day=day, entry=entry)
+        response.status_code = 201
+        return response
+
+    except PlanFull as e:
+        return jsonify({'success': False, 'error': str(e)}), 400
+    except Exception as e:
+        print(f"Error in week_plan_meals: {str(e)}")
+        return jsonify({'success': False, 'error': str(e)}), 500
+
+
+# ==========================================
+# ROUTE 28: MAHLZEIT ENTFERNEN
+# ==========================================
+@routes.route('/api/week-plans/<plan_id>/meals/<int:entry_id>', methods=['DELETE'])
+def remove_week_plan_meal(plan_id, entry_id):
+    """Entfernt einen Eintrag; Summen und Einkaufsliste werden um seinen Beitrag verringert"""
+    plan_store = get_plan_store()
+    if plan_store is None:
+        return plan_store_unavailable()
+    try:
+        day = plan_store.remove(plan_id, entry_id)
+        if day is None:
+            return jsonify({'success': False, 'error': 'Eintrag nicht gefunden'}), 404
+        return plan_change_response(plan_store, plan_id, day=day, entry_id=entry_id)
+
+    except Exception as e:
+        print(f"Error in remove_week_plan_meal: {str(e)}")
+        return jsonify({'success': False, 'error': str(e)}), 500
+
+
+# ==========================================
+# ROUTE 29: EINKAUFSLISTE EINES GESPEICHERTEN PLANS
+# ==========================================
+@routes.route('/api/week-plans/<plan_id>/shopping-list')
+def week_plan_shopping_list(plan_id):
+    """Wie /api/shopping-list, aber aus der gespeicherten Zutatenliste (keine Rezepte laden)"""
+    plan_store = get_plan_store()
+    if plan_store is None:
+        return plan_store_unavailable()
+    try:
+        etag = plan_etag(plan_store, plan_id, 'shopping-list')
+        if etag and etag_matches(request.headers.get('If-None-Match'), etag):
+            return not_modified(etag)
+
+        result = plan_store.shopping_list(plan_id)
+        if result is None:
+            return plan_not_found()
+        response = jsonify(result)
+        response.headers['ETag'] = version_etag('shopping-list', plan_id, result['version'])
+        return response
+
+    except Exception as e:
+        print(f"Error in week_plan_shopping_list: {str(e)}")
+        return jsonify({'success': False, 'error': str(e)}), 500
+
+
+# ==========================================
+# APP-FACTORY
+# ==========================================
+def create_app(config=None):
+    """
+    Baut die Flask-App mit allen Routen
+    gunicorn 'main:create_app()' oder main:app (die beim Import erzeugte Instanz).
+    Clients für OpenAI und die Upstreams entstehen erst beim ersten Gebrauch.
+    """
+    app = Flask(__name__)
+    app.config['SECRET_KEY'] = os.getenv('SECRET_KEY', 'mealprep-secret-key-2026')
+    app.config.update(config or {})
+    app.json = FastJSONProvider(app)
+    if TRUSTED_PROXY_HOPS > 0:
+        app.wsgi_app = ProxyFix(app.wsgi_app, x_for=TRUSTED_PROXY_HOPS, x_proto=TRUSTED_PROXY_HOPS)
+    app.register_blueprint(routes)
+    return app
+
+
+app = create_app()
+record_import('main', time.perf_counter() - _import_started)
+
+
 if __name__ == '__main__':
     app.run(host='0.0.0.0', port=5000, debug=True)
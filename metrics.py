@@ -0,0 +1,321 @@
+"""
+Metriken für Routen, Upstream-Calls und OpenAI
+
+Zählt Requests und Latenzen pro Route, Upstream-Host/-Endpoint und
+OpenAI-Modell (inkl. Token-Verbrauch) und gibt alles im Prometheus-Textformat
+unter /metrics aus. Pro Request werden die Phasen (TheMealDB, OFF, OpenAI,
+Anreicherung, ...) gesammelt und als Server-Timing-Header mitgeschickt.
+Optional wird ein Teil der Requests mit cProfile profiliert; langsame
+Requests werden dann als .prof-Datei abgelegt bzw. ausgegeben.
+
+Die Werte gelten pro Prozess; bei mehreren gunicorn-Workern liefert jeder
+Scrape die Zahlen des Workers, der ihn beantwortet.
+"""
+import asyncio
+import contextvars
+import cProfile
+import io
+import os
+import pstats
+import random
+import re
+import threading
+import time
+from contextlib import contextmanager
+
+
+# ==========================================
+# KONFIGURATION
+# ==========================================
+METRICS_ENABLED = os.getenv('METRICS_ENABLED', '1') == '1'
+# Anteil der Requests, die profiliert werden (0 = aus)
+METRICS_PROFILE_SAMPLE = float(os.getenv('METRICS_PROFILE_SAMPLE', '0'))
+# Profil nur behalten, wenn der Request länger dauert (Sekunden)
+METRICS_SLOW_REQUEST = float(os.getenv('METRICS_SLOW_REQUEST', '2.0'))
+# Zielverzeichnis für .prof-Dateien; leer = Top-Funktionen ins Log
+METRICS_PROFILE_DIR = os.getenv('METRICS_PROFILE_DIR', '')
+
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0)
+
+
+def _escape(value):
+    return str(value).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+
+
+def _labels(names, values, extra=()):
+    pairs = list(zip(names, values)) + list(extra)
+    if not pairs:
+        return ''
+    return '{' + ','.join(f'{name}="{_escape(value)}"' for name, value in pairs) + '}'
+
+
+class Counter:
+    """Monoton steigender Zähler mit Labels"""
+
+    kind = 'counter'
+
+    def __init__(self, name, help_text, labelnames=()):
+        self.name = name
+        self.help = help_text
+        self.labelnames = tuple(labelnames)
+        self._values = {}
+        self._lock = threading.Lock()
+
+    def inc(self, value=1, **labels):
+        key = tuple(str(labels.get(name, '')) for name in self.labelnames)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0) + value
+
+    def samples(self):
+        with self._lock:
+            items = sorted(self._values.items())
+        return [f'{self.name}{_labels(self.labelnames, key)} {value}' for key, value in items]
+
+
+class Histogram:
+    """Latenz-Histogramm mit festen Buckets (kumulativ wie bei Prometheus)"""
+
+    kind = 'histogram'
+
+    def __init__(self, name, help_text, labelnames=(), buckets=LATENCY_BUCKETS):
+        self.name = name
+        self.help = help_text
+        self.labelnames = tuple(labelnames)
+        self.buckets = tuple(buckets)
+        self._values = {}  # key -> [Zähler pro Bucket..., Summe, Anzahl]
+        self._lock = threading.Lock()
+
+    def observe(self, value, **labels):
+        key = tuple(str(labels.get(name, '')) for name in self.labelnames)
+        with self._lock:
+            entry = self._values.get(key)
+            if entry is None:
+                entry = self._values[key] = [0] * len(self.buckets) + [0.0, 0]
+            for i, bound in enumerate(self.buckets):
+                if value <= bound:
+                    entry[i] += 1
+            entry[-2] += value
+            entry[-1] += 1
+
+    def samples(self):
+        with self._lock:
+            items = sorted((key, list(entry)) for key, entry in self._values.items())
+        lines = []
+        for key, entry in items:
+            for bound, count in zip(self.buckets, entry):
+                lines.append(f'{self.name}_bucket{_labels(self.labelnames, key, [("le", bound)])} {count}')
+            lines.append(f'{self.name}_bucket{_labels(self.labelnames, key, [("le", "+Inf")])} {entry[-1]}')
+            lines.append(f'{self.name}_sum{_labels(self.labelnames, key)} {round(entry[-2], 6)}')
+            lines.append(f'{self.name}_count{_labels(self.labelnames, key)} {entry[-1]}')
+        return lines
+
+
+class Registry:
+    def __init__(self):
+        self.metrics = []
+
+    def counter(self, name, help_text, labelnames=()):
+        metric = Counter(name, help_text, labelnames)
+        self.metrics.append(metric)
+        return metric
+
+    def histogram(self, name, help_text, labelnames=(), buckets=LATENCY_BUCKETS):
+        metric = Histogram(name, help_text, labelnames, buckets)
+        self.metrics.append(metric)
+        return metric
+
+    def render(self):
+        """Alle Metriken im Prometheus-Textformat (Version 0.0.4)"""
+        lines = []
+        for metric in self.metrics:
+            lines.append(f'# HELP {metric.name} {metric.help}')
+            lines.append(f'# TYPE {metric.name} {metric.kind}')
+            lines.extend(metric.samples())
+        return '\n'.join(lines) + '\n'
+
+
+registry = Registry()
+
+http_requests = registry.counter(
+    'mealprep_http_requests_total', 'HTTP-Requests pro Route und Status', ('route', 'method', 'status'))
+http_duration = registry.histogram(
+    'mealprep_http_request_duration_seconds', 'Dauer der HTTP-Requests pro Route', ('route', 'method'))
+upstream_requests = registry.counter(
+    'mealprep_upstream_requests_total', 'Upstream-Calls pro Host, Endpoint und Status (inkl. timeout/error)',
+    ('host', 'endpoint', 'status'))
+upstream_duration = registry.histogram(
+    'mealprep_upstream_request_duration_seconds', 'Dauer der Upstream-Calls', ('host', 'endpoint'))
+openai_requests = registry.counter(
+    'mealprep_openai_requests_total', 'OpenAI-Calls pro Modell und Status', ('model', 'status'))
+openai_duration = registry.histogram(
+    'mealprep_openai_request_duration_seconds', 'Dauer der OpenAI-Calls (bei Streams bis zum Ende)', ('model',))
+openai_tokens = registry.counter(
+    'mealprep_openai_tokens_total', 'Verbrauchte OpenAI-Tokens', ('model', 'kind'))
+profiles = registry.counter(
+    'mealprep_profiles_total', 'Profilierte Requests (saved = langsamer als METRICS_SLOW_REQUEST)', ('result',))
+
+
+# ==========================================
+# PHASEN PRO REQUEST (SERVER-TIMING)
+# ==========================================
+_phases = contextvars.ContextVar('mealprep_phases', default=None)
+
+
+def start_request():
+    """Beginnt die Phasen-Erfassung für den aktuellen Request (Thread bzw. Task)"""
+    _phases.set([])
+
+
+def record_phase(name, seconds):
+    phases = _phases.get()
+    if phases is not None:
+        phases.append((name, seconds))
+
+
+@contextmanager
+def timing(name):
+    """Misst einen Abschnitt als Server-Timing-Phase"""
+    started = time.perf_counter()
+    try:
+        yield
+    finally:
+        record_phase(name, time.perf_counter() - started)
+
+
+def bind(fn):
+    """Überträgt den Request-Kontext (Phasen, Deadline) in Worker-Threads (ThreadPoolExecutor)"""
+    context = contextvars.copy_context()
+
+    def wrapper(*args, **kwargs):
+        # Eigene Kopie pro Aufruf, ein Kontext kann nicht in mehreren Threads zugleich aktiv sein
+        return context.copy().run(fn, *args, **kwargs)
+    return wrapper
+
+
+def server_timing(total=None):
+    """
+    Server-Timing-Header aus den gesammelten Phasen
+    Gleichnamige Phasen werden summiert (parallele Calls können die Gesamtzeit übersteigen).
+    """
+    summed = {}
+    for name, seconds in _phases.get() or []:
+        count, duration = summed.get(name, (0, 0.0))
+        summed[name] = (count + 1, duration + seconds)
+    parts = [
+        f'{name};dur={duration * 1000:.1f}' + (f';desc="{count}x"' if count > 1 else '')
+        for name, (count, duration) in summed.items()
+    ]
+    if total is not None:
+        parts.append(f'total;dur={total * 1000:.1f}')
+    return ', '.join(parts)
+
+
+def observe_request(route, method, status, seconds):
+    if not METRICS_ENABLED:
+        return
+    http_requests.inc(route=route, method=method, status=status)
+    http_duration.observe(seconds, route=route, method=method)
+
+
+# ==========================================
+# UPSTREAM / OPENAI
+# ==========================================
+_ID_SEGMENT = re.compile(r'/\d+(?=/|$)')
+
+
+def endpoint_label(path):
+    """'api/v2/product/3017620422003' -> 'api/v2/product/:id' (begrenzte Label-Anzahl)"""
+    return _ID_SEGMENT.sub('/:id', '/' + path.lstrip('/'))[1:]
+
+
+def observe_upstream(host, path, status, seconds):
+    record_phase(host, seconds)
+    if not METRICS_ENABLED:
+        return
+    endpoint = endpoint_label(path)
+    upstream_requests.inc(host=host, endpoint=endpoint, status=status)
+    upstream_duration.observe(seconds, host=host, endpoint=endpoint)
+
+
+class _OpenAICall:
+    def __init__(self, model):
+        self.model = model
+
+    def record_usage(self, usage):
+        """usage-Objekt einer OpenAI-Antwort (bzw. des letzten Stream-Chunks)"""
+        if usage is None or not METRICS_ENABLED:
+            return
+        openai_tokens.inc(getattr(usage, 'prompt_tokens', 0) or 0, model=self.model, kind='prompt')
+        openai_tokens.inc(getattr(usage, 'completion_tokens', 0) or 0, model=self.model, kind='completion')
+
+
+@contextmanager
+def observe_openai(model):
+    """Misst einen OpenAI-Call; Token über call.record_usage(response.usage)"""
+    call = _OpenAICall(model)
+    started = time.perf_counter()
+    status = 'ok'
+    try:
+        yield call
+    except (GeneratorExit, asyncio.CancelledError):
+        # Client hat den Stream abgebrochen
+        status = 'cancelled'
+        raise
+    except BaseException as e:
+        status = 'timeout' if 'Timeout' in type(e).__name__ else 'error'
+        raise
+    finally:
+        seconds = time.perf_counter() - started
+        record_phase('openai', seconds)
+        if METRICS_ENABLED:
+            openai_requests.inc(model=model, status=status)
+            openai_duration.observe(seconds, model=model)
+
+
+# ==========================================
+# SAMPLING-PROFILER
+# ==========================================
+# cProfile kann pro Prozess nur einen Request gleichzeitig sauber profilieren
+_profile_lock = threading.Lock()
+
+
+def start_profile():
+    """Startet bei gezogener Stichprobe einen Profiler, sonst None"""
+    if METRICS_PROFILE_SAMPLE <= 0 or random.random() >= METRICS_PROFILE_SAMPLE:
+        return None
+    if not _profile_lock.acquire(blocking=False):
+        return None
+    profiler = cProfile.Profile()
+    try:
+        profiler.enable()
+    except ValueError:
+        _profile_lock.release()
+        return None
+    return profiler
+
+
+def finish_profile(profiler, route, seconds):
+    """Beendet den Profiler; langsame Requests werden gespeichert bzw. geloggt"""
+    if profiler is None:
+        return
+    try:
+        profiler.disable()
+    finally:
+        _profile_lock.release()
+
+    if seconds < METRICS_SLOW_REQUEST:
+        profiles.inc(result='discarded')
+        return
+
+    profiles.inc(result='saved')
+    try:
+        if METRICS_PROFILE_DIR:
+            os.makedirs(METRICS_PROFILE_DIR, exist_ok=True)
+            name = re.sub(r'[^A-Za-z0-9]+', '_', route).strip('_') or 'root'
+            profiler.dump_stats(os.path.join(METRICS_PROFILE_DIR, f'{int(time.time() * 1000)}-{name}.prof'))
+        else:
+            out = io.StringIO()
+            pstats.Stats(profiler, stream=out).sort_stats('cumulative').print_stats(15)
+            print(f"Slow request {route} ({seconds:.2f}s):\n{out.getvalue()}")
+    except OSError as e:
+        print(f"Error in finish_profile: {str(e)}")
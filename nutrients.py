@@ -0,0 +1,238 @@
+"""
+Nährwert-Engine auf Zutatenebene
+
+Lädt die lokale Nährwerttabelle (data/ingredient_nutrients.csv, Werte pro
+100 g) einmalig in NumPy-Arrays, rechnet die Mengen jedes Rezepts in Gramm um
+und bestimmt die Makros vektorisiert als Menge x Nährwertmatrix, für beliebig
+viele Rezepte in einem Schritt. Ergebnisse werden pro meal_id gemerkt.
+"""
+import csv
+import os
+import re
+import threading
+from collections import OrderedDict
+
+import numpy as np
+
+from ingredients import extract_ingredients, measure_to_grams
+
+
+# ==========================================
+# KONFIGURATION
+# ==========================================
+NUTRIENT_TABLE_PATH = os.getenv(
+    'NUTRIENT_TABLE_PATH',
+    os.path.join(os.path.dirname(os.path.abspath(__file__)), 'data', 'ingredient_nutrients.csv')
+)
+# TheMealDB nennt keine Portionen; Mengen gelten für das ganze Rezept
+NUTRITION_SERVINGS = int(os.getenv('NUTRITION_SERVINGS', '4'))
+# Mindestanteil erkannter Zutaten, sonst Schätzung nach Kategorie
+NUTRITION_MIN_COVERAGE = float(os.getenv('NUTRITION_MIN_COVERAGE', '0.6'))
+NUTRITION_MEMO_SIZE = int(os.getenv('NUTRITION_MEMO_SIZE', '10000'))
+
+NUTRIENT_COLUMNS = ('kcal', 'protein', 'carbs', 'fat')
+
+# Beschreibende Wörter, die für die Zuordnung keine Rolle spielen
+DESCRIPTORS = {
+    'fresh', 'freshly', 'chopped', 'diced', 'sliced', 'minced', 'grated', 'large', 'medium', 'small',
+    'finely', 'roughly', 'ground', 'dried', 'frozen', 'boneless', 'skinless', 'organic', 'raw', 'cooked',
+    'peeled', 'crushed', 'whole', 'free', 'range', 'lean', 'ripe', 'tinned', 'canned', 'unsalted', 'salted',
+}
+
+
+def normalize_ingredient(name):
+    return ' '.join(re.sub(r"[^a-z0-9' ]+", ' ', (name or '').lower()).split())
+
+
+def _singular(word):
+    if word.endswith('ies') and len(word) > 4:
+        return word[:-3] + 'y'
+    if word.endswith(('oes', 'shes', 'ches')):
+        return word[:-2]
+    if word.endswith('s') and not word.endswith('ss') and len(word) > 3:
+        return word[:-1]
+    return word
+
+
+class NutrientTable:
+    """Nährwerte pro Gramm als Matrix (Zutat x kcal/Protein/KH/Fett) plus Dichte und Stückgewicht"""
+
+    def __init__(self, rows):
+        self.names = []
+        self._index = {}
+        per_100g, density, piece = [], [], []
+
+        for row in rows:
+            position = len(self.names)
+            self.names.append(row['name'])
+            for alias in [row['name']] + [a for a in (row.get('aliases') or '').split('|') if a]:
+                self._index.setdefault(normalize_ingredient(alias), position)
+            per_100g.append([float(row[column] or 0) for column in NUTRIENT_COLUMNS])
+            density.append(float(row.get('density') or 0) or np.nan)
+            piece.append(float(row.get('piece_g') or 0) or np.nan)
+
+        self.per_gram = np.asarray(per_100g, dtype=np.float64).reshape(-1, len(NUTRIENT_COLUMNS)) / 100.0
+        self.density = np.asarray(density, dtype=np.float64)
+        self.piece_grams = np.asarray(piece, dtype=np.float64)
+
+        self._matches = {}
+        self._lock = threading.Lock()
+
+    @classmethod
+    def load(cls, path=NUTRIENT_TABLE_PATH):
+        with open(path, newline='', encoding='utf-8') as f:
+            return cls(list(csv.DictReader(f)))
+
+    def __len__(self):
+        return len(self.names)
+
+    def match(self, ingredient):
+        """
+        Zeile der Tabelle für einen Zutatennamen oder None
+        Exakt, dann Singular, dann ohne beschreibende Wörter, dann das
+        längste passende Wortende ("boneless chicken thighs" -> "chicken thighs").
+        """
+        key = normalize_ingredient(ingredient)
+        if key in self._matches:
+            return self._matches[key]
+
+        words = key.split()
+        candidates = [key, ' '.join(_singular(w) for w in words)]
+        core = [w for w in words if w not in DESCRIPTORS]
+        if core and core != words:
+            candidates += [' '.join(core), ' '.join(_singular(w) for w in core)]
+        for start in range(1, len(core)):
+            tail = core[start:]
+            candidates += [' '.join(tail), ' '.join(_singular(w) for w in tail)]
+
+        row = next((self._index[c] for c in candidates if c in self._index), None)
+        with self._lock:
+            self._matches[key] = row
+        return row
+
+    def grams(self, row, measure):
+        density = self.density[row]
+        piece = self.piece_grams[row]
+        grams = measure_to_grams(
+            measure,
+            density=None if np.isnan(density) else density,
+            piece_grams=None if np.isnan(piece) else piece
+        )
+        if grams is None and not np.isnan(piece):
+            # "Chicken" ohne Menge -> ein Stück
+            grams = piece
+        return grams
+
+
+class NutritionEngine:
+    """Berechnet Makros pro Portion für viele Rezepte auf einmal, mit Memo pro meal_id"""
+
+    def __init__(self, table, servings=NUTRITION_SERVINGS, min_coverage=NUTRITION_MIN_COVERAGE,
+                 memo_size=NUTRITION_MEMO_SIZE):
+        self.table = table
+        self.servings = max(1, servings)
+        self.min_coverage = min_coverage
+        self.memo_size = memo_size
+        self._memo = OrderedDict()
+        self._lock = threading.Lock()
+
+    def _remember(self, meal_id, result):
+        with self._lock:
+            self._memo[meal_id] = result
+            self._memo.move_to_end(meal_id)
+            while len(self._memo) > self.memo_size:
+                self._memo.popitem(last=False)
+
+    def compute_batch(self, meals):
+        """
+        Liefert {meal_id: Ergebnis oder None} für eine Liste von TheMealDB-Meals
+        None, wenn zu wenige Zutaten erkannt wurden (dann Schätzung nach Kategorie).
+        """
+        results = {}
+        pending = []
+        with self._lock:
+            for meal in meals:
+                meal_id = str(meal.get('idMeal', ''))
+                if not meal_id:
+                    continue
+                if meal_id in self._memo:
+                    self._memo.move_to_end(meal_id)
+                    results[meal_id] = self._memo[meal_id]
+                elif meal_id not in results:
+                    results[meal_id] = None
+                    pending.append((meal_id, meal))
+        if not pending:
+            return results
+
+        # Dünn besetzte Mengenmatrix als (Rezept, Zutat, Gramm)-Tripel
+        recipe_index, ingredient_index, grams = [], [], []
+        totals_count = np.zeros(len(pending))
+        matched_count = np.zeros(len(pending))
+        for r, (_, meal) in enumerate(pending):
+            for entry in extract_ingredients(meal):
+                totals_count[r] += 1
+                row = self.table.match(entry['ingredient'])
+                if row is None:
+                    continue
+                matched_count[r] += 1
+                amount = self.table.grams(row, entry['measure'])
+                if amount:
+                    recipe_index.append(r)
+                    ingredient_index.append(row)
+                    grams.append(amount)
+
+        macros = np.zeros((len(pending), len(NUTRIENT_COLUMNS)))
+        weight = np.zeros(len(pending))
+        if grams:
+            rows = np.asarray(recipe_index, dtype=np.intp)
+            amounts = np.asarray(grams, dtype=np.float64)
+            np.add.at(macros, rows, amounts[:, None] * self.table.per_gram[np.asarray(ingredient_index, dtype=np.intp)])
+            weight = np.bincount(rows, weights=amounts, minlength=len(pending))
+
+        coverage = np.divide(matched_count, totals_count, out=np.zeros(len(pending)), where=totals_count > 0)
+        per_serving = np.rint(macros / self.servings).astype(int)
+
+        for r, (meal_id, _) in enumerate(pending):
+            if coverage[r] < self.min_coverage or macros[r, 0] <= 0:
+                result = None
+            else:
+                calories, protein, carbs, fat = (int(v) for v in per_serving[r])
+                result = {
+                    'calories': calories,
+                    'protein': protein,
+                    'carbs': carbs,
+                    'fat': fat,
+                    'coverage': round(float(coverage[r]), 2),
+                    'servings': self.servings,
+                    'recipe_grams': int(round(weight[r])),
+                }
+            self._remember(meal_id, result)
+            results[meal_id] = result
+
+        return results
+
+    def compute(self, meal):
+        return self.compute_batch([meal]).get(str(meal.get('idMeal', '')))
+
+    def stats(self):
+        with self._lock:
+            memo = len(self._memo)
+        return {'ingredients': len(self.table), 'memoized': memo, 'servings': self.servings}
+
+
+_engine = None
+_engine_lock = threading.Lock()
+
+
+def get_engine():
+    """Engine mit einmalig geladener Tabelle (None, wenn die Tabelle fehlt)"""
+    global _engine
+    if _engine is None:
+        with _engine_lock:
+            if _engine is None:
+                try:
+                    _engine = NutritionEngine(NutrientTable.load())
+                except (OSError, ValueError, KeyError) as e:
+                    print(f"Error in nutrient table load: {str(e)}")
+                    _engine = False
+    return _engine or None
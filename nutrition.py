@@ -0,0 +1,144 @@
+"""
+Nährwerte für TheMealDB-Rezepte und Wochen-Zusammenfassung
+
+Berechnung aus den Zutaten über nutrients.py; reicht die Abdeckung der
+Nährwerttabelle nicht, greift die Schätzung nach Kategorie.
+"""
+from ingredients import extract_ingredients
+from nutrients import get_engine
+
+
+# Standard-Nährwerte pro Kategorie (pro Portion)
+NUTRITION_ESTIMATES = {
+    'beef': {'calories': 450, 'protein': 35, 'carbs': 25, 'fat': 22},
+    'chicken': {'calories': 380, 'protein': 42, 'carbs': 20, 'fat': 12},
+    'seafood': {'calories': 320, 'protein': 38, 'carbs': 18, 'fat': 8},
+    'pork': {'calories': 420, 'protein': 32, 'carbs': 22, 'fat': 20},
+    'vegetarian': {'calories': 320, 'protein': 15, 'carbs': 45, 'fat': 10},
+    'vegan': {'calories': 280, 'protein': 12, 'carbs': 48, 'fat': 8},
+    'pasta': {'calories': 480, 'protein': 18, 'carbs': 65, 'fat': 14},
+    'dessert': {'calories': 350, 'protein': 5, 'carbs': 55, 'fat': 15},
+    'breakfast': {'calories': 380, 'protein': 20, 'carbs': 42, 'fat': 12},
+    'side': {'calories': 180, 'protein': 5, 'carbs': 28, 'fat': 6},
+    'starter': {'calories': 220, 'protein': 8, 'carbs': 25, 'fat': 9},
+    'goat': {'calories': 400, 'protein': 30, 'carbs': 20, 'fat': 18},
+    'lamb': {'calories': 440, 'protein': 32, 'carbs': 18, 'fat': 24},
+    'miscellaneous': {'calories': 350, 'protein': 18, 'carbs': 35, 'fat': 14},
+}
+DEFAULT_ESTIMATE = {'calories': 380, 'protein': 22, 'carbs': 35, 'fat': 15}
+
+MACROS = ('calories', 'protein', 'carbs', 'fat')
+WEEK_DAYS = ('monday', 'tuesday', 'wednesday', 'thursday', 'friday', 'saturday', 'sunday')
+
+
+def estimate_for_category(category):
+    """Geschätzte Nährwerte pro Portion für eine TheMealDB-Kategorie"""
+    return NUTRITION_ESTIMATES.get((category or '').lower(), DEFAULT_ESTIMATE)
+
+
+def _recipe_nutrition(meal, computed):
+    if computed:
+        # Aus den Zutaten berechnet (nutrients.py)
+        nutrition = {
+            'calories': computed['calories'],
+            'protein': computed['protein'],
+            'carbs': computed['carbs'],
+            'fat': computed['fat'],
+            'note': f"Berechnet aus Zutaten, pro Portion ({computed['servings']} Portionen)",
+            'source': 'ingredients',
+            'coverage': computed['coverage']
+        }
+    else:
+        # Geschätzte Nährwerte basierend auf typischen Werten
+        estimate = estimate_for_category(meal.get('strCategory', ''))
+        nutrition = {
+            'calories': estimate['calories'],
+            'protein': estimate['protein'],
+            'carbs': estimate['carbs'],
+            'fat': estimate['fat'],
+            'note': 'Geschätzte Werte pro Portion',
+            'source': 'category'
+        }
+
+    return {
+        'meal_id': meal.get('idMeal', ''),
+        'meal_name': meal.get('strMeal', ''),
+        'category': meal.get('strCategory', ''),
+        'nutrition': nutrition,
+        'ingredients_count': len(extract_ingredients(meal))
+    }
+
+
+def estimate_recipes_nutrition(meals):
+    """
+    Nährwerte für viele TheMealDB-Meals in einem Durchgang
+    Aus den Zutaten berechnet, wo genug Zutaten erkannt werden, sonst nach Kategorie.
+    Liefert {meal_id: Antwortformat von /api/recipe-nutrition/<meal_id> (ohne 'success')}
+    """
+    meals = [meal for meal in meals if meal]
+    engine = get_engine()
+    computed = engine.compute_batch(meals) if engine else {}
+    return {
+        str(meal.get('idMeal', '')): _recipe_nutrition(meal, computed.get(str(meal.get('idMeal', ''))))
+        for meal in meals
+    }
+
+
+def estimate_recipe_nutrition(meal):
+    """
+    Nährwerte für ein TheMealDB-Meal
+    Liefert das Antwortformat von /api/recipe-nutrition/<meal_id> (ohne 'success')
+    """
+    engine = get_engine()
+    return _recipe_nutrition(meal, engine.compute(meal) if engine else None)
+
+
+def summarize_week(week_plan, nutrition_by_id):
+    """
+    Summen pro Tag und für die Woche (wie calculateWeekSummary im Frontend)
+    Der Durchschnitt bezieht sich auf Tage mit mindestens einer Mahlzeit.
+    """
+    days = {}
+    days_with_meals = 0
+
+    for day in WEEK_DAYS:
+        meals = week_plan.get(day) or []
+        totals = dict.fromkeys(MACROS, 0)
+        counted = 0
+        for meal in meals:
+            nutrition = nutrition_by_id.get(str(meal.get('id', '')))
+            if not nutrition:
+                continue
+            for macro in MACROS:
+                totals[macro] += nutrition.get(macro, 0) or 0
+            counted += 1
+
+        if meals:
+            days_with_meals += 1
+        days[day] = {**totals, 'meals': counted}
+
+    return summarize_days(days, days_with_meals)
+
+
+def summarize_days(days, days_with_meals):
+    """
+    Wochensummen aus fertigen Tagessummen ({day: {Makros..., 'meals': n}})
+    Genutzt von summarize_week und vom Plan-Store, der die Tagessummen gespeichert hat.
+    """
+    week_totals = {macro: sum(totals[macro] for totals in days.values()) for macro in MACROS}
+    meals_with_nutrition = sum(totals['meals'] for totals in days.values())
+
+    daily_average = {
+        macro: round(week_totals[macro] / days_with_meals) if days_with_meals else 0
+        for macro in MACROS
+    }
+
+    return {
+        'days': days,
+        'week': {
+            'totals': week_totals,
+            'daily_average': daily_average,
+            'days_with_meals': days_with_meals,
+            'meals': meals_with_nutrition
+        }
+    }
@@ -0,0 +1,557 @@
+"""
+Offline-Store für Open-Food-Facts-Produkte (spaltenweise, memory-mapped)
+
+Ingest:
+    python offstore.py ingest openfoodfacts-products.jsonl.gz
+    python offstore.py ingest en.openfoodfacts.org.products.csv.gz --out off_store
+    python offstore.py stats --out off_store
+
+Der Dump wird Zeile für Zeile gelesen (JSONL oder die tab-separierte CSV,
+jeweils auch gzip-komprimiert) und in Blöcken als Rohspalten geschrieben:
+Nährwerte als float32-Matrix, Nutri-Score als uint8, Barcodes als feste
+Bytes, Texte als Blob plus Offsets. Dazu kommen ein Index nach Nutri-Score
+und ein Posting-Index pro Kategorie-Tag. Zur Laufzeit werden alle Dateien per
+np.memmap nur gelesen; die Seiten liegen im Page-Cache und werden von allen
+gunicorn-Workern geteilt.
+
+Jeder Ingest schreibt ein neues Versionsverzeichnis (off_store.v<zeitpunkt>);
+OFF_STORE_PATH ist ein Symlink darauf und wird atomar umgehängt.
+
+Mit OFF_MODE=store beantworten /api/search-nutrition und die Barcode-Lookups
+ihre Anfragen aus dem Store (Barcodes, die im Dump fehlen, weiter über OFF).
+"""
+import argparse
+import bisect
+import csv
+import gzip
+import json
+import os
+import shutil
+import sys
+import threading
+import time
+
+import numpy as np
+
+from barcodes import normalize_barcode
+from foodfacts import project_nutrition
+
+
+# ==========================================
+# KONFIGURATION
+# ==========================================
+OFF_MODE = os.getenv('OFF_MODE', 'live')  # live | store
+OFF_STORE_PATH = os.getenv('OFF_STORE_PATH', 'off_store')
+# Zeilen pro Schreibblock beim Ingest (bestimmt den Speicherbedarf)
+OFF_INGEST_CHUNK = int(os.getenv('OFF_INGEST_CHUNK', '50000'))
+# Nach einem fehlgeschlagenen Laden des Stores erst nach so vielen Sekunden neu versuchen
+OFF_STORE_RETRY_SECONDS = float(os.getenv('OFF_STORE_RETRY_SECONDS', '60'))
+
+# Spalte -> Schlüssel in OFF-nutriments (pro 100 g)
+NUTRIMENT_COLUMNS = (
+    ('kcal', 'energy-kcal_100g'),
+    ('protein', 'proteins_100g'),
+    ('carbs', 'carbohydrates_100g'),
+    ('fat', 'fat_100g'),
+    ('sugar', 'sugars_100g'),
+    ('fiber', 'fiber_100g'),
+    ('salt', 'salt_100g'),
+)
+TEXT_COLUMNS = ('product_name', 'brands', 'image_url', 'categories')
+# Index 0 = kein Nutri-Score
+GRADES = ('', 'a', 'b', 'c', 'd', 'e')
+CODE_DTYPE = 'S24'
+
+
+def category_tag(category):
+    """'Breakfast cereals' -> 'en:breakfast-cereals' (OFF-Tag-Format)"""
+    tag = '-'.join((category or '').strip().lower().split())
+    if tag and ':' not in tag:
+        tag = f'en:{tag}'
+    return tag
+
+
+def _float(value):
+    try:
+        return float(value)
+    except (TypeError, ValueError):
+        return np.nan
+
+
+def _record_from_json(doc):
+    nutriments = doc.get('nutriments') or {}
+    values = [_float(nutriments.get(key)) for _, key in NUTRIMENT_COLUMNS]
+    if np.isnan(values[0]):
+        # Manche Produkte haben nur kJ
+        values[0] = _float(nutriments.get('energy_100g')) / 4.184
+    tags = doc.get('categories_tags') or []
+    return (
+        doc.get('code'),
+        doc.get('nutriscore_grade') or doc.get('nutrition_grades'),
+        values,
+        [doc.get(column) or '' for column in TEXT_COLUMNS[:3]] + [','.join(tags)],
+        tags,
+    )
+
+
+def _record_from_csv(row):
+    values = [_float(row.get(key)) for _, key in NUTRIMENT_COLUMNS]
+    if np.isnan(values[0]):
+        values[0] = _float(row.get('energy_100g')) / 4.184
+    tags = [tag for tag in (row.get('categories_tags') or '').split(',') if tag]
+    return (
+        row.get('code'),
+        row.get('nutriscore_grade') or row.get('nutrition_grade_fr'),
+        values,
+        [row.get(column) or '' for column in TEXT_COLUMNS[:3]] + [','.join(tags)],
+        tags,
+    )
+
+
+def iter_dump(path, errors):
+    """
+    Liest einen OFF-Dump zeilenweise als Records
+    errors: Liste, an die kaputte Zeilen (Zeilennummer) angehängt werden
+    """
+    opener = gzip.open if path.endswith('.gz') else open
+    with opener(path, 'rt', encoding='utf-8', errors='replace', newline='') as f:
+        if '.csv' in path or '.tsv' in path:
+            csv.field_size_limit(sys.maxsize)
+            header = f.readline()
+            delimiter = '\t' if '\t' in header else ','
+            columns = next(csv.reader([header], delimiter=delimiter))
+            for line_number, row in enumerate(csv.DictReader(f, fieldnames=columns, delimiter=delimiter), 2):
+                try:
+                    yield _record_from_csv(row)
+                except (TypeError, ValueError, AttributeError):
+                    errors.append(line_number)
+        else:
+            for line_number, line in enumerate(f, 1):
+                if not line.strip():
+                    continue
+                try:
+                    yield _record_from_json(json.loads(line))
+                except (TypeError, ValueError, AttributeError):
+                    errors.append(line_number)
+
+
+# ==========================================
+# INGEST
+# ==========================================
+class _StoreWriter:
+    """Schreibt Records blockweise als Rohspalten in ein Verzeichnis"""
+
+    def __init__(self, directory, chunk=OFF_INGEST_CHUNK):
+        self.directory = directory
+        self.chunk = max(1, chunk)
+        self.count = 0
+        self.skipped = 0
+        self.vocabulary = {}  # Kategorie-Tag -> vorläufige ID
+        self._files = {
+            name: open(os.path.join(directory, name), 'wb')
+            for name in ['nutriments.bin', 'grades.bin', 'codes.bin', 'category_pairs.tmp']
+            + [f'{column}.bin' for column in TEXT_COLUMNS] + [f'{column}.off' for column in TEXT_COLUMNS]
+        }
+        self._text_size = dict.fromkeys(TEXT_COLUMNS, 0)
+        for column in TEXT_COLUMNS:
+            np.zeros(1, dtype=np.int64).tofile(self._files[f'{column}.off'])
+        self._reset()
+
+    def _reset(self):
+        self._nutriments, self._grades, self._codes, self._pairs = [], [], [], []
+        self._texts = {column: [] for column in TEXT_COLUMNS}
+
+    def add(self, record):
+        code, grade, values, texts, tags = record
+        code = normalize_barcode(code)
+        if code is None:
+            self.skipped += 1
+            return
+
+        row = self.count + len(self._codes)
+        self._codes.append(code.encode())
+        grade = (grade or '').lower()
+        self._grades.append(GRADES.index(grade) if grade in GRADES[1:] else 0)
+        self._nutriments.append(values)
+        for column, text in zip(TEXT_COLUMNS, texts):
+            self._texts[column].append(str(text).encode('utf-8'))
+        for tag in dict.fromkeys(tags):
+            self._pairs.append((self.vocabulary.setdefault(tag, len(self.vocabulary)), row))
+
+        if len(self._codes) >= self.chunk:
+            self.flush()
+
+    def flush(self):
+        if not self._codes:
+            return
+        np.asarray(self._nutriments, dtype=np.float32).tofile(self._files['nutriments.bin'])
+        np.asarray(self._grades, dtype=np.uint8).tofile(self._files['grades.bin'])
+        np.asarray(self._codes, dtype=CODE_DTYPE).tofile(self._files['codes.bin'])
+        if self._pairs:
+            np.asarray(self._pairs, dtype=np.int32).tofile(self._files['category_pairs.tmp'])
+        for column, texts in self._texts.items():
+            self._files[f'{column}.bin'].write(b''.join(texts))
+            ends = self._text_size[column] + np.cumsum([len(text) for text in texts], dtype=np.int64)
+            ends.tofile(self._files[f'{column}.off'])
+            self._text_size[column] = int(ends[-1])
+        self.count += len(self._codes)
+        self._reset()
+
+    def close(self):
+        self.flush()
+        for f in self._files.values():
+            f.close()
+
+
+def _map(path, dtype, shape=None, mode='r'):
+    """np.memmap, das auch mit leeren Dateien funktioniert"""
+    if os.path.getsize(path) == 0:
+        return np.zeros(shape or 0, dtype=dtype)
+    return np.memmap(path, dtype=dtype, mode=mode, shape=shape)
+
+
+def _write_strings(directory, name, strings):
+    blob = [s.encode('utf-8') for s in strings]
+    with open(os.path.join(directory, f'{name}.bin'), 'wb') as f:
+        f.write(b''.join(blob))
+    np.concatenate([[0], np.cumsum([len(b) for b in blob], dtype=np.int64)]).astype(np.int64).tofile(
+        os.path.join(directory, f'{name}.off')
+    )
+
+
+def _write_postings(path, chunks, buckets):
+    """
+    Zeilennummern nach Schlüssel gruppiert (Counting Sort), blockweise
+    chunks: Funktion, die (Schlüssel, Zeilen)-Blöcke in Zeilenreihenfolge liefert;
+    sie wird zweimal durchlaufen (Zählen, Verteilen). Innerhalb eines Schlüssels
+    bleiben die Zeilen aufsteigend. Im RAM liegen nur ein Block und die Zähler.
+    Liefert die Offsets pro Schlüssel (buckets + 1).
+    """
+    counts = np.zeros(buckets, dtype=np.int64)
+    for keys, _ in chunks():
+        counts += np.bincount(keys, minlength=buckets)
+    offsets = np.concatenate([[0], np.cumsum(counts)]).astype(np.int64)
+
+    if offsets[-1] == 0:
+        open(path, 'wb').close()
+        return offsets
+    out = np.memmap(path, dtype=np.int32, mode='w+', shape=(int(offsets[-1]),))
+    cursor = offsets[:-1].copy()
+    for keys, rows in chunks():
+        order = np.argsort(keys, kind='stable')
+        keys = keys[order]
+        chunk_counts = np.bincount(keys, minlength=buckets)
+        chunk_starts = np.cumsum(chunk_counts) - chunk_counts
+        out[cursor[keys] + np.arange(len(keys)) - chunk_starts[keys]] = rows[order]
+        cursor += chunk_counts
+    out.flush()
+    del out
+    return offsets
+
+
+def _build_indexes(directory, count, vocabulary, chunk=OFF_INGEST_CHUNK):
+    """
+    Barcode-Sortierung, Nutri-Score-Index und Kategorie-Postings
+    Nutri-Score- und Kategorie-Index entstehen blockweise (_write_postings).
+    Nur die Barcode-Sortierung läuft per argsort komplett im RAM: rund 32 Byte
+    pro Produkt, bei 3 Mio. Produkten also etwa 100 MB.
+    """
+    def path(name):
+        return os.path.join(directory, name)
+
+    codes = _map(path('codes.bin'), CODE_DTYPE, (count,))
+    np.argsort(codes, kind='stable').astype(np.int32).tofile(path('code_order.bin'))
+    del codes
+
+    grades = _map(path('grades.bin'), np.uint8, (count,))
+
+    def grade_chunks():
+        for start in range(0, count, chunk):
+            end = min(start + chunk, count)
+            yield np.asarray(grades[start:end]), np.arange(start, end, dtype=np.int32)
+
+    _write_postings(path('grade_rows.bin'), grade_chunks, len(GRADES)).tofile(path('grade_offsets.bin'))
+
+    # Tags alphabetisch, damit sie per Binärsuche gefunden werden
+    tags = sorted(vocabulary)
+    remap = np.empty(len(tags), dtype=np.int32)
+    for new_id, tag in enumerate(tags):
+        remap[vocabulary[tag]] = new_id
+    _write_strings(directory, 'category_tags', tags)
+
+    pairs = _map(path('category_pairs.tmp'), np.int32).reshape(-1, 2)
+
+    def category_chunks():
+        # Die Paare liegen in Zeilenreihenfolge vor (so wie _StoreWriter sie schreibt)
+        for start in range(0, len(pairs), chunk):
+            block = np.asarray(pairs[start:start + chunk])
+            yield remap[block[:, 0]], block[:, 1]
+
+    _write_postings(path('category_rows.bin'), category_chunks, len(tags)).tofile(path('category_offsets.bin'))
+    os.remove(path('category_pairs.tmp'))
+
+
+def _publish(directory, out):
+    """
+    Hängt den Symlink out atomar auf directory um
+    Ein Store aus der Zeit vor den Versionsverzeichnissen (echtes Verzeichnis
+    unter out) wird einmalig beiseitegelegt. Behalten werden die neue und die
+    bisherige Version, ältere (und abgebrochene Ingests) werden gelöscht.
+    """
+    previous = os.path.realpath(out) if os.path.islink(out) else None
+    if os.path.isdir(out) and not os.path.islink(out):
+        legacy = f'{out}.v0'
+        shutil.rmtree(legacy, ignore_errors=True)
+        os.rename(out, legacy)
+        previous = os.path.realpath(legacy)
+
+    link = f'{out}.link.tmp'
+    if os.path.lexists(link):
+        os.remove(link)
+    os.symlink(os.path.basename(directory), link)
+    os.replace(link, out)
+
+    parent = os.path.dirname(os.path.abspath(out))
+    prefix = f'{os.path.basename(out)}.v'
+    keep = {os.path.realpath(directory), previous}
+    for name in os.listdir(parent):
+        version = os.path.join(parent, name)
+        if name.startswith(prefix) and os.path.realpath(version) not in keep:
+            shutil.rmtree(version, ignore_errors=True)
+
+
+def ingest(dump_path, out=OFF_STORE_PATH, chunk=OFF_INGEST_CHUNK, log=print):
+    """
+    Baut den Store aus einem OFF-Dump neu auf
+    Geschrieben wird in ein neues Versionsverzeichnis; erst wenn es vollständig
+    ist, zeigt der Symlink out darauf (_publish). Es gibt keinen Moment ohne
+    Store, und laufende Worker behalten bis zum Neuladen ihre Mappings.
+    """
+    started = time.time()
+    # Nanosekunden im Namen: mehrere Ingests pro Sekunde (auch im selben Prozess) kollidieren nicht
+    now = time.time_ns()
+    tmp = f"{out}.v{time.strftime('%Y%m%d-%H%M%S', time.localtime(now // 10**9))}-{now % 10**9:09d}-{os.getpid()}"
+    os.makedirs(tmp)
+
+    errors = []
+    writer = _StoreWriter(tmp, chunk=chunk)
+    try:
+        for line_count, record in enumerate(iter_dump(dump_path, errors), 1):
+            writer.add(record)
+            if line_count % (chunk * 10) == 0:
+                log(f"{line_count} Produkte gelesen")
+    finally:
+        writer.close()
+
+    _build_indexes(tmp, writer.count, writer.vocabulary, chunk=chunk)
+    meta = {
+        'count': writer.count,
+        'categories': len(writer.vocabulary),
+        'skipped': writer.skipped,
+        'errors': len(errors),
+        'source': os.path.basename(dump_path),
+        'created_at': time.time(),
+        'nutriments': [column for column, _ in NUTRIMENT_COLUMNS],
+    }
+    with open(os.path.join(tmp, 'meta.json'), 'w') as f:
+        json.dump(meta, f)
+
+    _publish(tmp, out)
+
+    meta['seconds'] = round(time.time() - started, 1)
+    return meta
+
+
+# ==========================================
+# LESEN
+# ==========================================
+class _StringColumn:
+    """Texte aus Blob + Offsets; indexierbar wie eine Liste (auch für bisect)"""
+
+    def __init__(self, directory, name, count):
+        self.blob = _map(os.path.join(directory, f'{name}.bin'), np.uint8)
+        self.offsets = _map(os.path.join(directory, f'{name}.off'), np.int64, (count + 1,))
+        self.count = count
+
+    def __len__(self):
+        return self.count
+
+    def __getitem__(self, i):
+        return bytes(self.blob[self.offsets[i]:self.offsets[i + 1]]).decode('utf-8', errors='replace')
+
+
+class _SortedCodes:
+    """Barcodes in sortierter Reihenfolge (über code_order), für bisect"""
+
+    def __init__(self, codes, order):
+        self.codes = codes
+        self.order = order
+
+    def __len__(self):
+        return len(self.order)
+
+    def __getitem__(self, i):
+        return self.codes[self.order[i]]
+
+
+class OffStore:
+    """Nur-Lese-Zugriff auf einen mit ingest() gebauten Store"""
+
+    SORT_FIELDS = ('nutriscore',) + tuple(column for column, _ in NUTRIMENT_COLUMNS)
+
+    def __init__(self, directory):
+        # Symlink einmal auflösen, damit ein gleichzeitiger Ingest keine Versionen mischt
+        directory = self.directory = os.path.realpath(directory)
+        with open(os.path.join(directory, 'meta.json')) as f:
+            self.meta = json.load(f)
+        count = self.count = self.meta['count']
+
+        def path(name):
+            return os.path.join(directory, name)
+
+        self.nutriments = _map(path('nutriments.bin'), np.float32, (count, len(NUTRIMENT_COLUMNS)))
+        self.grades = _map(path('grades.bin'), np.uint8, (count,))
+        self.codes = _map(path('codes.bin'), CODE_DTYPE, (count,))
+        self.texts = {column: _StringColumn(directory, column, count) for column in TEXT_COLUMNS}
+
+        self.sorted_codes = _SortedCodes(self.codes, _map(path('code_order.bin'), np.int32, (count,)))
+        self.grade_rows = _map(path('grade_rows.bin'), np.int32, (count,))
+        self.grade_offsets = _map(path('grade_offsets.bin'), np.int64, (len(GRADES) + 1,))
+        self.category_tags = _StringColumn(directory, 'category_tags', self.meta['categories'])
+        self.category_offsets = _map(path('category_offsets.bin'), np.int64, (self.meta['categories'] + 1,))
+        self.category_rows = _map(path('category_rows.bin'), np.int32)
+
+    def product(self, row):
+        """Produkt im Format der OFF-Such-API"""
+        values = self.nutriments[row]
+        product = {
+            'code': self.codes[row].decode(),
+            'product_name': self.texts['product_name'][row],
+            'brands': self.texts['brands'][row],
+            'image_url': self.texts['image_url'][row],
+            'categories': self.texts['categories'][row],
+            'nutriments': {
+                key: round(float(value), 2)
+                for (_, key), value in zip(NUTRIMENT_COLUMNS, values) if not np.isnan(value)
+            },
+        }
+        # Wie bei OFF fehlt das Feld ohne Nutri-Score
+        if self.grades[row]:
+            product['nutrition_grades'] = GRADES[self.grades[row]]
+        return product
+
+    def lookup(self, barcode):
+        """Projizierte Nährwerte für einen Barcode oder None"""
+        key = barcode.encode()
+        i = bisect.bisect_left(self.sorted_codes, key)
+        if i < len(self.sorted_codes) and self.sorted_codes[i] == key:
+            return project_nutrition(self.product(int(self.sorted_codes.order[i])))
+        return None
+
+    def _category_rows(self, category):
+        tag = category_tag(category)
+        i = bisect.bisect_left(self.category_tags, tag)
+        if i == len(self.category_tags) or self.category_tags[i] != tag:
+            return np.zeros(0, dtype=np.int32)
+        return self.category_rows[self.category_offsets[i]:self.category_offsets[i + 1]]
+
+    def _sort_keys(self, rows, sort, descending):
+        if sort == 'nutriscore':
+            values = (self.grades if rows is None else self.grades[rows]).astype(np.float64)
+            values[values == 0] = np.nan
+        else:
+            column = self.SORT_FIELDS.index(sort) - 1
+            values = (self.nutriments[:, column] if rows is None else self.nutriments[rows, column]).astype(np.float64)
+        if descending:
+            values = -values
+        # Produkte ohne Wert immer ans Ende
+        values[np.isnan(values)] = np.inf
+        return values
+
+    def search(self, grade=None, category=None, sort=None, descending=False, page=1, page_size=20):
+        """
+        Produkte nach Nutri-Score und/oder Kategorie, sortiert und seitenweise
+        Für eine Seite wird nur bis zu deren Ende partitioniert statt alles zu sortieren.
+        """
+        rows = None
+        if grade in GRADES[1:]:
+            g = GRADES.index(grade)
+            rows = self.grade_rows[self.grade_offsets[g]:self.grade_offsets[g + 1]]
+        if category:
+            category_rows = self._category_rows(category)
+            rows = category_rows if rows is None else np.intersect1d(rows, category_rows, assume_unique=True)
+
+        total = self.count if rows is None else len(rows)
+        start = (page - 1) * page_size
+        end = min(start + page_size, total)
+
+        if start >= total:
+            selected = []
+        elif sort not in self.SORT_FIELDS:
+            selected = np.arange(start, end) if rows is None else rows[start:end]
+        else:
+            keys = self._sort_keys(rows, sort, descending)
+            kth = np.partition(keys, end - 1)[end - 1]
+            # Bei Gleichstand entscheidet die Zeilennummer -> stabile Seiten
+            below = np.flatnonzero(keys < kth)
+            top = np.concatenate([below, np.flatnonzero(keys == kth)[:end - len(below)]])
+            top = top[np.lexsort((top, keys[top]))][start:end]
+            selected = top if rows is None else rows[top]
+
+        return {
+            'count': int(total),
+            'page': page,
+            'page_size': page_size,
+            'sort': sort if sort in self.SORT_FIELDS else None,
+            'products': [self.product(int(row)) for row in selected],
+        }
+
+    def stats(self):
+        return {**self.meta, 'path': self.directory}
+
+
+_store = None
+_store_failed_at = 0.0
+_store_lock = threading.Lock()
+
+
+def get_off_store():
+    """
+    Store-Singleton, falls OFF_MODE=store aktiv ist und der Store existiert, sonst None
+    Schlägt das Laden fehl, wird es frühestens nach OFF_STORE_RETRY_SECONDS erneut versucht.
+    """
+    global _store, _store_failed_at
+    if OFF_MODE != 'store':
+        return None
+    if _store is None and time.time() - _store_failed_at >= OFF_STORE_RETRY_SECONDS:
+        with _store_lock:
+            if _store is None and time.time() - _store_failed_at >= OFF_STORE_RETRY_SECONDS:
+                try:
+                    _store = OffStore(OFF_STORE_PATH)
+                except (OSError, ValueError, KeyError) as e:
+                    print(f"Error in off store load: {str(e)}")
+                    _store_failed_at = time.time()
+    return _store
+
+
+def main():
+    common = argparse.ArgumentParser(add_help=False)
+    common.add_argument('--out', default=OFF_STORE_PATH, help='Verzeichnis des Stores')
+    parser = argparse.ArgumentParser(description='Offline-Store für Open-Food-Facts-Dumps')
+    sub = parser.add_subparsers(dest='command', required=True)
+
+    ingest_parser = sub.add_parser('ingest', parents=[common], help='OFF-Dump (JSONL/CSV, optional .gz) einlesen')
+    ingest_parser.add_argument('path')
+    ingest_parser.add_argument('--chunk', type=int, default=OFF_INGEST_CHUNK)
+    sub.add_parser('stats', parents=[common], help='Store-Statistik ausgeben')
+
+    args = parser.parse_args()
+
+    if args.command == 'ingest':
+        print(json.dumps(ingest(args.path, out=args.out, chunk=args.chunk), indent=2))
+    elif args.command == 'stats':
+        print(json.dumps(OffStore(args.out).stats(), indent=2))
+
+
+if __name__ == '__main__':
+    main()
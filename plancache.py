@@ -0,0 +1,174 @@
+"""
+Cache für generierte KI-Wochenpläne
+
+Gleiche Eingaben (Ziel, Kalorien, Protein, Präferenz) mit gleichem Prompt und
+gleichen Kandidaten liefern einen bereits generierten Plan statt eines neuen
+OpenAI-Calls. Gleichzeitige identische Anfragen teilen sich einen laufenden
+Call (Single-Flight). Optional werden pro Schlüssel mehrere Pläne behalten und
+zufällig ausgeliefert, damit nicht jeder Nutzer denselben Plan sieht.
+"""
+import asyncio
+import os
+import random
+import threading
+import time
+from collections import OrderedDict, deque
+from concurrent.futures import Future
+
+
+# ==========================================
+# KONFIGURATION
+# ==========================================
+PLAN_CACHE_MAX_ENTRIES = int(os.getenv('PLAN_CACHE_MAX_ENTRIES', '500'))
+PLAN_CACHE_TTL = float(os.getenv('PLAN_CACHE_TTL', str(6 * 3600)))
+# Anzahl Pläne pro Schlüssel; erst wenn so viele vorliegen, wird zufällig ausgeliefert
+PLAN_CACHE_VARIANTS = int(os.getenv('PLAN_CACHE_VARIANTS', '1'))
+
+
+class PlanCache:
+    """Größenbegrenzter LRU-Cache mit TTL und Single-Flight für KI-Pläne"""
+
+    def __init__(self, max_entries=PLAN_CACHE_MAX_ENTRIES, ttl=PLAN_CACHE_TTL,
+                 variants=PLAN_CACHE_VARIANTS):
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self.variants = max(1, variants)
+
+        self._entries = OrderedDict()  # key -> deque[(plan, expires_at)]
+        self._lock = threading.Lock()
+        self._inflight = {}            # key -> concurrent.futures.Future
+        self._ainflight = {}           # key -> asyncio.Future
+
+        self.stats = {
+            'hits': 0,
+            'misses': 0,
+            'coalesced': 0,
+            'errors': 0,
+            'evictions': 0,
+        }
+
+    def _pick(self, key):
+        """Zufälliger gültiger Plan, sobald genug Varianten vorliegen (Lock muss gehalten werden)"""
+        plans = self._entries.get(key)
+        if plans is None:
+            return None
+
+        now = time.time()
+        while plans and plans[0][1] <= now:
+            plans.popleft()
+        if not plans:
+            del self._entries[key]
+            return None
+
+        self._entries.move_to_end(key)
+        if len(plans) < self.variants:
+            return None
+        return random.choice(plans)[0]
+
+    def get(self, key):
+        """Liefert einen gecachten Plan ohne zu generieren, sonst None"""
+        with self._lock:
+            plan = self._pick(key)
+            self.stats['hits' if plan is not None else 'misses'] += 1
+            return plan
+
+    def add(self, key, plan):
+        with self._lock:
+            plans = self._entries.get(key)
+            if plans is None:
+                plans = self._entries[key] = deque(maxlen=self.variants)
+            plans.append((plan, time.time() + self.ttl))
+            self._entries.move_to_end(key)
+
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+                self.stats['evictions'] += 1
+
+    def get_or_generate(self, key, generate):
+        """Liefert einen gecachten Plan oder ruft generate() genau einmal pro Schlüssel auf"""
+        with self._lock:
+            plan = self._pick(key)
+            if plan is not None:
+                self.stats['hits'] += 1
+                return plan
+
+            future = self._inflight.get(key)
+            leader = future is None
+            if leader:
+                future = self._inflight[key] = Future()
+                self.stats['misses'] += 1
+            else:
+                self.stats['coalesced'] += 1
+
+        if not leader:
+            # Identische Anfrage läuft bereits -> auf deren Ergebnis warten
+            return future.result()
+
+        try:
+            plan = generate()
+            self.add(key, plan)
+            future.set_result(plan)
+            return plan
+        except BaseException as e:
+            self.stats['errors'] += 1
+            future.set_exception(e)
+            raise
+        finally:
+            with self._lock:
+                self._inflight.pop(key, None)
+
+    async def aget_or_generate(self, key, generate):
+        """Async-Variante von get_or_generate; generate ist eine Coroutine-Funktion"""
+        with self._lock:
+            plan = self._pick(key)
+            if plan is not None:
+                self.stats['hits'] += 1
+                return plan
+
+            future = self._ainflight.get(key)
+            leader = future is None
+            if leader:
+                future = self._ainflight[key] = asyncio.get_running_loop().create_future()
+                self.stats['misses'] += 1
+            else:
+                self.stats['coalesced'] += 1
+
+        if not leader:
+            # shield: ein abgebrochener Wartender bricht nicht den geteilten Call ab
+            return await asyncio.shield(future)
+
+        try:
+            plan = await generate()
+            self.add(key, plan)
+            future.set_result(plan)
+            return plan
+        except asyncio.CancelledError:
+            future.cancel()
+            raise
+        except Exception as e:
+            self.stats['errors'] += 1
+            future.set_exception(e)
+            # Ohne Wartende sonst "Future exception was never retrieved"
+            future.exception()
+            raise
+        finally:
+            with self._lock:
+                self._ainflight.pop(key, None)
+
+    def get_stats(self):
+        with self._lock:
+            entries = len(self._entries)
+            plans = sum(len(p) for p in self._entries.values())
+            inflight = len(self._inflight) + len(self._ainflight)
+        return {
+            **self.stats,
+            'entries': entries,
+            'plans': plans,
+            'inflight': inflight,
+            'max_entries': self.max_entries,
+            'ttl': self.ttl,
+            'variants': self.variants,
+        }
+
+
+plan_cache = PlanCache()
@@ -0,0 +1,543 @@
+"""
+KI-Wochenplaner: Kandidaten, Prompt, Antwort-Parsing und Auflösung der Rezepte
+
+Wird von der synchronen Flask-Route und dem ASGI-Pfad gemeinsam genutzt.
+"""
+import hashlib
+import json
+import os
+import re
+import unicodedata
+from collections import Counter, defaultdict
+
+from nutrition import estimate_recipes_nutrition
+
+
+OPENAI_MODEL = "gpt-4o-mini"
+OPENAI_TEMPERATURE = 0.7
+OPENAI_MAX_TOKENS = 2000
+OPENAI_TIMEOUT = float(os.getenv('OPENAI_TIMEOUT', '60'))
+SYSTEM_PROMPT = "Du bist ein Ernährungsexperte. Antworte IMMER nur mit validem JSON, keine zusätzlichen Texte."
+
+DAYS = ['monday', 'tuesday', 'wednesday', 'thursday', 'friday', 'saturday', 'sunday']
+MEAL_TYPES = ['breakfast', 'lunch', 'dinner']
+
+# Abfragen pro Ziel: Suchbegriffe (search.php), Kategorien und Küchen (filter.php)
+# Der erste Suchbegriff ist jeweils das bisherige einzelne Suchwort
+GOAL_QUERIES = {
+    'Muskelaufbau': {
+        'search': ['chicken', 'beef'],
+        'categories': ['Chicken', 'Beef', 'Seafood', 'Breakfast'],
+        'areas': [],
+    },
+    'Abnehmen': {
+        'search': ['salad', 'soup'],
+        'categories': ['Seafood', 'Vegetarian', 'Starter'],
+        'areas': ['Japanese', 'Thai'],
+    },
+    'Vegan': {
+        'search': ['vegan', 'tofu'],
+        'categories': ['Vegan'],
+        'areas': [],
+    },
+    'Vegetarisch': {
+        'search': ['vegetarian', 'vegetable'],
+        'categories': ['Vegetarian', 'Vegan', 'Pasta'],
+        'areas': [],
+    },
+    'Gesund essen': {
+        'search': ['healthy', 'salad'],
+        'categories': ['Seafood', 'Vegetarian', 'Chicken', 'Breakfast'],
+        'areas': ['Greek', 'Japanese'],
+    },
+    'High Protein': {
+        'search': ['chicken', 'egg'],
+        'categories': ['Chicken', 'Beef', 'Seafood', 'Goat'],
+        'areas': [],
+    },
+    'Ausgewogen': {
+        'search': ['chicken', 'rice'],
+        'categories': ['Chicken', 'Vegetarian', 'Seafood', 'Pasta', 'Breakfast'],
+        'areas': ['Italian'],
+    },
+    'Energie & Leistung': {
+        'search': ['chicken', 'pasta'],
+        'categories': ['Pasta', 'Chicken', 'Breakfast'],
+        'areas': ['Mexican'],
+    },
+}
+FALLBACK_SEARCH_TERM = 'chicken'
+DEFAULT_GOAL_QUERIES = {
+    'search': [FALLBACK_SEARCH_TERM],
+    'categories': ['Chicken', 'Vegetarian', 'Seafood', 'Breakfast'],
+    'areas': [],
+}
+
+# Größe des Kandidaten-Pools und wie viele davon im Prompt landen
+PLANNER_POOL_SIZE = int(os.getenv('PLANNER_POOL_SIZE', '60'))
+PLANNER_PROMPT_CANDIDATES = int(os.getenv('PLANNER_PROMPT_CANDIDATES', '40'))
+
+# Mindest-Ähnlichkeit (Dice über Trigramme) für unscharfe Namens-Treffer
+FUZZY_MIN_SCORE = 0.45
+
+# solver: nur lokaler Optimierer, llm: KI (Optimierer als Fallback),
+# hybrid: KI-Plan, ungültige/fehlende Slots vom Optimierer gefüllt
+PLANNER_MODES = ('solver', 'llm', 'hybrid')
+PLANNER_MODE = os.getenv('PLANNER_MODE', 'llm')
+
+
+def read_plan_request(data):
+    """Liest Ziel, Kalorien, Protein, Präferenz und Modus aus dem Request-Body"""
+    return {
+        'goal': data.get('goal', 'Gesund essen'),
+        'calories': data.get('calories', 2000),
+        'protein': data.get('protein', 100),
+        'dietary': data.get('dietary', ''),
+        'mode': plan_mode(data),
+    }
+
+
+def plan_mode(data):
+    """Gewünschter Modus aus dem Request-Body, sonst PLANNER_MODE"""
+    mode = str(data.get('mode') or PLANNER_MODE).lower()
+    return mode if mode in PLANNER_MODES else 'llm'
+
+
+def candidate_queries(goal):
+    """Abfragen für den Kandidaten-Pool eines Ziels: [(path, params)]"""
+    queries = GOAL_QUERIES.get(goal, DEFAULT_GOAL_QUERIES)
+    return (
+        [('search.php', {'s': term}) for term in queries['search']]
+        + [('filter.php', {'c': category}) for category in queries['categories']]
+        + [('filter.php', {'a': area}) for area in queries['areas']]
+    )
+
+
+def _candidate(meal, category=None, area=None):
+    return {
+        'id': meal['idMeal'],
+        'name': meal['strMeal'],
+        'category': meal.get('strCategory') or category or 'Unknown',
+        'area': meal.get('strArea') or area or 'Unknown',
+        'thumb': meal.get('strMealThumb', '')
+    }
+
+
+def build_meal_list(available_meals, limit=PLANNER_POOL_SIZE):
+    """Erstellt die Meal-Liste für die KI aus search.php-Ergebnissen"""
+    meal_list = []
+    for meal in (available_meals or [])[:limit]:
+        if meal:
+            meal_list.append(_candidate(meal))
+    return meal_list
+
+
+def rank_candidates(queries, results, pool_size=PLANNER_POOL_SIZE):
+    """
+    Führt die Ergebnisse mehrerer Abfragen zu einem Pool zusammen
+    Dedupliziert per ID; Rezepte, die mehrere Abfragen liefern, zuerst, danach
+    abwechselnd aus allen Abfragen (Rang 1 jeder Abfrage, dann Rang 2, ...).
+    filter.php liefert keine Kategorie -> aus der Abfrage übernehmen.
+    """
+    entries = {}
+    for query_index, ((_, params), meals) in enumerate(zip(queries, results)):
+        for position, meal in enumerate(meals or []):
+            if not meal or not meal.get('idMeal'):
+                continue
+            entry = entries.get(meal['idMeal'])
+            if entry is None:
+                entry = entries[meal['idMeal']] = {
+                    'hits': 0,
+                    'rank': (position, query_index),
+                    'meal': _candidate(meal, params.get('c'), params.get('a')),
+                }
+            else:
+                if entry['meal']['category'] == 'Unknown' and (meal.get('strCategory') or params.get('c')):
+                    entry['meal']['category'] = meal.get('strCategory') or params['c']
+                if entry['meal']['area'] == 'Unknown' and (meal.get('strArea') or params.get('a')):
+                    entry['meal']['area'] = meal.get('strArea') or params['a']
+                if not entry['meal']['thumb']:
+                    entry['meal']['thumb'] = meal.get('strMealThumb', '')
+            entry['hits'] += 1
+
+    ranked = sorted(entries.values(), key=lambda entry: (-entry['hits'], entry['rank']))[:pool_size]
+
+    # search.php liefert komplette Rezepte -> Nährwerte aus den Zutaten, in einem Durchgang
+    full_meals = {}
+    for meals in results:
+        for meal in meals or []:
+            if meal and meal.get('strIngredient1') and meal.get('idMeal') in entries:
+                full_meals.setdefault(meal['idMeal'], meal)
+    computed = estimate_recipes_nutrition(full_meals.values())
+    for entry in ranked:
+        nutrition = computed.get(entry['meal']['id'], {}).get('nutrition')
+        if nutrition and nutrition.get('source') == 'ingredients':
+            entry['meal']['nutrition'] = {macro: nutrition[macro] for macro in ('calories', 'protein', 'carbs', 'fat')}
+
+    return [entry['meal'] for entry in ranked]
+
+
+def build_prompt(meal_list, goal, calories, protein, dietary_preference):
+    """KI-Prompt erstellen"""
+    return f"""
+Du bist ein professioneller Ernährungsberater. Erstelle einen ausgewogenen 7-Tage Wochenplan.
+
+NUTZERZIEL: {goal}
+TAGESZIEL KALORIEN: {calories} kcal
+TAGESZIEL PROTEIN: {protein}g
+ERNÄHRUNGSPRÄFERENZ: {dietary_preference if dietary_preference else 'Keine Einschränkung'}
+
+VERFÜGBARE REZEPTE (nutze NUR diese):
+{chr(10).join([f"- {m['name']}" for m in meal_list[:PLANNER_PROMPT_CANDIDATES]])}
+
+AUFGABEN:
+1. Wähle für jeden Wochentag (Montag bis Sonntag) genau 3 Mahlzeiten aus
+2. Mahlzeiten: Frühstück, Mittagessen, Abendessen
+3. Nutze AUSSCHLIESSLICH Rezepte aus der obigen Liste
+4. Verteile Protein gleichmäßig über den Tag (Ziel: {protein}g/Tag)
+5. Achte auf Abwechslung - kein Rezept mehr als 2x pro Woche
+6. Berücksichtige das Ziel "{goal}"
+
+WICHTIG: Antworte AUSSCHLIESSLICH mit folgendem JSON-Format (keine Erklärungen drumherum):
+
+{{
+  "monday": {{
+    "breakfast": "Exakter Rezeptname aus Liste",
+    "lunch": "Exakter Rezeptname aus Liste",
+    "dinner": "Exakter Rezeptname aus Liste"
+  }},
+  "tuesday": {{
+    "breakfast": "Exakter Rezeptname aus Liste",
+    "lunch": "Exakter Rezeptname aus Liste",
+    "dinner": "Exakter Rezeptname aus Liste"
+  }},
+  "wednesday": {{
+    "breakfast": "Exakter Rezeptname aus Liste",
+    "lunch": "Exakter Rezeptname aus Liste",
+    "dinner": "Exakter Rezeptname aus Liste"
+  }},
+  "thursday": {{
+    "breakfast": "Exakter Rezeptname aus Liste",
+    "lunch": "Exakter Rezeptname aus Liste",
+    "dinner": "Exakter Rezeptname aus Liste"
+  }},
+  "friday": {{
+    "breakfast": "Exakter Rezeptname aus Liste",
+    "lunch": "Exakter Rezeptname aus Liste",
+    "dinner": "Exakter Rezeptname aus Liste"
+  }},
+  "saturday": {{
+    "breakfast": "Exakter Rezeptname aus Liste",
+    "lunch": "Exakter Rezeptname aus Liste",
+    "dinner": "Exakter Rezeptname aus Liste"
+  }},
+  "sunday": {{
+    "breakfast": "Exakter Rezeptname aus Liste",
+    "lunch": "Exakter Rezeptname aus Liste",
+    "dinner": "Exakter Rezeptname aus Liste"
+  }},
+  "reasoning": "2-3 Sätze warum dieser Plan optimal für '{goal}' ist"
+}}
+"""
+
+
+def build_messages(prompt):
+    return [
+        {
+            "role": "system",
+            "content": SYSTEM_PROMPT
+        },
+        {
+            "role": "user",
+            "content": prompt
+        }
+    ]
+
+
+def parse_plan_response(ai_response):
+    """Parst die KI-Antwort (JSON, ggf. in Markdown eingebettet)"""
+    ai_response = ai_response.strip()
+
+    # Clean JSON (entferne Markdown falls vorhanden)
+    json_match = re.search(r'```json\s*(.*?)\s*```', ai_response, re.DOTALL)
+    if json_match:
+        ai_response = json_match.group(1)
+
+    # Parse JSON
+    try:
+        return json.loads(ai_response)
+    except json.JSONDecodeError:
+        # Fallback: Versuche JSON zu extrahieren
+        json_start = ai_response.find('{')
+        json_end = ai_response.rfind('}') + 1
+        if json_start != -1 and json_end > json_start:
+            return json.loads(ai_response[json_start:json_end])
+        raise
+
+
+def normalize_name(name):
+    """Kleinbuchstaben, ohne Akzente und Satzzeichen, einfache Leerzeichen"""
+    name = unicodedata.normalize('NFKD', name or '')
+    name = ''.join(ch for ch in name if not unicodedata.combining(ch))
+    return ' '.join(re.sub(r'[^0-9a-z]+', ' ', name.lower()).split())
+
+
+def _trigrams(key):
+    padded = f'  {key} '
+    return {padded[i:i + 3] for i in range(len(padded) - 2)}
+
+
+class MealIndex:
+    """
+    Namensindex über die Kandidaten
+    Exakter Treffer (normalisiert) per Dict, sonst Trigramm-Ähnlichkeit über
+    eine invertierte Liste; Teilstring-Treffer werden wie bisher bevorzugt.
+    """
+
+    def __init__(self, meal_list):
+        self.meals = list(meal_list)
+        self._exact = {}
+        self._keys = []
+        self._postings = defaultdict(list)
+        for i, meal in enumerate(self.meals):
+            key = normalize_name(meal['name'])
+            self._exact.setdefault(key, meal)
+            grams = _trigrams(key)
+            self._keys.append((key, len(grams)))
+            for gram in grams:
+                self._postings[gram].append(i)
+
+    def find(self, meal_name):
+        key = normalize_name(str(meal_name))
+        if not key:
+            return None
+
+        meal = self._exact.get(key)
+        if meal is not None:
+            return meal
+
+        grams = _trigrams(key)
+        shared = Counter()
+        for gram in grams:
+            shared.update(self._postings.get(gram, ()))
+
+        best = None
+        for i, count in shared.items():
+            candidate_key, candidate_grams = self._keys[i]
+            score = 2 * count / (len(grams) + candidate_grams)
+            if key in candidate_key or candidate_key in key:
+                score += 1
+            if score >= FUZZY_MIN_SCORE and (best is None or (score, -i) > (best[0], -best[1])):
+                best = (score, i)
+        return self.meals[best[1]] if best else None
+
+
+def meal_index(meals):
+    return meals if isinstance(meals, MealIndex) else MealIndex(meals)
+
+
+def find_meal(meals, meal_name):
+    """Sucht ein Rezept per normalisiertem Namen, sonst per Trigramm-Ähnlichkeit"""
+    return meal_index(meals).find(meal_name)
+
+
+def attach_meal_refs(plan_data, meal_list, days=DAYS):
+    """
+    Füge Meal IDs und Bilder hinzu
+    Bilder kommen direkt aus der search.php-Antwort, kein Lookup pro Slot.
+    Liefert die Slots, deren Bild noch fehlt: [(day, meal_type, meal_id)]
+    """
+    missing_thumbs = []
+    index = meal_index(meal_list)
+
+    for day in days:
+        if day in plan_data:
+            for meal_type in MEAL_TYPES:
+                if meal_type in plan_data[day]:
+                    matching_meal = index.find(plan_data[day][meal_type])
+
+                    if matching_meal:
+                        plan_data[day][f'{meal_type}_id'] = matching_meal['id']
+                        if matching_meal['thumb']:
+                            plan_data[day][f'{meal_type}_thumb'] = matching_meal['thumb']
+                        else:
+                            missing_thumbs.append((day, meal_type, matching_meal['id']))
+
+    return missing_thumbs
+
+
+def apply_thumbs(plan_data, missing_thumbs, details):
+    """Trägt nachgeladene Bilder in den Plan ein"""
+    for day, meal_type, meal_id in missing_thumbs:
+        if details.get(meal_id):
+            plan_data[day][f'{meal_type}_thumb'] = details[meal_id].get('strMealThumb', '')
+
+
+def _prompt_template_hash():
+    # Platzhalter statt echter Werte -> ändert sich nur mit dem Prompt-Text selbst
+    template = build_prompt([], '{goal}', '{calories}', '{protein}', '{dietary}')
+    parts = [OPENAI_MODEL, str(OPENAI_TEMPERATURE), str(OPENAI_MAX_TOKENS), SYSTEM_PROMPT, template]
+    return hashlib.sha256('\x00'.join(parts).encode('utf-8')).hexdigest()[:12]
+
+
+PROMPT_TEMPLATE_HASH = _prompt_template_hash()
+
+
+def _normalize_number(value):
+    try:
+        return int(round(float(value)))
+    except (TypeError, ValueError):
+        return str(value).strip()
+
+
+def plan_cache_key(params, meal_list):
+    """Cache-Schlüssel: normalisierte Eingaben + Prompt-Template + Kandidatenliste"""
+    candidates = ','.join(m['id'] for m in meal_list)
+    candidates_hash = hashlib.sha256(candidates.encode('utf-8')).hexdigest()[:12]
+    return 'plan:{}|{}|{}|{}|{}|{}|{}'.format(
+        params.get('mode', 'llm'),
+        ' '.join(str(params['goal']).split()).lower(),
+        _normalize_number(params['calories']),
+        _normalize_number(params['protein']),
+        ' '.join(str(params['dietary'] or '').split()).lower(),
+        PROMPT_TEMPLATE_HASH,
+        candidates_hash,
+    )
+
+
+def plan_response(plan_data, params, source='llm'):
+    return {
+        'success': True,
+        'plan': plan_data,
+        'source': source,
+        'goal': params['goal'],
+        'daily_targets': {
+            'calories': params['calories'],
+            'protein': params['protein']
+        }
+    }
+
+
+# ==========================================
+# STREAMING
+# ==========================================
+class PlanStreamParser:
+    """
+    Inkrementeller Parser für die gestreamte KI-Antwort
+    Liefert jeden Top-Level-Eintrag ("monday": {...}, "reasoning": "...")
+    sobald sein Wert vollständig ist. Markdown-Fences vor dem JSON werden
+    übersprungen; jedes Zeichen wird genau einmal betrachtet. Zahlen, true,
+    false und null enden am nächsten Komma bzw. an der schließenden Klammer.
+
+    >>> parser = PlanStreamParser()
+    >>> parser.feed('{"version": 2, "monday": {"breakfast": "Eggs"}, "ok": tr')
+    [('version', 2), ('monday', {'breakfast': 'Eggs'})]
+    >>> parser.feed('ue, "reasoning": "x", "n": null}')
+    [('ok', True), ('reasoning', 'x'), ('n', None)]
+    """
+
+    def __init__(self):
+        self.buffer = ''
+        self.pos = 0
+        self.depth = 0
+        self.in_string = False
+        self.escape = False
+        self.started = False
+        self.key = None
+        self.key_start = None
+        self.value_start = None
+        self.result = {}
+
+    def feed(self, text):
+        """Nimmt den nächsten Textabschnitt an und liefert fertige (key, value)-Paare"""
+        self.buffer += text
+        completed = []
+
+        while self.pos < len(self.buffer):
+            ch = self.buffer[self.pos]
+
+            if not self.started:
+                if ch == '{':
+                    self.started = True
+                    self.depth = 1
+                self.pos += 1
+                continue
+
+            if self.in_string:
+                if self.escape:
+                    self.escape = False
+                elif ch == '\\':
+                    self.escape = True
+                elif ch == '"':
+                    self.in_string = False
+                    if self.depth == 1 and self.value_start is None:
+                        # Ende eines Top-Level-Schlüssels
+                        self.key = json.loads(self.buffer[self.key_start:self.pos + 1])
+                    elif self.depth == 1 and self.buffer[self.value_start] == '"':
+                        # Ende eines Top-Level-String-Werts
+                        completed.append(self._complete(self.pos + 1))
+                self.pos += 1
+                continue
+
+            if self.depth == 1 and self.value_start is not None and ch in ',}':
+                if self.buffer[self.value_start] not in '"{[':
+                    # Ende eines Top-Level-Skalars (Zahl, true, false, null)
+                    completed.append(self._complete(self.pos))
+
+            if ch == '"':
+                self.in_string = True
+                if self.depth == 1 and self.key is None:
+                    self.key_start = self.pos
+                elif self.depth == 1 and self.value_start is None:
+                    self.value_start = self.pos
+            elif ch in '{[':
+                if self.depth == 1 and self.key is not None and self.value_start is None:
+                    self.value_start = self.pos
+                self.depth += 1
+            elif self.depth == 1 and self.key is not None and self.value_start is None and ch not in ': \t\r\n':
+                self.value_start = self.pos
+            elif ch in '}]':
+                self.depth -= 1
+                if self.depth == 1 and self.value_start is not None:
+                    completed.append(self._complete(self.pos + 1))
+                elif self.depth == 0:
+                    self.started = False
+            self.pos += 1
+
+        return [item for item in completed if item is not None]
+
+    def _complete(self, end):
+        key, raw = self.key, self.buffer[self.value_start:end]
+        self.key = None
+        self.key_start = None
+        self.value_start = None
+        try:
+            value = json.loads(raw)
+        except json.JSONDecodeError:
+            return None
+        self.result[key] = value
+        return key, value
+
+
+def sse_event(event, data):
+    """Formatiert ein Server-Sent-Event"""
+    return f"event: {event}\ndata: {json.dumps(data, ensure_ascii=False)}\n\n"
+
+
+def plan_meta(params):
+    return {
+        'goal': params['goal'],
+        'daily_targets': {
+            'calories': params['calories'],
+            'protein': params['protein']
+        }
+    }
+
+
+def replay_plan_events(plan_data):
+    """SSE-Events eines fertigen (z.B. gecachten) Plans in Stream-Reihenfolge"""
+    for day in DAYS:
+        if isinstance(plan_data.get(day), dict):
+            yield sse_event('day', {'day': day, 'meals': plan_data[day]})
+    if 'reasoning' in plan_data:
+        yield sse_event('reasoning', {'reasoning': plan_data['reasoning']})
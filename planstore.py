@@ -0,0 +1,470 @@
+"""
+Serverseitiger Wochenplan mit laufend aktualisierten Summen
+
+Pro Plan werden die Mahlzeiten pro Tag gespeichert und zusätzlich
+materialisiert:
+  - Nährwert-Summen pro Tag (week_plan_days)
+  - die zusammengefasste Zutatenliste für die Einkaufsliste (week_plan_items)
+Jede Änderung rechnet nur den Beitrag der betroffenen Mahlzeit ein bzw.
+heraus; Lesen braucht weder Rezepte noch eine Neuberechnung. Der Beitrag
+jeder Mahlzeit wird mitgespeichert, damit Entfernen genau das abzieht, was
+beim Hinzufügen addiert wurde. Die SQLite-Datei ist zwischen allen Workern
+geteilt; Import und Export nutzen das localStorage-Format des Frontends.
+"""
+import json
+import math
+import os
+import sqlite3
+import threading
+import time
+import uuid
+from collections import OrderedDict
+from contextlib import contextmanager
+
+from ingredients import IngredientAggregator
+from nutrition import MACROS, WEEK_DAYS, summarize_days
+from sqlitedb import ThreadLocalConnection
+
+
+# ==========================================
+# KONFIGURATION
+# ==========================================
+PLAN_STORE_PATH = os.getenv('PLAN_STORE_PATH', 'week_plans.db')
+# Pläne ohne Änderung werden nach dieser Zeit gelöscht
+PLAN_STORE_TTL = float(os.getenv('PLAN_STORE_TTL', str(90 * 24 * 3600)))
+PLAN_STORE_MAX_MEALS = int(os.getenv('PLAN_STORE_MAX_MEALS', '100'))
+# Obergrenze für alle Pläne; darüber fallen die am längsten unveränderten weg
+PLAN_STORE_MAX_PLANS = int(os.getenv('PLAN_STORE_MAX_PLANS', '100000'))
+# Neue Pläne pro Client und Minute, darüber 429 (0 = aus)
+PLAN_STORE_CREATE_RATE = int(os.getenv('PLAN_STORE_CREATE_RATE', '20'))
+
+
+class PlanFull(ValueError):
+    """Plan hat bereits PLAN_STORE_MAX_MEALS Mahlzeiten"""
+
+
+class PlanRateLimited(Exception):
+    """Client hat in der letzten Minute schon PLAN_STORE_CREATE_RATE Pläne angelegt"""
+
+    def __init__(self, retry_after=1):
+        super().__init__('Zu viele neue Wochenpläne, bitte später erneut versuchen')
+        self.retry_after = max(1, int(math.ceil(retry_after)))
+
+
+def _number(value):
+    # Summen entstehen aus Additionen und Subtraktionen -> Rundungsreste glätten
+    value = round(value, 2)
+    return int(value) if value == int(value) else value
+
+
+class WeekPlanStore:
+    """SQLite-Store: Plan -> Mahlzeiten, Tagessummen und Zutatenliste"""
+
+    def __init__(self, path, ttl=PLAN_STORE_TTL, max_meals=PLAN_STORE_MAX_MEALS,
+                 max_plans=PLAN_STORE_MAX_PLANS, create_rate=PLAN_STORE_CREATE_RATE):
+        self.path = path
+        self.ttl = ttl
+        self.max_meals = max_meals
+        self.max_plans = max_plans
+        self.create_rate = create_rate
+        # Autocommit, Änderungen explizit über _transaction()
+        self._db = ThreadLocalConnection(path, isolation_level=None)
+        self._conn = self._db.get
+        self._writes = 0
+
+        self.stats = {
+            'created': 0,
+            'added': 0,
+            'removed': 0,
+            'cleared': 0,
+            'imported': 0,
+            'rate_limited': 0,
+        }
+
+        conn = self._conn()
+        conn.execute(
+            'CREATE TABLE IF NOT EXISTS week_plans ('
+            ' id TEXT PRIMARY KEY,'
+            ' version INTEGER NOT NULL DEFAULT 0,'
+            ' meal_count INTEGER NOT NULL DEFAULT 0,'   # Einträge mit Rezept-ID (für die Einkaufsliste)
+            ' entries INTEGER NOT NULL DEFAULT 0,'
+            ' created_at REAL NOT NULL,'
+            ' updated_at REAL NOT NULL)'
+        )
+        conn.execute('CREATE INDEX IF NOT EXISTS idx_week_plans_updated ON week_plans (updated_at)')
+        conn.execute(
+            'CREATE TABLE IF NOT EXISTS week_plan_creates ('
+            ' client TEXT NOT NULL,'
+            ' created_at REAL NOT NULL)'
+        )
+        conn.execute('CREATE INDEX IF NOT EXISTS idx_week_plan_creates ON week_plan_creates (client, created_at)')
+        conn.execute(
+            'CREATE TABLE IF NOT EXISTS week_plan_meals ('
+            ' entry_id INTEGER PRIMARY KEY AUTOINCREMENT,'
+            ' plan_id TEXT NOT NULL,'
+            ' day TEXT NOT NULL,'
+            ' meal_id TEXT NOT NULL,'
+            ' name TEXT, thumb TEXT, category TEXT,'
+            ' nutrition TEXT,'          # NULL = keine Nährwerte bekannt
+            ' ingredients TEXT,'        # Zutaten-Beitrag, NULL = kein Rezept
+            ' counted INTEGER NOT NULL,'
+            ' missing INTEGER NOT NULL)'
+        )
+        conn.execute('CREATE INDEX IF NOT EXISTS idx_week_plan_meals_plan ON week_plan_meals (plan_id, day)')
+        conn.execute(
+            'CREATE TABLE IF NOT EXISTS week_plan_days ('
+            ' plan_id TEXT NOT NULL,'
+            ' day TEXT NOT NULL,'
+            ' calories REAL NOT NULL DEFAULT 0, protein REAL NOT NULL DEFAULT 0,'
+            ' carbs REAL NOT NULL DEFAULT 0, fat REAL NOT NULL DEFAULT 0,'
+            ' meals INTEGER NOT NULL DEFAULT 0,'     # Mahlzeiten mit Nährwerten
+            ' entries INTEGER NOT NULL DEFAULT 0,'
+            ' PRIMARY KEY (plan_id, day))'
+        )
+        conn.execute(
+            'CREATE TABLE IF NOT EXISTS week_plan_items ('
+            ' plan_id TEXT NOT NULL,'
+            ' key TEXT NOT NULL,'
+            ' name TEXT NOT NULL,'
+            ' amounts TEXT NOT NULL,'   # {Einheit: Menge}
+            ' other TEXT NOT NULL,'     # {Angabe klein: [Originaltext, Anzahl]}
+            ' occurrences INTEGER NOT NULL,'
+            ' PRIMARY KEY (plan_id, key))'
+        )
+
+    @contextmanager
+    def _transaction(self):
+        # IMMEDIATE: gleichzeitige Änderungen am selben Plan aus mehreren Workern serialisieren
+        conn = self._conn()
+        conn.execute('BEGIN IMMEDIATE')
+        try:
+            yield conn
+        except BaseException:
+            conn.execute('ROLLBACK')
+            raise
+        conn.execute('COMMIT')
+
+    # ------------------------------------------
+    # Inkrementelle Aktualisierung
+    # ------------------------------------------
+    def _apply(self, conn, plan_id, day, nutrition, ingredients, counted, sign):
+        """Rechnet den Beitrag einer Mahlzeit ein (sign=1) oder heraus (sign=-1)"""
+        macros = [sign * (nutrition or {}).get(macro, 0) for macro in MACROS]
+        conn.execute('INSERT OR IGNORE INTO week_plan_days (plan_id, day) VALUES (?, ?)', (plan_id, day))
+        conn.execute(
+            'UPDATE week_plan_days SET calories = calories + ?, protein = protein + ?, carbs = carbs + ?,'
+            ' fat = fat + ?, meals = meals + ?, entries = entries + ? WHERE plan_id = ? AND day = ?',
+            (*macros, sign if nutrition else 0, sign, plan_id, day)
+        )
+        conn.execute(
+            'UPDATE week_plans SET meal_count = meal_count + ?, entries = entries + ? WHERE id = ?',
+            (sign if counted else 0, sign, plan_id)
+        )
+        if ingredients:
+            self._apply_ingredients(conn, plan_id, ingredients, sign)
+
+    def _apply_ingredients(self, conn, plan_id, ingredients, sign):
+        grouped = OrderedDict()
+        for key, name, unit, quantity in ingredients:
+            grouped.setdefault(key, (name, []))[1].append((unit, quantity))
+
+        for key, (name, entries) in grouped.items():
+            row = conn.execute(
+                'SELECT name, amounts, other, occurrences FROM week_plan_items WHERE plan_id = ? AND key = ?',
+                (plan_id, key)
+            ).fetchone()
+            if row is None:
+                name, amounts, other, occurrences = name, {}, {}, 0
+            else:
+                name, amounts, other, occurrences = row[0], json.loads(row[1]), json.loads(row[2]), row[3]
+
+            for unit, quantity in entries:
+                occurrences += sign
+                if unit is not None:
+                    amounts[unit] = amounts.get(unit, 0.0) + sign * quantity
+                    if sign < 0 and amounts[unit] <= 1e-9:
+                        del amounts[unit]
+                elif quantity:
+                    text, count = other.get(quantity.lower(), (quantity, 0))
+                    if count + sign > 0:
+                        other[quantity.lower()] = (text, count + sign)
+                    else:
+                        other.pop(quantity.lower(), None)
+
+            if occurrences <= 0:
+                conn.execute('DELETE FROM week_plan_items WHERE plan_id = ? AND key = ?', (plan_id, key))
+            else:
+                conn.execute(
+                    'INSERT OR REPLACE INTO week_plan_items (plan_id, key, name, amounts, other, occurrences)'
+                    ' VALUES (?, ?, ?, ?, ?, ?)',
+                    (plan_id, key, name, json.dumps(amounts), json.dumps(other), occurrences)
+                )
+
+    def _insert_meal(self, conn, plan_id, day, meal):
+        cursor = conn.execute(
+            'INSERT INTO week_plan_meals (plan_id, day, meal_id, name, thumb, category, nutrition, ingredients,'
+            ' counted, missing) VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?)',
+            (
+                plan_id, day, meal['meal_id'], meal['name'], meal['thumb'], meal['category'],
+                json.dumps(meal['nutrition']) if meal['nutrition'] is not None else None,
+                json.dumps(meal['ingredients']) if meal['ingredients'] is not None else None,
+                int(meal['counted']), int(meal['missing']),
+            )
+        )
+        self._apply(conn, plan_id, day, meal['nutrition'], meal['ingredients'], meal['counted'], 1)
+        return cursor.lastrowid
+
+    def _remove_rows(self, conn, plan_id, rows):
+        for entry_id, day, nutrition, ingredients, counted in rows:
+            self._apply(conn, plan_id, day, json.loads(nutrition) if nutrition else None,
+                        json.loads(ingredients) if ingredients else None, counted, -1)
+            conn.execute('DELETE FROM week_plan_meals WHERE entry_id = ?', (entry_id,))
+
+    def _touch(self, conn, plan_id):
+        """Neue Version des Plans; False, wenn er nicht existiert"""
+        cursor = conn.execute(
+            'UPDATE week_plans SET version = version + 1, updated_at = ? WHERE id = ?', (time.time(), plan_id)
+        )
+        return cursor.rowcount > 0
+
+    def _check_size(self, conn, plan_id, adding):
+        entries = conn.execute('SELECT entries FROM week_plans WHERE id = ?', (plan_id,)).fetchone()[0]
+        if entries + adding > self.max_meals:
+            raise PlanFull(f'Maximal {self.max_meals} Mahlzeiten pro Wochenplan')
+
+    def _check_rate(self, conn, client, now):
+        """Zählt die Neuanlage des Clients; PlanRateLimited, wenn das Minutenlimit erreicht ist"""
+        if not self.create_rate or client is None:
+            return
+        count, oldest = conn.execute(
+            'SELECT COUNT(*), MIN(created_at) FROM week_plan_creates WHERE client = ? AND created_at > ?',
+            (client, now - 60)
+        ).fetchone()
+        if count >= self.create_rate:
+            raise PlanRateLimited(oldest + 60 - now)
+        conn.execute('INSERT INTO week_plan_creates (client, created_at) VALUES (?, ?)', (client, now))
+
+    def _after_write(self):
+        # Gelegentlich aufräumen statt bei jedem Schreibzugriff
+        self._writes += 1
+        if self._writes % 100 == 0:
+            self.prune()
+
+    # ------------------------------------------
+    # Änderungen
+    # ------------------------------------------
+    def create(self, days=(), client=None):
+        """
+        Neuer Plan aus [(day, [vorbereitete Mahlzeit])] (siehe weekplan.prepare_plan_meals)
+        client: Schlüssel für PLAN_STORE_CREATE_RATE (None = ohne Limit)
+        """
+        plan_id = uuid.uuid4().hex
+        now = time.time()
+        try:
+            with self._transaction() as conn:
+                self._check_rate(conn, client, now)
+                conn.execute('INSERT INTO week_plans (id, created_at, updated_at) VALUES (?, ?, ?)',
+                             (plan_id, now, now))
+                self._check_size(conn, plan_id, sum(len(meals) for _, meals in days))
+                for day, meals in days:
+                    for meal in meals:
+                        self._insert_meal(conn, plan_id, day, meal)
+        except PlanRateLimited:
+            self.stats['rate_limited'] += 1
+            raise
+        self.stats['created'] += 1
+        self._after_write()
+        return plan_id
+
+    def replace(self, plan_id, days):
+        """Ersetzt alle Mahlzeiten (Import aus localStorage); False, wenn der Plan nicht existiert"""
+        with self._transaction() as conn:
+            if not self._touch(conn, plan_id):
+                return False
+            self._clear_all(conn, plan_id)
+            self._check_size(conn, plan_id, sum(len(meals) for _, meals in days))
+            for day, meals in days:
+                for meal in meals:
+                    self._insert_meal(conn, plan_id, day, meal)
+        self.stats['imported'] += 1
+        self._after_write()
+        return True
+
+    def add(self, plan_id, day, meal):
+        """Fügt eine vorbereitete Mahlzeit hinzu; liefert die entry_id oder None (Plan unbekannt)"""
+        with self._transaction() as conn:
+            if not self._touch(conn, plan_id):
+                return None
+            self._check_size(conn, plan_id, 1)
+            entry_id = self._insert_meal(conn, plan_id, day, meal)
+        self.stats['added'] += 1
+        self._after_write()
+        return entry_id
+
+    def remove(self, plan_id, entry_id):
+        """Entfernt eine Mahlzeit; liefert ihren Tag oder None (nicht gefunden)"""
+        with self._transaction() as conn:
+            row = conn.execute(
+                'SELECT entry_id, day, nutrition, ingredients, counted FROM week_plan_meals'
+                ' WHERE entry_id = ? AND plan_id = ?', (entry_id, plan_id)
+            ).fetchone()
+            if row is None or not self._touch(conn, plan_id):
+                return None
+            self._remove_rows(conn, plan_id, [row])
+        self.stats['removed'] += 1
+        self._after_write()
+        return row[1]
+
+    def clear(self, plan_id, day=None):
+        """Leert einen Tag (Beiträge der Mahlzeiten heraus) oder den ganzen Plan"""
+        with self._transaction() as conn:
+            if not self._touch(conn, plan_id):
+                return False
+            if day is None:
+                self._clear_all(conn, plan_id)
+            else:
+                self._remove_rows(conn, plan_id, conn.execute(
+                    'SELECT entry_id, day, nutrition, ingredients, counted FROM week_plan_meals'
+                    ' WHERE plan_id = ? AND day = ?', (plan_id, day)
+                ).fetchall())
+        self.stats['cleared'] += 1
+        self._after_write()
+        return True
+
+    def _clear_all(self, conn, plan_id):
+        # Alles weg -> keine Beiträge herausrechnen, sondern direkt löschen
+        for table in ('week_plan_meals', 'week_plan_days', 'week_plan_items'):
+            conn.execute(f'DELETE FROM {table} WHERE plan_id = ?', (plan_id,))
+        conn.execute('UPDATE week_plans SET meal_count = 0, entries = 0 WHERE id = ?', (plan_id,))
+
+    # ------------------------------------------
+    # Lesen
+    # ------------------------------------------
+    def version(self, plan_id):
+        row = self._conn().execute('SELECT version FROM week_plans WHERE id = ?', (plan_id,)).fetchone()
+        return row[0] if row else None
+
+    def summary(self, plan_id):
+        """Tages- und Wochensummen (Format wie /api/recipe-nutrition/batch) aus den gespeicherten Tagen"""
+        rows = self._conn().execute(
+            'SELECT day, calories, protein, carbs, fat, meals, entries FROM week_plan_days WHERE plan_id = ?',
+            (plan_id,)
+        ).fetchall()
+        stored = {row[0]: row[1:] for row in rows}
+        days = {}
+        days_with_meals = 0
+        for day in WEEK_DAYS:
+            *macros, meals, entries = stored.get(day, (0, 0, 0, 0, 0, 0))
+            days[day] = {**{macro: _number(value) for macro, value in zip(MACROS, macros)}, 'meals': meals}
+            days_with_meals += int(entries > 0)
+        summary = summarize_days(days, days_with_meals)
+        summary['week']['totals'] = {macro: _number(value) for macro, value in summary['week']['totals'].items()}
+        return summary
+
+    def get(self, plan_id):
+        """Plan im localStorage-Format (mit entry_id pro Eintrag) plus Summen; None, wenn unbekannt"""
+        conn = self._conn()
+        plan = conn.execute('SELECT version, updated_at FROM week_plans WHERE id = ?', (plan_id,)).fetchone()
+        if plan is None:
+            return None
+
+        week_plan = {}
+        for entry_id, day, meal_id, name, thumb, category, nutrition in conn.execute(
+            'SELECT entry_id, day, meal_id, name, thumb, category, nutrition FROM week_plan_meals'
+            ' WHERE plan_id = ? ORDER BY entry_id', (plan_id,)
+        ):
+            meal = {'entry_id': entry_id, 'id': meal_id, 'name': name, 'thumb': thumb, 'category': category}
+            if nutrition is not None:
+                meal['nutrition'] = {macro: _number(value) for macro, value in json.loads(nutrition).items()}
+            week_plan.setdefault(day, []).append(meal)
+
+        return {
+            'success': True,
+            'plan_id': plan_id,
+            'version': plan[0],
+            'updated_at': plan[1],
+            'weekPlan': {day: week_plan[day] for day in WEEK_DAYS if day in week_plan},
+            **self.summary(plan_id),
+        }
+
+    def shopping_list(self, plan_id):
+        """Einkaufsliste (Format wie /api/shopping-list) aus den gespeicherten Zutaten; None, wenn unbekannt"""
+        conn = self._conn()
+        plan = conn.execute('SELECT version, meal_count FROM week_plans WHERE id = ?', (plan_id,)).fetchone()
+        if plan is None:
+            return None
+
+        aggregator = IngredientAggregator()
+        for name, amounts, other, occurrences in conn.execute(
+            'SELECT name, amounts, other, occurrences FROM week_plan_items WHERE plan_id = ?', (plan_id,)
+        ):
+            item = aggregator.item(name)
+            item['amounts'].update(json.loads(amounts))
+            item['other'] = [text for text, _ in json.loads(other).values()]
+            item['occurrences'] = occurrences
+        grouped = aggregator.grouped()
+
+        missing = [row[0] for row in conn.execute(
+            'SELECT DISTINCT meal_id FROM week_plan_meals WHERE plan_id = ? AND missing = 1', (plan_id,)
+        )]
+        return {
+            'success': True,
+            'plan_id': plan_id,
+            'version': plan[0],
+            'categories': [
+                {'category': category, 'items': items}
+                for category, items in grouped.items()
+            ],
+            'total_items': sum(len(items) for items in grouped.values()),
+            'meal_count': plan[1],
+            'missing_meals': missing,
+        }
+
+    def prune(self):
+        """Löscht Pläne, die seit PLAN_STORE_TTL nicht geändert wurden, und alles über PLAN_STORE_MAX_PLANS"""
+        now = time.time()
+        with self._transaction() as conn:
+            for stale, params in (
+                ('SELECT id FROM week_plans WHERE updated_at < ?', (now - self.ttl,)),
+                ('SELECT id FROM week_plans ORDER BY updated_at DESC LIMIT -1 OFFSET ?', (self.max_plans,)),
+            ):
+                for table in ('week_plan_meals', 'week_plan_days', 'week_plan_items'):
+                    conn.execute(f'DELETE FROM {table} WHERE plan_id IN ({stale})', params)
+                conn.execute(f'DELETE FROM week_plans WHERE id IN ({stale})', params)
+            conn.execute('DELETE FROM week_plan_creates WHERE created_at < ?', (now - 60,))
+
+    def get_stats(self):
+        try:
+            plans, meals = self._conn().execute(
+                'SELECT COUNT(*), COALESCE(SUM(entries), 0) FROM week_plans'
+            ).fetchone()
+        except sqlite3.Error as e:
+            print(f"Error in plan store stats: {str(e)}")
+            plans = meals = None
+        return {
+            **self.stats,
+            'plans': plans,
+            'meals': meals,
+            'max_meals': self.max_meals,
+            'max_plans': self.max_plans,
+            'create_rate': self.create_rate,
+            'ttl': self.ttl,
+        }
+
+
+_plan_store = None
+_plan_store_lock = threading.Lock()
+
+
+def get_plan_store():
+    """Store-Singleton (None, wenn PLAN_STORE_PATH leer ist oder die Datei nicht geöffnet werden kann)"""
+    global _plan_store
+    if _plan_store is None:
+        with _plan_store_lock:
+            if _plan_store is None:
+                try:
+                    _plan_store = WeekPlanStore(PLAN_STORE_PATH) if PLAN_STORE_PATH else False
+                except sqlite3.Error as e:
+                    print(f"Error in plan store open: {str(e)}")
+                    _plan_store = False
+    return _plan_store or None
@@ -0,0 +1,357 @@
+"""
+Circuit Breaker, Bulkheads und Deadlines für Upstream-Calls
+
+Pro Upstream (TheMealDB, Open Food Facts, OpenAI) gibt es:
+  - einen Circuit Breaker: nach UPSTREAM_BREAKER_FAILURES Fehlern in Folge
+    werden Calls sofort abgelehnt; nach UPSTREAM_BREAKER_RESET Sekunden lässt
+    er einzelne Probe-Calls durch (half-open) und schließt bei Erfolg wieder
+  - ein Bulkhead: höchstens N gleichzeitige Calls, damit ein langsamer Dienst
+    nicht alle Worker-Threads belegt und Seiten/Statistiken weiter antworten
+Dazu kommt eine Deadline pro Request, die die Timeouts aller Upstream-Calls
+begrenzt. Abgelehnte Calls werfen UpstreamUnavailable; die Routen liefern
+dann gecachte bzw. veraltete Daten oder ein schnelles 503 mit Retry-After.
+
+Breaker-Zustand gilt pro Prozess (jeder gunicorn-Worker entscheidet selbst).
+"""
+import asyncio
+import contextvars
+import math
+import os
+import threading
+import time
+import weakref
+from contextlib import asynccontextmanager, contextmanager
+
+from metrics import registry
+
+
+# ==========================================
+# KONFIGURATION
+# ==========================================
+UPSTREAM_BREAKER_FAILURES = int(os.getenv('UPSTREAM_BREAKER_FAILURES', '5'))
+UPSTREAM_BREAKER_RESET = float(os.getenv('UPSTREAM_BREAKER_RESET', '30'))
+# Gleichzeitige Probe-Calls im Zustand half-open
+UPSTREAM_BREAKER_PROBES = int(os.getenv('UPSTREAM_BREAKER_PROBES', '1'))
+
+# Max. gleichzeitige Calls pro Upstream (pro Prozess) und max. Wartezeit auf einen Platz
+BULKHEAD_LIMITS = {
+    'mealdb': int(os.getenv('BULKHEAD_MEALDB', '16')),
+    'off': int(os.getenv('BULKHEAD_OFF', '8')),
+    'openai': int(os.getenv('BULKHEAD_OPENAI', '8')),
+}
+BULKHEAD_ASYNC_LIMITS = {
+    'mealdb': int(os.getenv('BULKHEAD_ASYNC_MEALDB', '200')),
+    'off': int(os.getenv('BULKHEAD_ASYNC_OFF', '100')),
+    'openai': int(os.getenv('BULKHEAD_ASYNC_OPENAI', '100')),
+}
+BULKHEAD_WAIT = float(os.getenv('BULKHEAD_WAIT', '0.5'))
+
+# Gesamtbudget pro Request in Sekunden (KI-Pläne warten auf OpenAI und brauchen länger)
+REQUEST_DEADLINE = float(os.getenv('REQUEST_DEADLINE', '10'))
+PLAN_REQUEST_DEADLINE = float(os.getenv('PLAN_REQUEST_DEADLINE', '75'))
+PLAN_ROUTE_PREFIX = '/api/generate-ai-plan'
+
+upstream_rejected = registry.counter(
+    'mealprep_upstream_rejected_total',
+    'Sofort abgelehnte Upstream-Calls (breaker_open, bulkhead_full, deadline)', ('host', 'reason'))
+breaker_transitions = registry.counter(
+    'mealprep_circuit_breaker_transitions_total', 'Zustandswechsel der Circuit Breaker', ('host', 'state'))
+
+
+class UpstreamUnavailable(Exception):
+    """Upstream-Call wurde abgelehnt, ohne den Dienst zu kontaktieren"""
+
+    def __init__(self, upstream, reason, retry_after=1):
+        super().__init__(f'{upstream} nicht verfügbar ({reason})')
+        self.upstream = upstream
+        self.reason = reason
+        self.retry_after = max(1, int(math.ceil(retry_after)))
+
+
+def _reject(upstream, reason, retry_after=1):
+    upstream_rejected.inc(host=upstream, reason=reason)
+    return UpstreamUnavailable(upstream, reason, retry_after)
+
+
+# ==========================================
+# CIRCUIT BREAKER
+# ==========================================
+class CircuitBreaker:
+    """closed -> open nach N Fehlern in Folge -> half-open nach Ablauf -> closed/open"""
+
+    def __init__(self, name, failures=UPSTREAM_BREAKER_FAILURES, reset_timeout=UPSTREAM_BREAKER_RESET,
+                 probes=UPSTREAM_BREAKER_PROBES):
+        self.name = name
+        self.failure_threshold = failures
+        self.reset_timeout = reset_timeout
+        self.max_probes = probes
+        self.state = 'closed'
+        self.failures = 0
+        self.opened_at = 0.0
+        self._probes = 0
+        self._lock = threading.Lock()
+
+        self.stats = {'rejected': 0, 'opened': 0}
+
+    def _set_state(self, state):
+        if state != self.state:
+            self.state = state
+            breaker_transitions.inc(host=self.name, state=state)
+
+    def retry_after(self):
+        return max(0.0, self.opened_at + self.reset_timeout - time.time())
+
+    def allow(self):
+        """Reserviert einen Call oder wirft UpstreamUnavailable"""
+        with self._lock:
+            if self.state == 'open':
+                if time.time() < self.opened_at + self.reset_timeout:
+                    self.stats['rejected'] += 1
+                    raise _reject(self.name, 'breaker_open', self.retry_after())
+                self._set_state('half_open')
+                self._probes = 0
+            if self.state == 'half_open':
+                if self._probes >= self.max_probes:
+                    self.stats['rejected'] += 1
+                    raise _reject(self.name, 'breaker_open', 1)
+                self._probes += 1
+
+    def release(self, success):
+        """Ergebnis eines mit allow() reservierten Calls (None = zählt nicht, z.B. Abbruch)"""
+        with self._lock:
+            if self.state == 'half_open':
+                self._probes = max(0, self._probes - 1)
+            if success is None:
+                return
+            if success:
+                self.failures = 0
+                self._set_state('closed')
+                return
+            self.failures += 1
+            if self.state == 'half_open' or self.failures >= self.failure_threshold:
+                self.opened_at = time.time()
+                self.stats['opened'] += 1
+                self._set_state('open')
+
+    def get_stats(self):
+        return {
+            **self.stats,
+            'state': self.state,
+            'failures': self.failures,
+            'retry_after': round(self.retry_after(), 1) if self.state == 'open' else 0,
+        }
+
+
+# ==========================================
+# BULKHEADS
+# ==========================================
+class Bulkhead:
+    """Begrenzt gleichzeitige Calls aus Worker-Threads"""
+
+    def __init__(self, name, limit):
+        self.name = name
+        self.limit = limit
+        self.active = 0
+        self._semaphore = threading.BoundedSemaphore(limit)
+        self._lock = threading.Lock()
+        self.stats = {'rejected': 0}
+
+    @contextmanager
+    def slot(self):
+        if not self._semaphore.acquire(timeout=wait_budget(BULKHEAD_WAIT)):
+            self.stats['rejected'] += 1
+            raise _reject(self.name, 'bulkhead_full')
+        with self._lock:
+            self.active += 1
+        try:
+            yield
+        finally:
+            with self._lock:
+                self.active -= 1
+            self._semaphore.release()
+
+    def get_stats(self):
+        return {**self.stats, 'active': self.active, 'limit': self.limit}
+
+
+class AsyncBulkhead:
+    """Wie Bulkhead, aber für Coroutinen (asyncio.Semaphore: gehört zu genau einem Event-Loop)"""
+
+    def __init__(self, name, limit):
+        self.name = name
+        self.limit = limit
+        self.active = 0
+        self._semaphore = asyncio.Semaphore(limit)
+        self.stats = {'rejected': 0}
+
+    @asynccontextmanager
+    async def slot(self):
+        try:
+            await asyncio.wait_for(self._semaphore.acquire(), wait_budget(BULKHEAD_WAIT))
+        except asyncio.TimeoutError:
+            self.stats['rejected'] += 1
+            raise _reject(self.name, 'bulkhead_full')
+        self.active += 1
+        try:
+            yield
+        finally:
+            self.active -= 1
+            self._semaphore.release()
+
+    def get_stats(self):
+        return {**self.stats, 'active': self.active, 'limit': self.limit}
+
+
+breakers = {name: CircuitBreaker(name) for name in BULKHEAD_LIMITS}
+bulkheads = {name: Bulkhead(name, limit) for name, limit in BULKHEAD_LIMITS.items()}
+# Event-Loop -> {Upstream: AsyncBulkhead}; Einträge verschwinden mit dem Loop
+# (weitere Loops im selben Prozess: Bench, Lifespan-Neustart, asyncio.run in Skripten)
+async_bulkheads = weakref.WeakKeyDictionary()
+_async_bulkheads_lock = threading.Lock()
+
+
+def get_async_bulkhead(name):
+    """Async-Bulkhead für den laufenden Event-Loop (wird beim ersten Zugriff erzeugt)"""
+    loop = asyncio.get_running_loop()
+    with _async_bulkheads_lock:
+        per_loop = async_bulkheads.setdefault(loop, {})
+        if name not in per_loop:
+            per_loop[name] = AsyncBulkhead(name, BULKHEAD_ASYNC_LIMITS[name])
+        return per_loop[name]
+
+
+def _async_bulkhead_stats(name):
+    """Summe über alle lebenden Event-Loops des Prozesses, None ohne Async-Calls"""
+    with _async_bulkheads_lock:
+        found = [per_loop[name] for per_loop in list(async_bulkheads.values()) if name in per_loop]
+    if not found:
+        return None
+    return {
+        'rejected': sum(bulkhead.stats['rejected'] for bulkhead in found),
+        'active': sum(bulkhead.active for bulkhead in found),
+        'limit': BULKHEAD_ASYNC_LIMITS[name],
+        'loops': len(found),
+    }
+
+
+# ==========================================
+# DEADLINE PRO REQUEST
+# ==========================================
+_deadline = contextvars.ContextVar('mealprep_deadline', default=None)
+
+
+def request_deadline(path):
+    return PLAN_REQUEST_DEADLINE if path.startswith(PLAN_ROUTE_PREFIX) else REQUEST_DEADLINE
+
+
+def start_deadline(seconds):
+    """Setzt die Deadline für den aktuellen Request (0 = keine)"""
+    _deadline.set(time.monotonic() + seconds if seconds > 0 else None)
+
+
+def remaining():
+    """Verbleibende Sekunden bis zur Deadline, None ohne Deadline"""
+    deadline = _deadline.get()
+    return None if deadline is None else deadline - time.monotonic()
+
+
+def wait_budget(limit):
+    left = remaining()
+    return limit if left is None else max(0.0, min(limit, left))
+
+
+def call_timeout(upstream, timeout):
+    """
+    Timeout für einen Upstream-Call, begrenzt durch die Request-Deadline
+    Liefert (timeout, gekürzt?); wirft UpstreamUnavailable, wenn die Deadline abgelaufen ist.
+    """
+    left = remaining()
+    if left is None or left >= timeout:
+        return timeout, False
+    if left < 0.05:
+        raise _reject(upstream, 'deadline')
+    return left, True
+
+
+# ==========================================
+# GUARDS FÜR UPSTREAM-CALLS
+# ==========================================
+class _Outcome:
+    def __init__(self):
+        self.success = True
+
+    def failed(self):
+        """HTTP-Fehler (5xx, 429) ohne Exception"""
+        self.success = False
+
+    def neutral(self):
+        """Zählt weder als Erfolg noch als Fehler (z.B. Timeout durch die Request-Deadline)"""
+        self.success = None
+
+
+def is_failure_status(status):
+    return status == 429 or status >= 500
+
+
+def _record_error(outcome, e):
+    # Client-Fehler mit Status (z.B. OpenAI 400) sprechen nicht gegen den Dienst
+    status = getattr(e, 'status_code', None)
+    if outcome.success is not None and (status is None or is_failure_status(status)):
+        outcome.failed()
+
+
+@contextmanager
+def guard(upstream):
+    """Breaker + Bulkhead um einen synchronen Upstream-Call"""
+    breaker = breakers[upstream]
+    breaker.allow()
+    outcome = _Outcome()
+    try:
+        with bulkheads[upstream].slot():
+            yield outcome
+    except GeneratorExit:
+        # Client hat einen Stream abgebrochen
+        outcome.neutral()
+        raise
+    except UpstreamUnavailable:
+        outcome.neutral()
+        raise
+    except Exception as e:
+        _record_error(outcome, e)
+        raise
+    finally:
+        breaker.release(outcome.success)
+
+
+@asynccontextmanager
+async def aguard(upstream):
+    """Async-Variante von guard()"""
+    breaker = breakers[upstream]
+    breaker.allow()
+    outcome = _Outcome()
+    try:
+        async with get_async_bulkhead(upstream).slot():
+            yield outcome
+    except (GeneratorExit, asyncio.CancelledError, UpstreamUnavailable):
+        outcome.neutral()
+        raise
+    except Exception as e:
+        _record_error(outcome, e)
+        raise
+    finally:
+        breaker.release(outcome.success)
+
+
+def unavailable_body(e):
+    return {'success': False, 'error': str(e), 'upstream': e.upstream, 'retry_after': e.retry_after}
+
+
+def get_upstream_stats():
+    return {
+        name: {
+            'breaker': breakers[name].get_stats(),
+            'bulkhead': bulkheads[name].get_stats(),
+            'async_bulkhead': _async_bulkhead_stats(name),
+        }
+        for name in breakers
+    }
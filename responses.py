@@ -0,0 +1,178 @@
+"""
+JSON-Antworten: schneller Encoder, HTTP-Caching und Kompression
+
+  - Serialisierung mit orjson (Flask-JSON-Provider und ASGI-Pfad)
+  - Cache-Control und ETag für cachebare GET-Routen; passt If-None-Match,
+    kommt ein 304 ohne Body
+  - gzip ab GZIP_MIN_SIZE Bytes, wenn der Client es akzeptiert
+  - kompakte Rezepte (?compact=1): leere Felder und die 20
+    strIngredientN/strMeasureN-Paare fallen weg, die Zutaten kommen als Liste
+
+Die Regeln gelten pro Route (Flask-Schreibweise, z.B. /api/recipe/<meal_id>)
+und werden von main.py (after_request) und asgi.py gleich angewendet.
+"""
+import gzip
+import hashlib
+import os
+
+import orjson
+from flask.json.provider import DefaultJSONProvider
+
+from ingredients import extract_ingredients
+
+
+# ==========================================
+# KONFIGURATION
+# ==========================================
+# Browser-Cache für Rezeptdaten (Sekunden); danach noch so lange veraltet nutzbar,
+# während im Hintergrund neu geladen wird
+HTTP_CACHE_MAX_AGE = int(os.getenv('HTTP_CACHE_MAX_AGE', '3600'))
+HTTP_CACHE_STALE = int(os.getenv('HTTP_CACHE_STALE', '86400'))
+# Kleinere Antworten werden nicht komprimiert
+GZIP_MIN_SIZE = int(os.getenv('GZIP_MIN_SIZE', '1024'))
+GZIP_LEVEL = int(os.getenv('GZIP_LEVEL', '6'))
+
+PUBLIC_CACHE = f'public, max-age={HTTP_CACHE_MAX_AGE}, stale-while-revalidate={HTTP_CACHE_STALE}'
+# Immer beim Server nachfragen (ändert sich mit jeder Planänderung), 304 bei gleicher Version
+REVALIDATE = 'private, no-cache'
+
+CACHE_POLICIES = {
+    '/api/categories': PUBLIC_CACHE,
+    '/api/recipe/<meal_id>': PUBLIC_CACHE,
+    '/api/recipe-nutrition/<meal_id>': PUBLIC_CACHE,
+    '/api/week-plans/<plan_id>': REVALIDATE,
+    '/api/week-plans/<plan_id>/shopping-list': REVALIDATE,
+}
+
+JSON_OPTIONS = orjson.OPT_NON_STR_KEYS | orjson.OPT_SERIALIZE_NUMPY
+
+
+# ==========================================
+# SERIALISIERUNG
+# ==========================================
+def dumps(payload):
+    """JSON als UTF-8-Bytes"""
+    return orjson.dumps(payload, option=JSON_OPTIONS)
+
+
+class FastJSONProvider(DefaultJSONProvider):
+    """Flask-JSON-Provider mit orjson; unbekannte Typen gehen an den Standard-Encoder"""
+
+    def dumps(self, obj, **kwargs):
+        try:
+            return dumps(obj).decode('utf-8')
+        except TypeError:
+            return super().dumps(obj, **kwargs)
+
+    def loads(self, s, **kwargs):
+        return orjson.loads(s)
+
+    def response(self, *args, **kwargs):
+        obj = self._prepare_response_obj(args, kwargs)
+        try:
+            body = dumps(obj)
+        except TypeError:
+            body = super().dumps(obj)
+        return self._app.response_class(body, mimetype=self.mimetype)
+
+
+# ==========================================
+# KOMPAKTE REZEPTE
+# ==========================================
+def wants_compact(args):
+    return str(args.get('compact', '')).lower() in ('1', 'true', 'yes')
+
+
+def compact_meal(meal):
+    """Rezept ohne leere Felder, Zutaten als [{"ingredient", "measure"}]"""
+    if not isinstance(meal, dict):
+        return meal
+    compact = {
+        key: value for key, value in meal.items()
+        if value not in (None, '') and not key.startswith(('strIngredient', 'strMeasure'))
+    }
+    if 'strIngredient1' in meal:
+        compact['ingredients'] = extract_ingredients(meal)
+    return compact
+
+
+def compact_meals(payload):
+    """{"meals": [...]} mit kompakten Rezepten (andere Antworten unverändert)"""
+    if not isinstance(payload, dict) or not isinstance(payload.get('meals'), list):
+        return payload
+    return {**payload, 'meals': [compact_meal(meal) for meal in payload['meals']]}
+
+
+# ==========================================
+# ETAG, 304 UND KOMPRESSION
+# ==========================================
+def etag_for(body):
+    # Schwaches ETag: gilt für die gzip- und die unkomprimierte Variante
+    return 'W/"' + hashlib.blake2b(body, digest_size=12).hexdigest() + '"'
+
+
+def version_etag(*parts):
+    """ETag aus einer bekannten Version (ohne den Body zu bauen)"""
+    return 'W/"' + '-'.join(str(part) for part in parts) + '"'
+
+
+def etag_matches(if_none_match, etag):
+    if not if_none_match:
+        return False
+    if if_none_match.strip() == '*':
+        return True
+    tag = etag.removeprefix('W/')
+    return any(candidate.strip().removeprefix('W/') == tag for candidate in if_none_match.split(','))
+
+
+def accepts_gzip(accept_encoding):
+    for part in (accept_encoding or '').split(','):
+        coding, _, params = part.strip().partition(';')
+        if coding.strip().lower() in ('gzip', '*'):
+            q = params.strip().removeprefix('q=')
+            try:
+                return not params.strip() or float(q) > 0
+            except ValueError:
+                return True
+    return False
+
+
+def finish_json(body, status, route, method, if_none_match='', accept_encoding='', etag=None):
+    """
+    Cache-Header, 304 und Kompression für eine serialisierte JSON-Antwort
+    Liefert (status, body, headers) mit headers als [(name, value)].
+    """
+    headers = []
+    cache_control = CACHE_POLICIES.get(route)
+    if cache_control and method in ('GET', 'HEAD') and status == 200:
+        etag = etag or etag_for(body)
+        headers += [('Cache-Control', cache_control), ('ETag', etag)]
+        if etag_matches(if_none_match, etag):
+            return 304, b'', headers
+
+    if len(body) >= GZIP_MIN_SIZE:
+        headers.append(('Vary', 'Accept-Encoding'))
+        if accepts_gzip(accept_encoding):
+            body = gzip.compress(body, GZIP_LEVEL)
+            headers.append(('Content-Encoding', 'gzip'))
+    return status, body, headers
+
+
+def finish_flask_response(request, response):
+    """after_request: wendet finish_json auf gepufferte JSON-Antworten an"""
+    if response.mimetype != 'application/json' or response.direct_passthrough or response.is_streamed:
+        return response
+    if 'Content-Encoding' in response.headers:
+        return response
+
+    route = request.url_rule.rule if request.url_rule else None
+    status, body, headers = finish_json(
+        response.get_data(), response.status_code, route, request.method,
+        request.headers.get('If-None-Match', ''), request.headers.get('Accept-Encoding', ''),
+        response.headers.get('ETag')
+    )
+    response.status_code = status
+    response.set_data(body)
+    for name, value in headers:
+        response.headers[name] = value
+    return response
@@ -0,0 +1,256 @@
+"""
+Lokaler Wochenplan-Optimierer
+
+Wählt Frühstück, Mittag- und Abendessen für 7 Tage aus der Kandidatenliste so,
+dass Kalorien und Protein pro Tag möglichst nah an den Zielen liegen. Jedes
+Rezept höchstens 2x pro Woche und nicht zweimal am selben Tag (bei zu kleinem
+Kandidaten-Pool entsprechend gelockert, siehe week_limits); Protein wird
+möglichst gleichmäßig über den Tag verteilt. Grundlage sind die aus den
+Zutaten berechneten Nährwerte der Kandidaten, sonst die Schätzung nach Kategorie.
+
+Wird als eigener Modus (mode=solver) genutzt, füllt im Hybrid-Modus Lücken
+im KI-Plan und ist der Fallback, wenn OpenAI ausfällt oder kein JSON liefert.
+"""
+import math
+from functools import lru_cache
+from itertools import combinations
+
+import numpy as np
+
+from nutrition import estimate_for_category
+from planner import DAYS, MEAL_TYPES, MealIndex, sse_event
+
+
+MAX_USES_PER_WEEK = 2
+# Gewicht der Protein-Verteilung über den Tag gegenüber den Tageszielen
+PROTEIN_SPREAD_WEIGHT = 0.05
+# Aufschlag pro Vorkommen eines bereits genutzten Rezepts (für Abwechslung)
+VARIETY_WEIGHT = 0.002
+
+
+def week_limits(candidates, max_uses=MAX_USES_PER_WEEK):
+    """
+    Tatsächliche Regeln für einen Pool von candidates Rezepten
+    Liefert (max. Nutzungen pro Woche, Wiederholung am selben Tag nötig?).
+    Bei wenigen Kandidaten geht "max. 2x" rechnerisch nicht auf, bei weniger
+    als drei auch "nicht zweimal am selben Tag" nicht.
+    """
+    if not candidates:
+        return max_uses, False
+    slots = len(DAYS) * len(MEAL_TYPES)
+    return max(max_uses, math.ceil(slots / candidates)), candidates < len(MEAL_TYPES)
+
+
+def _target(value, default):
+    try:
+        value = float(value)
+    except (TypeError, ValueError):
+        return default
+    return value if value > 0 else default
+
+
+class _WeekState:
+    """Kandidaten mit Nährwerten (als Arrays) und Nutzungszähler"""
+
+    def __init__(self, meal_list, nutrition_by_id, max_uses):
+        self.meals = meal_list
+        self.nutrition = [
+            (nutrition_by_id or {}).get(str(m['id'])) or m.get('nutrition') or estimate_for_category(m.get('category'))
+            for m in meal_list
+        ]
+        self.calories = np.array([n['calories'] for n in self.nutrition], dtype=np.float64)
+        self.protein = np.array([n['protein'] for n in self.nutrition], dtype=np.float64)
+        self.max_uses, self.same_day_repeats = week_limits(len(meal_list), max_uses)
+        self.uses = [0] * len(meal_list)
+        self.index_by_id = {str(m['id']): i for i, m in enumerate(meal_list)}
+
+    def available(self, excluded):
+        """Freie Kandidaten: unter der Wiederholungsgrenze und nicht schon am selben Tag"""
+        return [i for i in range(len(self.meals)) if self.uses[i] < self.max_uses and i not in excluded]
+
+    def use(self, i):
+        self.uses[i] += 1
+
+
+@lru_cache(maxsize=64)
+def _combination_matrix(n, k):
+    """Alle k-Kombinationen aus n Kandidaten als Indexmatrix (Anzahl x k)"""
+    return np.array(list(combinations(range(n), k)), dtype=np.intp).reshape(-1, k)
+
+
+def _solve_day(state, fixed, free_slots, calories, protein):
+    """
+    Beste Kombination für die freien Slots eines Tages
+    fixed: bereits gesetzte Kandidaten-Indizes; liefert Indizes für free_slots.
+    Alle Kombinationen werden auf einmal als Matrix bewertet; bei fast
+    gleichen Kosten gewinnen bisher wenig genutzte Rezepte.
+    """
+    if not free_slots:
+        return []
+
+    free = np.array(state.available(set(fixed)), dtype=np.intp)
+    if len(free) < len(free_slots):
+        # Kandidaten aufgebraucht: Wiederholungen zulassen, am wenigsten genutzte zuerst;
+        # bei weniger Kandidaten als Slots (same_day_repeats) auch am selben Tag
+        order = sorted(range(len(state.meals)), key=lambda i: (i in fixed, state.uses[i], i))
+        return [order[j % len(order)] for j in range(len(free_slots))]
+
+    combos = free[_combination_matrix(len(free), len(free_slots))]
+    fixed = np.array(fixed, dtype=np.intp)
+    combo_protein = state.protein[combos]
+    total_calories = state.calories[combos].sum(axis=1) + state.calories[fixed].sum()
+    total_protein = combo_protein.sum(axis=1) + state.protein[fixed].sum()
+
+    highest, lowest = combo_protein.max(axis=1), combo_protein.min(axis=1)
+    if len(fixed):
+        highest = np.maximum(highest, state.protein[fixed].max())
+        lowest = np.minimum(lowest, state.protein[fixed].min())
+
+    uses = np.array(state.uses, dtype=np.float64)
+    cost = (
+        ((total_calories - calories) / calories) ** 2
+        + ((total_protein - protein) / protein) ** 2
+        + PROTEIN_SPREAD_WEIGHT * (highest - lowest) / protein
+        + VARIETY_WEIGHT * uses[combos].sum(axis=1)
+    )
+    return combos[int(np.argmin(cost))].tolist()
+
+
+def _assign_slots(state, picked, free_slots):
+    """Frühstück: bevorzugt Kategorie Breakfast, sonst die leichteste Mahlzeit"""
+    picked = sorted(picked, key=lambda i: (state.nutrition[i]['calories'], i))
+    if 'breakfast' in free_slots:
+        for i in picked:
+            if (state.meals[i].get('category') or '').lower() == 'breakfast':
+                picked.remove(i)
+                picked.insert(0, i)
+                break
+    return dict(zip(free_slots, picked))
+
+
+def _set_slot(day_plan, meal_type, meal):
+    day_plan[meal_type] = meal['name']
+    day_plan[f'{meal_type}_id'] = meal['id']
+    day_plan.pop(f'{meal_type}_thumb', None)
+    if meal.get('thumb'):
+        day_plan[f'{meal_type}_thumb'] = meal['thumb']
+
+
+def complete_plan(plan_data, meal_list, params, nutrition_by_id=None, max_uses=MAX_USES_PER_WEEK):
+    """
+    Ergänzt einen (ggf. leeren oder unvollständigen) Plan zu 7 x 3 Mahlzeiten
+    Gültige Slots bleiben stehen; Slots ohne passendes Rezept oder über der
+    Wiederholungsgrenze werden optimiert neu belegt. Liefert den Plan und die
+    Anzahl neu belegter Slots.
+    """
+    if not meal_list:
+        return plan_data, 0
+
+    calories = _target(params.get('calories'), 2000.0)
+    protein = _target(params.get('protein'), 100.0)
+    state = _WeekState(meal_list, nutrition_by_id, max_uses)
+
+    # Vorhandene Slots übernehmen, soweit sie gültig sind
+    index = MealIndex(meal_list)
+    kept = {}
+    for day in DAYS:
+        day_plan = plan_data.get(day)
+        if not isinstance(day_plan, dict):
+            continue
+        for meal_type in MEAL_TYPES:
+            meal_id = day_plan.get(f'{meal_type}_id')
+            resolved = meal_id is not None
+            if not resolved and day_plan.get(meal_type):
+                match = index.find(day_plan[meal_type])
+                meal_id = match['id'] if match else None
+            i = state.index_by_id.get(str(meal_id)) if meal_id is not None else None
+            if i is None or state.uses[i] >= state.max_uses:
+                continue
+            if i in kept.get(day, {}).values() and not state.same_day_repeats:
+                continue
+            if not resolved:
+                _set_slot(day_plan, meal_type, state.meals[i])
+            state.use(i)
+            kept.setdefault(day, {})[meal_type] = i
+
+    filled = 0
+    for day in DAYS:
+        fixed = kept.get(day, {})
+        free_slots = [meal_type for meal_type in MEAL_TYPES if meal_type not in fixed]
+        if not free_slots:
+            continue
+
+        picked = _solve_day(state, list(fixed.values()), free_slots, calories, protein)
+        if not isinstance(plan_data.get(day), dict):
+            plan_data[day] = {}
+        for meal_type, i in _assign_slots(state, picked, free_slots).items():
+            state.use(i)
+            _set_slot(plan_data[day], meal_type, state.meals[i])
+            filled += 1
+
+    return plan_data, filled
+
+
+def plan_totals(plan_data, meal_list, nutrition_by_id=None):
+    """Geschätzte Kalorien/Protein pro Tag für einen aufgelösten Plan"""
+    state = _WeekState(meal_list, nutrition_by_id, MAX_USES_PER_WEEK)
+    totals = {}
+    for day in DAYS:
+        day_plan = plan_data.get(day) or {}
+        indices = [
+            state.index_by_id[str(day_plan[f'{meal_type}_id'])]
+            for meal_type in MEAL_TYPES if str(day_plan.get(f'{meal_type}_id')) in state.index_by_id
+        ]
+        totals[day] = {
+            'calories': sum(state.nutrition[i]['calories'] for i in indices),
+            'protein': sum(state.nutrition[i]['protein'] for i in indices),
+        }
+    return totals
+
+
+def solver_reasoning(plan_data, meal_list, params, nutrition_by_id=None):
+    totals = plan_totals(plan_data, meal_list, nutrition_by_id).values()
+    avg_calories = round(sum(t['calories'] for t in totals) / len(DAYS))
+    avg_protein = round(sum(t['protein'] for t in totals) / len(DAYS))
+    max_uses, same_day_repeats = week_limits(len(meal_list))
+    if same_day_repeats:
+        found = 'ein passendes Rezept' if len(meal_list) == 1 else f'{len(meal_list)} passende Rezepte'
+        rules = f"Nur {found} gefunden, deshalb wiederholen sich Gerichte auch am selben Tag."
+    else:
+        rules = f"Kein Rezept mehr als {max_uses}x pro Woche, Protein gleichmäßig über den Tag verteilt."
+    return (
+        f"Lokal optimierter Plan: im Schnitt ca. {avg_calories} kcal und {avg_protein}g Protein "
+        f"pro Tag (Ziel: {params['calories']} kcal, {params['protein']}g Protein). {rules}"
+    )
+
+
+def solve_week_plan(meal_list, params, nutrition_by_id=None):
+    """Kompletter Wochenplan ohne KI, im Format der KI-Antwort (inkl. IDs und Bilder)"""
+    plan_data, _ = complete_plan({}, meal_list, params, nutrition_by_id)
+    plan_data['reasoning'] = solver_reasoning(plan_data, meal_list, params, nutrition_by_id)
+    return plan_data
+
+
+def repair_plan(plan_data, meal_list, params, nutrition_by_id=None):
+    """Hybrid: KI-Plan behalten, ungültige oder fehlende Slots lokal optimiert füllen"""
+    plan_data, filled = complete_plan(plan_data, meal_list, params, nutrition_by_id)
+    if not plan_data.get('reasoning'):
+        plan_data['reasoning'] = solver_reasoning(plan_data, meal_list, params, nutrition_by_id)
+    return plan_data, filled
+
+
+def finish_streamed_plan(plan_data, meal_list, params):
+    """
+    Ergänzt einen (teilweise) gestreamten KI-Plan
+    Liefert den vollständigen Plan und die SSE-Events für Tage bzw. Begründung,
+    die noch nicht gesendet wurden.
+    """
+    streamed = {key for key in plan_data if key in DAYS or key == 'reasoning'}
+    plan_data, _ = repair_plan(plan_data, meal_list, params)
+    events = [
+        sse_event('day', {'day': day, 'meals': plan_data[day]})
+        for day in DAYS if day not in streamed and day in plan_data
+    ]
+    if 'reasoning' not in streamed:
+        events.append(sse_event('reasoning', {'reasoning': plan_data['reasoning']}))
+    return plan_data, events
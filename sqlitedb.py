@@ -0,0 +1,42 @@
+"""
+Gemeinsame SQLite-Verbindungen für Cache, Barcodes, Katalog, Jobs und Wochenpläne
+
+Eine Verbindung pro Thread (WAL erlaubt parallele Leser, synchronous=NORMAL
+reicht für Daten, die sich notfalls neu laden lassen). Vor einem fork
+(gunicorn preload_app) werden die Verbindungen geschlossen, damit jeder
+Worker eigene öffnet: eine geerbte SQLite-Verbindung darf er nicht nutzen.
+"""
+import os
+import sqlite3
+import threading
+
+
+class ThreadLocalConnection:
+    """SQLite-Verbindung pro Thread für eine Datei"""
+
+    def __init__(self, path, timeout=5, isolation_level=''):
+        self.path = path
+        self.timeout = timeout
+        # '' = Standard von sqlite3 (implizite Transaktionen), None = Autocommit
+        self.isolation_level = isolation_level
+        self._local = threading.local()
+        if hasattr(os, 'register_at_fork'):
+            os.register_at_fork(before=self.close)
+
+    def get(self):
+        """Verbindung des aktuellen Threads (beim ersten Aufruf geöffnet)"""
+        conn = getattr(self._local, 'conn', None)
+        if conn is None:
+            conn = sqlite3.connect(self.path, timeout=self.timeout, check_same_thread=False,
+                                   isolation_level=self.isolation_level)
+            conn.execute('PRAGMA journal_mode=WAL')
+            conn.execute('PRAGMA synchronous=NORMAL')
+            self._local.conn = conn
+        return conn
+
+    def close(self):
+        """Schließt die Verbindung des aktuellen Threads"""
+        conn = getattr(self._local, 'conn', None)
+        if conn is not None:
+            conn.close()
+            self._local.conn = None
@@ -0,0 +1,214 @@
+"""
+Startzeit: Import-Budget und Warm-up beim Worker-Start
+
+Import: main.py misst die eigene Importzeit (mealprep_startup_seconds{phase="import"}
+und 'startup' in /api/cache/stats) und warnt, wenn sie IMPORT_BUDGET übersteigt.
+OpenAI-Client und HTTP-Sessions entstehen erst beim ersten Gebrauch. Prüfen
+ohne Server (Exit-Code 1 über Budget):
+
+    python startup.py            # main und asgi, je 3 frische Prozesse
+    python startup.py main --runs 5
+
+Warm-up (WARMUP=1): lädt Kategorien, die Facettenlisten (Area, Kategorie,
+Zutat), die Nährwert-Tabelle, den OFF-Store und die Rezepte aus
+WARMUP_MEAL_IDS, bevor ein Worker Requests annimmt. Mit preload_app
+(PRELOAD=1 in den gunicorn-Konfigurationen) läuft er einmal im Master und
+die geforkten Worker teilen die gefüllten Caches copy-on-write; ohne Preload
+wärmt sich jeder Worker in post_worker_init selbst auf.
+"""
+import argparse
+import importlib
+import os
+import subprocess
+import sys
+import time
+
+from metrics import registry
+from resilience import start_deadline
+
+
+# ==========================================
+# KONFIGURATION
+# ==========================================
+IMPORT_BUDGET = float(os.getenv('IMPORT_BUDGET', '0.5'))
+WARMUP_ENABLED = os.getenv('WARMUP', '0') == '1'
+# Häufig aufgerufene Rezepte, kommagetrennt (z.B. 52772,52959)
+WARMUP_MEAL_IDS = [meal_id.strip() for meal_id in os.getenv('WARMUP_MEAL_IDS', '').split(',') if meal_id.strip()]
+# Gesamtbudget für alle Upstream-Calls des Warm-ups (Sekunden)
+WARMUP_TIMEOUT = float(os.getenv('WARMUP_TIMEOUT', '20'))
+
+STARTUP_BUCKETS = (0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0)
+startup_duration = registry.histogram(
+    'mealprep_startup_seconds', 'Importzeit (pro Einstiegspunkt) und Warm-up pro Prozess', ('phase', 'module'),
+    buckets=STARTUP_BUCKETS)
+
+_stats = {'imports': {}, 'import_budget': IMPORT_BUDGET, 'warmup': None}
+
+
+# ==========================================
+# IMPORTZEIT
+# ==========================================
+def record_import(module, seconds):
+    """Importzeit eines Einstiegspunkts festhalten; Warnung über IMPORT_BUDGET"""
+    _stats['imports'][module] = round(seconds, 4)
+    startup_duration.observe(seconds, phase='import', module=module)
+    if IMPORT_BUDGET and seconds > IMPORT_BUDGET:
+        print(f"Warning: import of {module} took {seconds:.2f}s (budget {IMPORT_BUDGET:.2f}s)")
+
+
+def measure_import(module, runs=3):
+    """
+    Importzeit in frischen Prozessen per -X importtime (bester von mehreren Läufen)
+    Liefert (Sekunden, [(Sekunden, Modul)] der direkten Imports, teuerste zuerst).
+    """
+    best = None
+    for _ in range(runs):
+        result = subprocess.run(
+            [sys.executable, '-X', 'importtime', '-c', f'import {module}'],
+            capture_output=True, text=True, cwd=os.path.dirname(os.path.abspath(__file__))
+        )
+        if result.returncode != 0:
+            raise RuntimeError(result.stderr.strip().splitlines()[-1])
+
+        total, children = None, []
+        for line in result.stderr.splitlines():
+            if not line.startswith('import time:') or '|' not in line:
+                continue
+            _, cumulative, name = line.split('|')
+            if not cumulative.strip().isdigit():
+                continue
+            seconds = int(cumulative) / 1e6
+            if name.strip() == module and not name.startswith('  '):
+                total = seconds
+            elif name.startswith('   ') and not name.startswith('     '):
+                # Direkte Imports des Moduls (eine Ebene eingerückt)
+                children.append((seconds, name.strip()))
+        if total is not None and (best is None or total < best[0]):
+            best = (total, sorted(children, reverse=True))
+    return best
+
+
+# ==========================================
+# WARM-UP
+# ==========================================
+def _warm_categories():
+    from catalog import get_catalog
+    from upstream import mealdb
+
+    catalog = get_catalog()
+    if catalog and catalog.get_list('categories'):
+        return 'catalog'
+    return len(mealdb.cached_json('categories.php').get('categories') or [])
+
+
+def _warm_facets():
+    from facets import facet_index
+
+    facet_index.ensure_loaded()
+    return facet_index.stats()
+
+
+def _warm_meals(meal_ids):
+    from nutrition import estimate_recipe_nutrition
+    from upstream import lookup_meals
+
+    recipes = lookup_meals(meal_ids)
+    found = [meal for meal in recipes.values() if meal]
+    # Nährwerte landen im Memo der Engine, /api/recipe-nutrition/<id> rechnet nicht mehr
+    for meal in found:
+        estimate_recipe_nutrition(meal)
+    return f'{len(found)}/{len(recipes)}'
+
+
+def _warm_off_store():
+    from offstore import get_off_store
+
+    return 'loaded' if get_off_store() else None
+
+
+def _warm_nutrients():
+    from nutrients import get_engine
+
+    return 'loaded' if get_engine() else None
+
+
+def warm_up(meal_ids=None, timeout=WARMUP_TIMEOUT):
+    """
+    Füllt Caches und lädt Tabellen vor dem ersten Request
+    Fehler einzelner Schritte brechen nicht ab; Ergebnis pro Schritt unter
+    'startup' in /api/cache/stats. Module werden erst hier importiert, damit
+    die gunicorn-Konfiguration ohne Preload nicht schon die App lädt.
+    """
+    meal_ids = WARMUP_MEAL_IDS if meal_ids is None else meal_ids
+    steps = [
+        ('openai', lambda: importlib.import_module('openai') and 'imported'),
+        ('nutrients', _warm_nutrients),
+        ('off_store', _warm_off_store),
+        ('categories', _warm_categories),
+        ('facets', _warm_facets),
+    ]
+    if meal_ids:
+        steps.append(('meals', lambda: _warm_meals(meal_ids)))
+
+    started = time.perf_counter()
+    start_deadline(timeout)
+    results = {}
+    try:
+        for name, step in steps:
+            step_started = time.perf_counter()
+            try:
+                results[name] = {'result': step()}
+            except Exception as e:
+                print(f"Error in warm_up ({name}): {str(e)}")
+                results[name] = {'error': str(e)}
+            results[name]['seconds'] = round(time.perf_counter() - step_started, 4)
+    finally:
+        start_deadline(0)
+
+    seconds = time.perf_counter() - started
+    startup_duration.observe(seconds, phase='warmup')
+    _stats['warmup'] = {'pid': os.getpid(), 'seconds': round(seconds, 4), 'steps': results}
+    print(f"Warm-up finished in {seconds:.2f}s (pid {os.getpid()})")
+    return _stats['warmup']
+
+
+def get_startup_stats():
+    return dict(_stats)
+
+
+# ==========================================
+# GUNICORN-HOOKS
+# ==========================================
+def when_ready(server):
+    """Master: mit preload_app einmal vor dem Forken aufwärmen"""
+    if WARMUP_ENABLED and server.cfg.preload_app:
+        warm_up()
+
+
+def post_worker_init(worker):
+    """Worker: ohne preload_app vor dem ersten Request aufwärmen"""
+    if WARMUP_ENABLED and not worker.cfg.preload_app:
+        warm_up()
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Importzeit der Einstiegspunkte gegen IMPORT_BUDGET prüfen')
+    parser.add_argument('modules', nargs='*', default=['main', 'asgi'])
+    parser.add_argument('--runs', type=int, default=3, help='Frische Prozesse pro Modul (bester Wert zählt)')
+    parser.add_argument('--budget', type=float, default=IMPORT_BUDGET, help='Budget in Sekunden')
+    parser.add_argument('--top', type=int, default=8, help='Teuerste direkte Imports anzeigen')
+    args = parser.parse_args()
+
+    over = False
+    for module in args.modules:
+        seconds, children = measure_import(module, args.runs)
+        status = 'OK' if seconds <= args.budget else 'ÜBER BUDGET'
+        over = over or seconds > args.budget
+        print(f'{module:10} {seconds * 1000:7.1f} ms  (Budget {args.budget * 1000:.0f} ms)  {status}')
+        for child_seconds, name in children[:args.top]:
+            print(f'    {child_seconds * 1000:7.1f} ms  {name}')
+    sys.exit(1 if over else 0)
+
+
+if __name__ == '__main__':
+    main()
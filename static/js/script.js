@@ -94,7 +94,7 @@ async function getRandomRecipe() {
     showLoading();
 
     try {
-        const response = await fetch('/api/random');
+        const response = await fetch('/api/random?compact=1');
         const data = await response.json();
 
         if (data.meals && data.meals.length > 0) {
@@ -10,7 +10,7 @@ document.addEventListener('DOMContentLoaded', function() {
 // ==========================================
 async function generateShoppingList() {
     const container = document.getElementById('shoppingListContainer');
-    const weekPlan = JSON.parse(localStorage.getItem('weekPlan') || '{}');
+    const weekPlan = WeekPlan.local();
 
     // Alle Mahlzeiten sammeln
     const allMeals = [];
@@ -29,82 +29,27 @@ async function generateShoppingList() {
         return;
     }
 
-    // Für jede Mahlzeit: Zutaten abrufen
-    const allIngredients = [];
+    // Zusammengefasste Zutaten liegen am Server bereit (bei jeder Planänderung aktualisiert,
+    // ohne Plan-Store rechnet /api/shopping-list sie aus localStorage)
+    try {
+        const data = await WeekPlan.shoppingList();
 
-    for (const meal of allMeals) {
-        try {
-            const response = await fetch(`/api/recipe/${meal.id}`);
-            const data = await response.json();
-
-            if (data.meals && data.meals.length > 0) {
-                const recipe = data.meals[0];
-
-                // Zutaten extrahieren
-                for (let i = 1; i <= 20; i++) {
-                    const ingredient = recipe[`strIngredient${i}`];
-                    const measure = recipe[`strMeasure${i}`];
-
-                    if (ingredient && ingredient.trim()) {
-                        allIngredients.push({
-                            name: ingredient.trim(),
-                            measure: measure ? measure.trim() : '',
-                            category: categorizeIngredient(ingredient)
-                        });
-                    }
-                }
-            }
-        } catch (error) {
-            console.error('Error fetching recipe:', error);
+        // Nach Kategorien gruppiert (Reihenfolge vom Server)
+        const grouped = {};
+        for (const group of data.categories) {
+            grouped[group.category] = group.items;
         }
-    }
-
-    // Nach Kategorien gruppieren
-    const grouped = groupByCategory(allIngredients);
-
-    // Anzeigen
-    displayShoppingList(grouped);
-}
-
-// ==========================================
-// ZUTAT KATEGORISIEREN
-// ==========================================
-function categorizeIngredient(ingredient) {
-    const lower = ingredient.toLowerCase();
-
-    // Kategorien-Mapping
-    const categories = {
-        '🥩 Fleisch & Fisch': ['chicken', 'beef', 'pork', 'fish', 'salmon', 'tuna', 'turkey', 'lamb', 'meat'],
-        '🥬 Gemüse & Obst': ['tomato', 'onion', 'garlic', 'pepper', 'carrot', 'potato', 'lettuce', 'apple', 'banana', 'lemon'],
-        '🥛 Milchprodukte': ['milk', 'cheese', 'butter', 'cream', 'yogurt', 'egg'],
-        '🌾 Getreide & Backwaren': ['rice', 'pasta', 'bread', 'flour', 'noodles'],
-        '🧂 Gewürze & Öle': ['salt', 'pepper', 'oil', 'sugar', 'spice', 'herb'],
-        '🥫 Konserven': ['tomato paste', 'stock', 'broth']
-    };
 
-    for (const [category, keywords] of Object.entries(categories)) {
-        if (keywords.some(keyword => lower.includes(keyword))) {
-            return category;
-        }
+        // Anzeigen
+        displayShoppingList(grouped);
+    } catch (error) {
+        console.error('Error generating shopping list:', error);
+        container.innerHTML = `
+            <div class="alert alert-danger text-center">
+                Einkaufsliste konnte nicht erstellt werden.
+            </div>
+        `;
     }
-
-    return '📦 Sonstiges';
-}
-
-// ==========================================
-// NACH KATEGORIE GRUPPIEREN
-// ==========================================
-function groupByCategory(ingredients) {
-    const grouped = {};
-
-    ingredients.forEach(item => {
-        if (!grouped[item.category]) {
-            grouped[item.category] = [];
-        }
-        grouped[item.category].push(item);
-    });
-
-    return grouped;
 }
 
 // ==========================================
@@ -171,9 +116,9 @@ function addManualItem() {
 // ==========================================
 // LISTE LÖSCHEN
 // ==========================================
-function clearList() {
+async function clearList() {
     if (confirm('Möchtest du die Einkaufsliste wirklich löschen?')) {
-        localStorage.removeItem('weekPlan');
+        await WeekPlan.clear();
         location.reload();
     }
 }
\ No newline at end of file
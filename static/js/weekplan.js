@@ -0,0 +1,191 @@
+// ==========================================
+// WOCHENPLAN - LOCALSTORAGE + SERVER-STORE
+// ==========================================
+// localStorage ('weekPlan') bleibt das Format im Browser. Der Server hält eine
+// Kopie mit laufend aktualisierten Nährwert-Summen und Einkaufsliste
+// (/api/week-plans/<id>), die ID liegt unter 'weekPlanId'. Schlägt eine
+// Änderung am Server fehl, wird die ID verworfen und der Plan beim nächsten
+// Laden aus localStorage neu importiert. Ist der Store aus oder gestört
+// (503, 429, Netzwerk), rechnen /api/recipe-nutrition/batch und
+// /api/shopping-list wie früher direkt aus localStorage.
+const WeekPlan = {
+    local() {
+        return JSON.parse(localStorage.getItem('weekPlan') || '{}');
+    },
+
+    saveLocal(weekPlan) {
+        localStorage.setItem('weekPlan', JSON.stringify(weekPlan));
+    },
+
+    planId() {
+        return localStorage.getItem('weekPlanId');
+    },
+
+    forget() {
+        localStorage.removeItem('weekPlanId');
+    },
+
+    async request(method, path, body) {
+        const options = { method: method };
+        if (body !== undefined) {
+            options.headers = { 'Content-Type': 'application/json' };
+            options.body = JSON.stringify(body);
+        }
+        const response = await fetch(path, options);
+        const data = await response.json();
+        if (!response.ok || !data.success) {
+            const error = new Error(data.error || `HTTP ${response.status}`);
+            error.status = response.status;
+            throw error;
+        }
+        return data;
+    },
+
+    // Plan anlegen (Import aus localStorage), falls noch keiner existiert
+    async ensure() {
+        if (this.planId()) {
+            return null;
+        }
+        const data = await this.request('POST', '/api/week-plans', { weekPlan: this.local() });
+        localStorage.setItem('weekPlanId', data.plan_id);
+        this.saveLocal(data.weekPlan);
+        return data;
+    },
+
+    // Plan mit Nährwerten und Wochensummen (data.weekPlan, data.week)
+    async load() {
+        try {
+            return await this.loadStored();
+        } catch (error) {
+            console.error('Week plan store unavailable:', error);
+            return await this.batchNutrition();
+        }
+    },
+
+    async loadStored() {
+        const created = await this.ensure();
+        if (created) {
+            return created;
+        }
+        try {
+            const data = await this.request('GET', `/api/week-plans/${this.planId()}`);
+            this.saveLocal(data.weekPlan);
+            return data;
+        } catch (error) {
+            if (error.status !== 404) throw error;
+            // Plan ist abgelaufen -> aus localStorage neu anlegen
+            this.forget();
+            return await this.ensure();
+        }
+    },
+
+    // Ohne Store: Nährwerte und Wochensummen für alle Mahlzeiten in einem Request
+    async batchNutrition() {
+        const weekPlan = this.local();
+        const hasMeals = Object.values(weekPlan).some(meals => meals.length > 0);
+        if (!hasMeals) {
+            return { weekPlan: weekPlan, week: null };
+        }
+        const data = await this.request('POST', '/api/recipe-nutrition/batch', { weekPlan: weekPlan });
+        for (const meals of Object.values(weekPlan)) {
+            for (const meal of meals) {
+                if (!meal.nutrition && data.nutrition[meal.id]) {
+                    meal.nutrition = data.nutrition[meal.id];
+                }
+            }
+        }
+        this.saveLocal(weekPlan);
+        return { weekPlan: weekPlan, week: data.week };
+    },
+
+    // Einkaufsliste (data.categories), ohne Store direkt aus localStorage
+    async shoppingList() {
+        try {
+            return await this.storedShoppingList();
+        } catch (error) {
+            console.error('Week plan store unavailable:', error);
+            return await this.request('POST', '/api/shopping-list', { weekPlan: this.local() });
+        }
+    },
+
+    async storedShoppingList() {
+        await this.ensure();
+        try {
+            return await this.request('GET', `/api/week-plans/${this.planId()}/shopping-list`);
+        } catch (error) {
+            if (error.status !== 404) throw error;
+            this.forget();
+            await this.ensure();
+            return await this.request('GET', `/api/week-plans/${this.planId()}/shopping-list`);
+        }
+    },
+
+    async add(day, meal) {
+        const weekPlan = this.local();
+        if (!weekPlan[day]) {
+            weekPlan[day] = [];
+        }
+        weekPlan[day].push(meal);
+        this.saveLocal(weekPlan);
+
+        const planId = this.planId();
+        if (!planId) return;
+        try {
+            const data = await this.request('POST', `/api/week-plans/${planId}/meals`, { day: day, meal: meal });
+            weekPlan[day][weekPlan[day].length - 1].entry_id = data.entry.entry_id;
+            this.saveLocal(weekPlan);
+        } catch (error) {
+            console.error('Error saving meal:', error);
+            this.forget();
+        }
+    },
+
+    async remove(day, index) {
+        const weekPlan = this.local();
+        const [meal] = weekPlan[day].splice(index, 1);
+        if (weekPlan[day].length === 0) {
+            delete weekPlan[day];
+        }
+        this.saveLocal(weekPlan);
+
+        const planId = this.planId();
+        if (!planId) return;
+        if (!meal || !meal.entry_id) {
+            this.forget();
+            return;
+        }
+        try {
+            await this.request('DELETE', `/api/week-plans/${planId}/meals/${meal.entry_id}`);
+        } catch (error) {
+            console.error('Error removing meal:', error);
+            this.forget();
+        }
+    },
+
+    async replace(weekPlan) {
+        this.saveLocal(weekPlan);
+
+        const planId = this.planId();
+        if (!planId) return;
+        try {
+            const data = await this.request('PUT', `/api/week-plans/${planId}`, { weekPlan: weekPlan });
+            this.saveLocal(data.weekPlan);
+        } catch (error) {
+            console.error('Error saving week plan:', error);
+            this.forget();
+        }
+    },
+
+    async clear() {
+        localStorage.removeItem('weekPlan');
+
+        const planId = this.planId();
+        if (!planId) return;
+        try {
+            await this.request('DELETE', `/api/week-plans/${planId}/meals`);
+        } catch (error) {
+            console.error('Error clearing week plan:', error);
+            this.forget();
+        }
+    }
+};
@@ -0,0 +1,534 @@
+"""
+Upstream-HTTP-Client für TheMealDB und Open Food Facts
+
+Jeder Host bekommt eine eigene requests.Session mit Keep-Alive-Pool,
+damit nicht bei jedem Request ein neuer TCP/TLS-Handshake anfällt.
+Die Session entsteht beim ersten Request im jeweiligen Prozess; geforkte
+Worker (gunicorn mit preload_app) nutzen keine Verbindungen des Masters.
+"""
+import asyncio
+import os
+import sqlite3
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from urllib.parse import urlencode
+
+import requests
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
+
+from barcodes import get_barcode_cache
+from cache import create_cache
+from catalog import get_catalog
+from foodfacts import nutrition_from_response, product_params
+from metrics import bind, observe_upstream
+from offstore import get_off_store
+from resilience import aguard, call_timeout, guard, is_failure_status, remaining
+
+
+# ==========================================
+# KONFIGURATION
+# ==========================================
+THEMEALDB_BASE_URL = os.getenv('THEMEALDB_BASE_URL', 'https://www.themealdb.com/api/json/v1/1').rstrip('/')
+OFF_BASE_URL = os.getenv('OFF_BASE_URL', 'https://world.openfoodfacts.org').rstrip('/')
+
+UPSTREAM_POOL_SIZE = int(os.getenv('UPSTREAM_POOL_SIZE', '20'))
+UPSTREAM_RETRIES = int(os.getenv('UPSTREAM_RETRIES', '2'))
+UPSTREAM_BACKOFF = float(os.getenv('UPSTREAM_BACKOFF', '0.3'))
+
+THEMEALDB_TIMEOUT = float(os.getenv('THEMEALDB_TIMEOUT', '5'))
+OFF_TIMEOUT = float(os.getenv('OFF_TIMEOUT', '5'))
+
+# Max. parallele Lookups beim Auflösen mehrerer Meal-IDs
+UPSTREAM_FANOUT = int(os.getenv('UPSTREAM_FANOUT', '8'))
+
+# Async-Pfad (asgi.py): viel größere Pools, da keine Threads blockiert werden
+ASYNC_POOL_SIZE = int(os.getenv('ASYNC_POOL_SIZE', '200'))
+ASYNC_KEEPALIVE = int(os.getenv('ASYNC_KEEPALIVE', '50'))
+RETRY_STATUSES = (429, 500, 502, 503, 504)
+
+# Cache-TTLs pro TheMealDB-Endpoint in Sekunden (0 = nie cachen)
+CACHE_TTL_LONG = float(os.getenv('CACHE_TTL_LONG', str(6 * 3600)))
+CACHE_TTL_SHORT = float(os.getenv('CACHE_TTL_SHORT', str(10 * 60)))
+
+MEALDB_CACHE_TTLS = {
+    'categories.php': CACHE_TTL_LONG,
+    'lookup.php': CACHE_TTL_LONG,
+    'list.php': CACHE_TTL_LONG,
+    'search.php': CACHE_TTL_SHORT,
+    'filter.php': CACHE_TTL_SHORT,
+    'random.php': 0,
+}
+
+
+def should_retry(status, attempt, retries, backoff):
+    """Wiederholung bei 429/5xx, solange Versuche und Request-Deadline den Backoff zulassen"""
+    if status not in RETRY_STATUSES or attempt >= retries:
+        return False
+    left = remaining()
+    return left is None or left > backoff * (2 ** attempt) + 0.05
+
+
+class UpstreamClient:
+    """Gepoolter HTTP-Client für genau einen Upstream-Host"""
+
+    def __init__(self, base_url, timeout=5, pool_size=UPSTREAM_POOL_SIZE,
+                 retries=UPSTREAM_RETRIES, backoff=UPSTREAM_BACKOFF,
+                 cache=None, cache_ttls=None, name='upstream'):
+        self.base_url = base_url.rstrip('/')
+        self.name = name
+        self.timeout = timeout
+        self.retries = retries
+        self.backoff = backoff
+        self.cache = cache
+        self.cache_ttls = cache_ttls or {}
+        self.pool_size = pool_size
+        self._session = None
+        self._session_pid = None
+        self._session_lock = threading.Lock()
+
+    def _create_session(self):
+        # Der Transport wiederholt nur Verbindungsfehler; 429/5xx wiederholt get()
+        # selbst, damit Lese-Timeouts und Backoff die Request-Deadline einhalten
+        retry = Retry(
+            total=self.retries,
+            connect=self.retries,
+            read=0,
+            status=0,
+            backoff_factor=self.backoff,
+            allowed_methods=frozenset(['GET']),
+            raise_on_status=False,
+        )
+        adapter = HTTPAdapter(
+            pool_connections=1,
+            pool_maxsize=self.pool_size,
+            max_retries=retry,
+        )
+
+        session = requests.Session()
+        session.headers.update({'User-Agent': 'MealPrepHub/1.0'})
+        session.mount('http://', adapter)
+        session.mount('https://', adapter)
+        return session
+
+    @property
+    def session(self):
+        """Session dieses Prozesses (nach fork neu, geerbte Verbindungen bleiben unberührt)"""
+        if self._session_pid != os.getpid():
+            with self._session_lock:
+                if self._session_pid != os.getpid():
+                    self._session = self._create_session()
+                    self._session_pid = os.getpid()
+        return self._session
+
+    def url(self, path):
+        """Baut die vollständige URL zu einem Pfad"""
+        return f"{self.base_url}/{path.lstrip('/')}"
+
+    def get(self, path, params=None, timeout=None):
+        """
+        GET über den Keep-Alive-Pool dieses Hosts (mit Latenz-Metrik)
+        Läuft durch Circuit Breaker und Bulkhead; der Timeout wird durch die
+        Request-Deadline begrenzt. Wirft UpstreamUnavailable, wenn abgelehnt.
+        """
+        requested = timeout or self.timeout
+        timeout, shortened = call_timeout(self.name, requested)
+        with guard(self.name) as outcome:
+            started = time.perf_counter()
+            status = 'error'
+            try:
+                for attempt in range(self.retries + 1):
+                    response = self.session.get(self.url(path), params=params, timeout=timeout)
+                    status = response.status_code
+                    if not should_retry(status, attempt, self.retries, self.backoff):
+                        break
+                    time.sleep(self.backoff * (2 ** attempt))
+                    timeout, shortened = call_timeout(self.name, requested)
+                if is_failure_status(status):
+                    outcome.failed()
+                return response
+            except requests.Timeout:
+                status = 'timeout'
+                if shortened:
+                    outcome.neutral()
+                raise
+            finally:
+                observe_upstream(self.name, path, status, time.perf_counter() - started)
+
+    def get_json(self, path, params=None, timeout=None):
+        """GET mit raise_for_status und JSON-Dekodierung"""
+        response = self.get(path, params=params, timeout=timeout)
+        response.raise_for_status()
+        return response.json()
+
+    def cache_key(self, path, params=None):
+        query = urlencode(sorted((params or {}).items()))
+        return f"{self.base_url}/{path.lstrip('/')}?{query}"
+
+    def cached_json(self, path, params=None, timeout=None):
+        """Wie get_json, aber über den Response-Cache mit TTL pro Endpoint"""
+        ttl = self.cache_ttls.get(path, 0)
+        if self.cache is None or ttl <= 0:
+            return self.get_json(path, params=params, timeout=timeout)
+        return self.cache.get_or_fetch(
+            self.cache_key(path, params),
+            ttl,
+            lambda: self.get_json(path, params=params, timeout=timeout)
+        )
+
+    def close(self):
+        if self._session is not None and self._session_pid == os.getpid():
+            self._session.close()
+        self._session = None
+        self._session_pid = None
+
+
+class AsyncUpstreamClient:
+    """
+    Async-Gegenstück zu UpstreamClient auf Basis von httpx.AsyncClient
+    Muss innerhalb des laufenden Event-Loops erzeugt werden (ASGI-Lifespan).
+    """
+
+    def __init__(self, base_url, timeout=5, pool_size=ASYNC_POOL_SIZE, keepalive=ASYNC_KEEPALIVE,
+                 retries=UPSTREAM_RETRIES, backoff=UPSTREAM_BACKOFF, cache=None, cache_ttls=None,
+                 name='upstream'):
+        self.base_url = base_url.rstrip('/')
+        self.name = name
+        self.timeout = timeout
+        self.retries = retries
+        self.backoff = backoff
+        self.cache = cache
+        self.cache_ttls = cache_ttls or {}
+
+        # httpx erst hier laden: der WSGI-Betrieb braucht es nicht (~60 ms Importzeit)
+        import httpx
+        limits = httpx.Limits(max_connections=pool_size, max_keepalive_connections=keepalive)
+        self.client = httpx.AsyncClient(
+            timeout=timeout,
+            limits=limits,
+            headers={'User-Agent': 'MealPrepHub/1.0'},
+            # Verbindungsfehler wiederholt der Transport selbst
+            transport=httpx.AsyncHTTPTransport(retries=retries, limits=limits),
+        )
+
+    def url(self, path):
+        return f"{self.base_url}/{path.lstrip('/')}"
+
+    async def get(self, path, params=None, timeout=None):
+        """
+        GET mit Wiederholung bei 429/5xx und exponentiellem Backoff (mit Latenz-Metrik)
+        Breaker, Bulkhead und Deadline wie beim synchronen Client; keine
+        Wiederholung, wenn die Deadline den Backoff nicht mehr zulässt.
+        """
+        import httpx
+
+        requested = timeout or self.timeout
+        timeout, shortened = call_timeout(self.name, requested)
+        async with aguard(self.name) as outcome:
+            started = time.perf_counter()
+            status = 'error'
+            try:
+                for attempt in range(self.retries + 1):
+                    response = await self.client.get(self.url(path), params=params, timeout=timeout)
+                    status = response.status_code
+                    if not should_retry(status, attempt, self.retries, self.backoff):
+                        break
+                    await asyncio.sleep(self.backoff * (2 ** attempt))
+                    timeout, shortened = call_timeout(self.name, requested)
+                if is_failure_status(status):
+                    outcome.failed()
+                return response
+            except httpx.TimeoutException:
+                status = 'timeout'
+                if shortened:
+                    outcome.neutral()
+                raise
+            finally:
+                observe_upstream(self.name, path, status, time.perf_counter() - started)
+
+    async def get_json(self, path, params=None, timeout=None):
+        response = await self.get(path, params=params, timeout=timeout)
+        response.raise_for_status()
+        return response.json()
+
+    def cache_key(self, path, params=None):
+        query = urlencode(sorted((params or {}).items()))
+        return f"{self.base_url}/{path.lstrip('/')}?{query}"
+
+    async def cached_json(self, path, params=None, timeout=None):
+        """Teilt sich den Response-Cache mit dem synchronen Client"""
+        ttl = self.cache_ttls.get(path, 0)
+        if self.cache is None or ttl <= 0:
+            return await self.get_json(path, params=params, timeout=timeout)
+        return await self.cache.aget_or_fetch(
+            self.cache_key(path, params),
+            ttl,
+            lambda: self.get_json(path, params=params, timeout=timeout)
+        )
+
+    async def aclose(self):
+        await self.client.aclose()
+
+
+def create_async_clients():
+    """Async-Clients für TheMealDB und OFF (im Event-Loop aufrufen)"""
+    return (
+        AsyncUpstreamClient(THEMEALDB_BASE_URL, timeout=THEMEALDB_TIMEOUT,
+                            cache=mealdb_cache, cache_ttls=MEALDB_CACHE_TTLS, name='mealdb'),
+        AsyncUpstreamClient(OFF_BASE_URL, timeout=OFF_TIMEOUT, name='off'),
+    )
+
+
+# Geteilte Instanzen für alle Routen
+mealdb_cache = create_cache()
+mealdb = UpstreamClient(
+    THEMEALDB_BASE_URL,
+    timeout=THEMEALDB_TIMEOUT,
+    cache=mealdb_cache,
+    cache_ttls=MEALDB_CACHE_TTLS,
+    name='mealdb'
+)
+off = UpstreamClient(OFF_BASE_URL, timeout=OFF_TIMEOUT, name='off')
+
+
+def lookup_meals(meal_ids, max_workers=UPSTREAM_FANOUT):
+    """
+    Löst mehrere Meal-IDs parallel über lookup.php auf (bzw. aus dem Mirror)
+    Doppelte IDs werden nur einmal abgefragt, Fehler ergeben None
+    """
+    unique_ids = list(dict.fromkeys(str(meal_id) for meal_id in meal_ids if meal_id))
+
+    catalog = get_catalog()
+
+    def fetch(meal_id):
+        try:
+            if catalog:
+                meals = catalog.lookup(meal_id).get('meals')
+            else:
+                meals = mealdb.cached_json('lookup.php', params={'i': meal_id}).get('meals')
+            return meals[0] if meals else None
+        except Exception as e:
+            print(f"Error in lookup_meals ({meal_id}): {str(e)}")
+            return None
+
+    if len(unique_ids) <= 1:
+        return {meal_id: fetch(meal_id) for meal_id in unique_ids}
+
+    with ThreadPoolExecutor(max_workers=min(max_workers, len(unique_ids))) as executor:
+        return dict(zip(unique_ids, executor.map(bind(fetch), unique_ids)))
+
+
+def _catalog_meal_list(catalog, path, params):
+    if path == 'search.php':
+        return catalog.search(params.get('s', ''))
+    return catalog.filter(area=params.get('a'), category=params.get('c'), ingredient=params.get('i'))
+
+
+def fetch_meal_lists(queries, max_workers=UPSTREAM_FANOUT):
+    """
+    Führt mehrere search.php/filter.php-Abfragen parallel aus (bzw. im Mirror)
+    queries: [(path, params)]; liefert die 'meals'-Listen in gleicher Reihenfolge,
+    fehlgeschlagene Abfragen ergeben []
+    """
+    catalog = get_catalog()
+
+    def fetch(query):
+        path, params = query
+        try:
+            if catalog:
+                return _catalog_meal_list(catalog, path, params).get('meals') or []
+            return mealdb.cached_json(path, params=params).get('meals') or []
+        except Exception as e:
+            print(f"Error in fetch_meal_lists ({path} {params}): {str(e)}")
+            return []
+
+    queries = list(queries)
+    if len(queries) <= 1:
+        return [fetch(query) for query in queries]
+
+    with ThreadPoolExecutor(max_workers=min(max_workers, len(queries))) as executor:
+        return list(executor.map(bind(fetch), queries))
+
+
+def filter_by_facets(facets):
+    """
+    filter.php für eine oder mehrere Facetten ({'a': ..., 'c': ..., 'i': ...})
+    Mehrere Facetten werden parallel geladen und lokal über die IDs geschnitten.
+    """
+    def fetch(item):
+        kind, value = item
+        if kind == 'i':
+            value = value.replace(' ', '_')
+        return mealdb.cached_json('filter.php', params={kind: value}).get('meals') or []
+
+    items = list(facets.items())
+    if len(items) == 1:
+        return {'meals': fetch(items[0]) or None}
+
+    with ThreadPoolExecutor(max_workers=len(items)) as executor:
+        results = list(executor.map(bind(fetch), items))
+
+    common = set.intersection(*(set(meal['idMeal'] for meal in meals) for meals in results))
+    meals = [meal for meal in results[0] if meal['idMeal'] in common]
+    return {'meals': meals or None}
+
+
+async def alookup_meals(client, meal_ids):
+    """Async-Variante von lookup_meals über einen AsyncUpstreamClient"""
+    unique_ids = list(dict.fromkeys(str(meal_id) for meal_id in meal_ids if meal_id))
+    catalog = get_catalog()
+
+    async def fetch(meal_id):
+        try:
+            if catalog:
+                meals = catalog.lookup(meal_id).get('meals')
+            else:
+                meals = (await client.cached_json('lookup.php', params={'i': meal_id})).get('meals')
+            return meals[0] if meals else None
+        except Exception as e:
+            print(f"Error in alookup_meals ({meal_id}): {str(e)}")
+            return None
+
+    results = await asyncio.gather(*(fetch(meal_id) for meal_id in unique_ids))
+    return dict(zip(unique_ids, results))
+
+
+async def afetch_meal_lists(client, queries):
+    """Async-Variante von fetch_meal_lists"""
+    catalog = get_catalog()
+
+    async def fetch(path, params):
+        try:
+            if catalog:
+                return _catalog_meal_list(catalog, path, params).get('meals') or []
+            return (await client.cached_json(path, params=params)).get('meals') or []
+        except Exception as e:
+            print(f"Error in afetch_meal_lists ({path} {params}): {str(e)}")
+            return []
+
+    return list(await asyncio.gather(*(fetch(path, params) for path, params in queries)))
+
+
+def _cached_products(barcodes):
+    """Teilt Barcodes in bekannte (Offline-Store, Cache) und noch zu ladende auf"""
+    found = {}
+    store = get_off_store()
+    if store:
+        for barcode in barcodes:
+            nutrition = store.lookup(barcode)
+            if nutrition is not None:
+                found[barcode] = nutrition
+
+    cache = get_barcode_cache()
+    missing = [barcode for barcode in barcodes if barcode not in found]
+    if cache and missing:
+        try:
+            found.update(cache.get_many(missing))
+        except sqlite3.Error as e:
+            print(f"Error in barcode cache get: {str(e)}")
+    return found, [barcode for barcode in barcodes if barcode not in found]
+
+
+def _store_products(fetched):
+    cache = get_barcode_cache()
+    if cache and fetched:
+        try:
+            cache.set_many(fetched)
+        except sqlite3.Error as e:
+            print(f"Error in barcode cache set: {str(e)}")
+
+
+def _finish_products(found, results):
+    """
+    Übernimmt die OFF-Ergebnisse [(barcode, nutrition, Fehler)] in found
+    Fehlgeschlagene Barcodes werden, wenn möglich, aus abgelaufenen Cache-Einträgen bedient.
+    """
+    fetched, errors = {}, {}
+    for barcode, nutrition, error in results:
+        if error is not None:
+            errors[barcode] = error
+        else:
+            fetched[barcode] = nutrition
+    _store_products(fetched)
+    found.update(fetched)
+
+    cache = get_barcode_cache()
+    if cache and errors:
+        try:
+            stale = cache.get_many(list(errors), stale=True)
+        except sqlite3.Error as e:
+            print(f"Error in barcode cache get: {str(e)}")
+            stale = {}
+        found.update(stale)
+        errors = {barcode: error for barcode, error in errors.items() if barcode not in stale}
+    return found, errors
+
+
+def fetch_product(barcode):
+    """Projizierte Nährwerte eines Barcodes von OFF, None wenn unbekannt"""
+    response = off.get(f'api/v2/product/{barcode}', params=product_params())
+    return nutrition_from_response(response)
+
+
+def lookup_products(barcodes, max_workers=UPSTREAM_FANOUT):
+    """
+    Nährwerte für mehrere (normalisierte) Barcodes: erst Barcode-Cache, dann OFF parallel
+    Liefert ({barcode: nutrition oder None = nicht gefunden}, {barcode: Exception}).
+    Fehlgeschlagene Abfragen werden nicht gecacht, aber falls vorhanden mit
+    abgelaufenen Cache-Einträgen beantwortet (z.B. bei offenem Circuit Breaker).
+    """
+    unique = list(dict.fromkeys(barcodes))
+    found, missing = _cached_products(unique)
+
+    def fetch(barcode):
+        try:
+            return barcode, fetch_product(barcode), None
+        except Exception as e:
+            print(f"Error in lookup_products ({barcode}): {str(e)}")
+            return barcode, None, e
+
+    if len(missing) <= 1:
+        results = [fetch(barcode) for barcode in missing]
+    else:
+        with ThreadPoolExecutor(max_workers=min(max_workers, len(missing))) as executor:
+            results = list(executor.map(bind(fetch), missing))
+
+    return _finish_products(found, results)
+
+
+async def afetch_product(client, barcode):
+    """Async-Variante von fetch_product"""
+    response = await client.get(f'api/v2/product/{barcode}', params=product_params())
+    return nutrition_from_response(response)
+
+
+async def alookup_products(client, barcodes):
+    """Async-Variante von lookup_products"""
+    unique = list(dict.fromkeys(barcodes))
+    found, missing = _cached_products(unique)
+
+    async def fetch(barcode):
+        try:
+            return barcode, await afetch_product(client, barcode), None
+        except Exception as e:
+            print(f"Error in alookup_products ({barcode}): {str(e)}")
+            return barcode, None, e
+
+    return _finish_products(found, await asyncio.gather(*(fetch(barcode) for barcode in missing)))
+
+
+async def afilter_by_facets(client, facets):
+    """Async-Variante von filter_by_facets"""
+    async def fetch(kind, value):
+        if kind == 'i':
+            value = value.replace(' ', '_')
+        return (await client.cached_json('filter.php', params={kind: value})).get('meals') or []
+
+    results = await asyncio.gather(*(fetch(kind, value) for kind, value in facets.items()))
+    if len(results) == 1:
+        return {'meals': results[0] or None}
+
+    common = set.intersection(*(set(meal['idMeal'] for meal in meals) for meals in results))
+    meals = [meal for meal in results[0] if meal['idMeal'] in common]
+    return {'meals': meals or None}
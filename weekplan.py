@@ -0,0 +1,170 @@
+"""
+Wochenplan-Hilfsfunktionen für Einkaufsliste, Nährwert-Batch und Plan-Store
+
+Arbeitet auf dem localStorage-Format: {"monday": [{"id": ..., "nutrition": ...}], ...}
+"""
+import os
+
+from ingredients import IngredientAggregator, ingredient_contribution
+from nutrition import MACROS, WEEK_DAYS, estimate_recipes_nutrition, summarize_week
+
+
+# ==========================================
+# KONFIGURATION
+# ==========================================
+# Nachzuladende Rezepte pro /api/recipe-nutrition/batch-Request
+RECIPE_BATCH_LIMIT = int(os.getenv('RECIPE_BATCH_LIMIT', '100'))
+
+
+def iter_plan_meals(week_plan):
+    """Liefert alle gültigen (day, meal)-Einträge eines Wochenplans"""
+    if not isinstance(week_plan, dict):
+        return
+    for day, meals in week_plan.items():
+        if not isinstance(meals, list):
+            continue
+        for meal in meals:
+            if not isinstance(meal, dict):
+                continue
+            meal_id = str(meal.get('id', ''))
+            if meal_id and meal_id != 'unknown':
+                yield day, meal
+
+
+def count_plan_meals(week_plan):
+    """Wie oft kommt jedes Rezept in der Woche vor?"""
+    meal_counts = {}
+    for _, meal in iter_plan_meals(week_plan):
+        meal_id = str(meal['id'])
+        meal_counts[meal_id] = meal_counts.get(meal_id, 0) + 1
+    return meal_counts
+
+
+def split_known_nutrition(week_plan, meal_ids=()):
+    """
+    Trennt bereits bekannte Nährwerte (aus dem weekPlan) von nachzuladenden IDs
+    Liefert (to_fetch, nutrition_by_id); Nährwerte, die kein Makro-Dict sind,
+    zählen als unbekannt.
+    """
+    meal_ids = [str(meal_id) for meal_id in meal_ids]
+    nutrition_by_id = {}
+    for _, meal in iter_plan_meals(week_plan):
+        meal_id = str(meal['id'])
+        nutrition = _clean_nutrition(meal.get('nutrition'))
+        if nutrition is not None:
+            nutrition_by_id[meal_id] = nutrition
+        else:
+            meal_ids.append(meal_id)
+
+    to_fetch = [meal_id for meal_id in dict.fromkeys(meal_ids) if meal_id not in nutrition_by_id]
+    return to_fetch, nutrition_by_id
+
+
+def shopping_list_result(meal_counts, recipes):
+    """Antwort für /api/shopping-list aus den geladenen Rezepten"""
+    aggregator = IngredientAggregator()
+    missing = []
+    for meal_id, times in meal_counts.items():
+        recipe = recipes.get(meal_id)
+        if recipe:
+            aggregator.add_meal(recipe, times)
+        else:
+            missing.append(meal_id)
+
+    grouped = aggregator.grouped()
+
+    return {
+        'success': True,
+        'categories': [
+            {'category': category, 'items': items}
+            for category, items in grouped.items()
+        ],
+        'total_items': sum(len(items) for items in grouped.values()),
+        'meal_count': sum(meal_counts.values()),
+        'missing_meals': missing
+    }
+
+
+def nutrition_batch_result(week_plan, to_fetch, nutrition_by_id, recipes):
+    """Antwort für /api/recipe-nutrition/batch aus den geladenen Rezepten"""
+    meals = {}
+    missing = []
+    # Alle Rezepte in einem vektorisierten Durchgang
+    computed = estimate_recipes_nutrition(recipes.get(meal_id) for meal_id in to_fetch)
+    for meal_id in to_fetch:
+        if meal_id in computed:
+            meals[meal_id] = computed[meal_id]
+            nutrition_by_id[meal_id] = meals[meal_id]['nutrition']
+        else:
+            missing.append(meal_id)
+
+    return {
+        'success': True,
+        'nutrition': nutrition_by_id,
+        'meals': meals,
+        'missing_meals': missing,
+        **summarize_week(week_plan, nutrition_by_id)
+    }
+
+
+# ==========================================
+# PLAN-STORE (SERVERSEITIGER WOCHENPLAN)
+# ==========================================
+def read_plan_days(week_plan):
+    """Gültige Tage eines Wochenplans im localStorage-Format: [(day, [meal, ...])]"""
+    if not isinstance(week_plan, dict):
+        return []
+    return [
+        (day, [meal for meal in week_plan.get(day) or [] if isinstance(meal, dict)])
+        for day in WEEK_DAYS if isinstance(week_plan.get(day), list)
+    ]
+
+
+def plan_meal_id(meal):
+    """Meal-ID eines Eintrags, None für KI-Einträge ohne Rezept ('unknown')"""
+    meal_id = str(meal.get('id', '') or '')
+    return meal_id if meal_id and meal_id != 'unknown' else None
+
+
+def _clean_nutrition(nutrition):
+    """Nur die Makros, als Zahlen; None, wenn keine Nährwerte mitgeschickt wurden"""
+    if not isinstance(nutrition, dict) or not nutrition:
+        return None
+    try:
+        values = {macro: float(nutrition.get(macro) or 0) for macro in MACROS}
+    except (TypeError, ValueError):
+        return None
+    return {macro: int(value) if value.is_integer() else value for macro, value in values.items()}
+
+
+def prepare_plan_meals(meals, recipes):
+    """
+    Bereitet Einträge (localStorage-Format) für den Plan-Store vor
+    Fehlende Nährwerte kommen aus den Rezepten (ein vektorisierter Durchgang),
+    dazu der Zutaten-Beitrag jeder Mahlzeit für die Einkaufsliste.
+    recipes: {meal_id: TheMealDB-Meal oder None}, z.B. aus lookup_meals
+    """
+    to_compute = [
+        plan_meal_id(meal) for meal in meals
+        if plan_meal_id(meal) and _clean_nutrition(meal.get('nutrition')) is None
+    ]
+    computed = estimate_recipes_nutrition(recipes.get(meal_id) for meal_id in dict.fromkeys(to_compute))
+
+    prepared = []
+    for meal in meals:
+        meal_id = plan_meal_id(meal)
+        recipe = recipes.get(meal_id) if meal_id else None
+        nutrition = _clean_nutrition(meal.get('nutrition'))
+        if nutrition is None and meal_id in computed:
+            nutrition = _clean_nutrition(computed[meal_id]['nutrition'])
+        prepared.append({
+            'meal_id': meal_id or 'unknown',
+            'name': str(meal.get('name') or (recipe or {}).get('strMeal') or ''),
+            'thumb': str(meal.get('thumb') or (recipe or {}).get('strMealThumb') or ''),
+            'category': str(meal.get('category') or (recipe or {}).get('strCategory') or ''),
+            'nutrition': nutrition,
+            'ingredients': ingredient_contribution(recipe) if recipe else None,
+            'counted': meal_id is not None,
+            'missing': meal_id is not None and recipe is None,
+        })
+    return prepared